@@ -0,0 +1,229 @@
+import argparse
+import os
+import random
+import sys
+
+import numpy as np
+
+# Writes the benchmark corpora in Benchmarks/corpora, in the formats read by Puzzles.PuzzleReader
+# Run from anywhere: python Benchmarks/generate.py [--count N] [--seed S]
+#
+# Every puzzle starts from a random solution, so all of them can be solved
+# Sudoku puzzles are thinned out while Dancing Links still finds exactly one solution,
+# for the other types the tiers only change how much is given away (givens, relations, cage sizes)
+
+ROOT = os.path.dirname( os.path.dirname( os.path.abspath(__file__) ) )
+sys.path.insert( 0, ROOT )
+
+from Puzzles.Sudoku import Sudoku
+from suite import CORPORA, CORPUS_DIR
+
+DIGITS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+##### SOLUTIONS #######################################
+
+# Random Sudoku solution, by shuffling the rows, columns and digits of a pattern that follows the rules
+def sudoku_solution(rng, dim, subgrid_shape):
+    rows, columns = subgrid_shape
+    pattern = lambda r, c : ( columns * ( r % rows ) + int( r / rows ) + c ) % dim
+
+    # Rows can move within their band and bands can move, likewise for columns and stacks
+    row_order = [ band*rows + r for band in rng.sample( range(columns), columns ) for r in rng.sample( range(rows), rows ) ]
+    col_order = [ stack*columns + c for stack in rng.sample( range(rows), rows ) for c in rng.sample( range(columns), columns ) ]
+    digits = rng.sample( range(1, dim+1), dim )
+
+    return np.array( [ [ digits[ pattern(r, c) ] for c in col_order ] for r in row_order ] )
+
+# Random Latin square, for the puzzle types without subgrids
+def latin_solution(rng, dim):
+    row_order = rng.sample( range(dim), dim )
+    col_order = rng.sample( range(dim), dim )
+    digits = rng.sample( range(1, dim+1), dim )
+
+    return np.array( [ [ digits[ ( r + c ) % dim ] for c in col_order ] for r in row_order ] )
+
+##### PUZZLES #######################################
+
+# Remove givens in random order, keeping a removal only if the puzzle stays unique,
+# until the number of givens drops to the target
+def sudoku_puzzle(rng, solution, subgrid_shape, givens):
+    dim = len(solution)
+    grid = solution.copy()
+    cells = [ (x,y) for y in range(dim) for x in range(dim) ]
+    rng.shuffle( cells )
+
+    puzzle = Sudoku( dim, subgrid_shape=subgrid_shape )
+    for x,y in cells:
+        if np.count_nonzero( grid ) <= givens:
+            break
+
+        grid[y,x] = 0
+        puzzle.load_grid( grid )
+        if puzzle.count_exact_cover( limit=2 ) != 1:
+            grid[y,x] = solution[y,x]
+
+    return grid
+
+def random_givens(rng, solution, fraction):
+    dim = len(solution)
+    grid = np.zeros( (dim, dim) ).astype(int)
+    for x,y in rng.sample( [ (x,y) for y in range(dim) for x in range(dim) ], int( fraction * dim * dim ) ):
+        grid[y,x] = solution[y,x]
+    return grid
+
+# Symbol for every pair of neighbours, rows laid out as in RelationalSudoku.load_relations
+def relation_rows(solution, symbol):
+    dim = len(solution)
+    rows = []
+    for j in range( 2*dim - 1 ):
+        y = int( j/2 )
+        if j % 2 == 0:
+            rows.append( [ symbol( solution[y,i], solution[y,i+1], True ) for i in range(dim-1) ] )
+        else:
+            rows.append( [ symbol( solution[y,i], solution[y+1,i], False ) for i in range(dim) ] )
+    return rows
+
+def kropki_symbol(a, b, across):
+    if a == 2*b or b == 2*a:
+        return "B"
+    elif abs( a - b ) == 1:
+        return "W"
+    return "."
+
+def futoshiki_symbol(rng, fraction):
+    def symbol(a, b, across):
+        if rng.random() >= fraction:
+            return ""
+        if across:
+            return ">" if a > b else "<"
+        return "v" if a > b else "^"
+    return symbol
+
+# Split the grid into cages of at most max_size cells by growing each one from a random free cell
+# With distinct set a cage never takes a second cell holding the same value (Killer Sudoku),
+# otherwise a value can repeat as long as it is in another row and column (KenKen)
+def random_cages(rng, solution, max_size, distinct):
+    dim = len(solution)
+    cage_of = -np.ones( (dim, dim) ).astype(int)
+    cages = []
+
+    for y in range(dim):
+        for x in range(dim):
+            if cage_of[y,x] >= 0:
+                continue
+
+            cage = [ (x,y) ]
+            cage_of[y,x] = len(cages)
+            size = rng.randint( 1, max_size )
+            while len(cage) < size:
+                neighbours = [ (i,j) for cx,cy in cage for i,j in [ (cx+1,cy), (cx-1,cy), (cx,cy+1), (cx,cy-1) ]
+                               if 0 <= i < dim and 0 <= j < dim and cage_of[j,i] < 0 ]
+                if distinct:
+                    neighbours = [ (i,j) for i,j in neighbours if not solution[j,i] in [ solution[cy,cx] for cx,cy in cage ] ]
+                if len(neighbours) == 0:
+                    break
+                i,j = rng.choice( neighbours )
+                cage_of[j,i] = len(cages)
+                cage.append( (i,j) )
+
+            cages.append( cage )
+
+    return cage_of, cages
+
+# KenKen.parse_blobs reads a cage's cells in row order and applies its operation in that order,
+# so subtraction and division are only used on pairs whose first cell holds the larger value
+def kenken_operation(rng, values):
+    if len(values) == 1:
+        return values[0], "+"
+    if len(values) == 2 and values[0] > values[1]:
+        if values[0] % values[1] == 0 and rng.random() < 0.5:
+            return int( values[0] / values[1] ), "/"
+        return values[0] - values[1], "-"
+
+    if rng.random() < 0.5 and np.prod( values ) <= 1000:
+        return int( np.prod( values ) ), "*"
+    return int( np.sum( values ) ), "+"
+
+# KenKen cages get an operation, Killer Sudoku cages only their sum
+def blob_rows(rng, solution, max_size, with_operation):
+    dim = len(solution)
+    cage_of, cages = random_cages( rng, solution, max_size, not with_operation )
+    labels = []
+
+    for cage in cages:
+        values = [ int( solution[y,x] ) for x,y in sorted( cage, key=lambda c : ( c[1], c[0] ) ) ]
+        if with_operation:
+            total, operation = kenken_operation( rng, values )
+            labels.append( "{}:{}:{}".format( len(labels), total, operation ) )
+        else:
+            labels.append( "{}:{}".format( len(labels), sum(values) ) )
+
+    return [ [ labels[ cage_of[y,x] ] for x in range(dim) ] for y in range(dim) ]
+
+##### WRITING #######################################
+
+def line(grid):
+    return "".join( DIGITS[v] for v in grid.flatten() )
+
+def record(sections):
+    lines = []
+    for name, rows in sections:
+        lines.append( name )
+        lines.extend( ",".join( str(cell) for cell in row ) for row in rows )
+    return "\n".join( lines )
+
+# One puzzle of the corpus, as the text written to its file
+def make_puzzle(rng, corpus):
+    kind = corpus["type"]
+    dim = corpus["dimension"]
+    params = corpus["generate"]
+    subgrid_shape = corpus["options"].get( "subgrid_shape" )
+
+    if kind == "Sudoku":
+        solution = sudoku_solution( rng, dim, subgrid_shape )
+        return line( sudoku_puzzle( rng, solution, subgrid_shape, int( params["givens"] * dim * dim ) ) )
+
+    if kind == "Killer Sudoku":
+        solution = sudoku_solution( rng, dim, subgrid_shape )
+    else:
+        solution = latin_solution( rng, dim )
+    givens = random_givens( rng, solution, params.get( "givens", 0 ) )
+
+    # Puzzles without givens leave out the grid
+    sections = []
+    if np.any( givens > 0 ):
+        sections.append( ( "grid", givens ) )
+
+    if kind == "Kropki":
+        relations = relation_rows( solution, kropki_symbol )
+        return record( sections + [ ( "relations", relations ) ] )
+    if kind == "Futoshiki":
+        relations = relation_rows( solution, futoshiki_symbol( rng, params["relations"] ) )
+        return record( sections + [ ( "relations", relations ) ] )
+    if kind == "KenKen":
+        return record( sections + [ ( "blobs", blob_rows( rng, solution, params["cage_size"], True ) ) ] )
+    if kind == "Killer Sudoku":
+        return record( sections + [ ( "blobs", blob_rows( rng, solution, params["cage_size"], False ) ) ] )
+
+    raise ValueError( "{} not supported".format(kind) )
+
+def main():
+    parser = argparse.ArgumentParser( description="Write the benchmark corpora" )
+    parser.add_argument( "--count", type=int, default=None, help="Puzzles per corpus, instead of the count listed for it" )
+    parser.add_argument( "--seed", type=int, default=0 )
+    args = parser.parse_args()
+
+    os.makedirs( CORPUS_DIR, exist_ok=True )
+    for index, corpus in enumerate(CORPORA):
+        rng = random.Random( args.seed * 1000 + index )
+        count = args.count if not args.count is None else corpus["count"]
+        separator = "\n" if corpus["type"] == "Sudoku" else "\n\n"
+
+        puzzles = [ make_puzzle( rng, corpus ) for i in range(count) ]
+        with open( os.path.join( CORPUS_DIR, corpus["file"] ), "w" ) as f:
+            f.write( "# {} {}x{} {}, seed {}\n".format( corpus["type"], corpus["dimension"], corpus["dimension"], corpus["tier"], args.seed ) )
+            f.write( separator.join( puzzles ) + "\n" )
+        print( "{:<32} {} puzzles".format( corpus["file"], count ) )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+# Import time of the puzzle modules in a fresh interpreter, checked against a budget
+# Run from anywhere: python Benchmarks/startup.py [--budget-ms N] [--json]
+#
+# The time measured is what importing Puzzles.* adds on top of importing numpy,
+# the one dependency the solvers need, so the budget doesn't depend on how slow numpy is to load on the machine
+# Importing the solvers must not pull in pandas (only needed for the CSV helpers) or setuptools
+# Compiling the sources is a one-off cost of an install, so bytecode is cached in a temporary directory
+# (even where PYTHONDONTWRITEBYTECODE is set) and every module is imported once before anything is timed
+
+ROOT = os.path.dirname( os.path.dirname( os.path.abspath(__file__) ) )
+
+# Every module of the package, apart from the tests and editor scratch files
+SKIPPED = [ "__init__", "test", "tempCodeRunnerFile" ]
+MODULES = sorted( "Puzzles.{}".format( name[:-3] ) for name in os.listdir( os.path.join( ROOT, "Puzzles" ) )
+                  if name.endswith(".py") and not name[:-3] in SKIPPED )
+
+FORBIDDEN = [ "pandas", "setuptools" ]
+
+BUDGET_MS = 20
+
+# Time an import statement in a new interpreter, returning seconds and the modules it loaded
+def time_import(statement, env=None):
+    code = "import sys, time\n" \
+           "import numpy\n" \
+           "start = time.perf_counter()\n" \
+           "{}\n" \
+           "print( time.perf_counter() - start )\n" \
+           "print( ','.join( sys.modules ) )".format( statement )
+    output = subprocess.run( [ sys.executable, "-c", code ], cwd=ROOT, env=env, capture_output=True, text=True, check=True ).stdout
+    seconds, modules = output.strip().split("\n")
+    return float(seconds), set( modules.split(",") )
+
+def median(values):
+    values = sorted(values)
+    return values[ int( len(values) / 2 ) ]
+
+def run(repeats):
+    with tempfile.TemporaryDirectory() as cache:
+        env = dict( os.environ )
+        env.pop( "PYTHONDONTWRITEBYTECODE", None )
+        env["PYTHONPYCACHEPREFIX"] = cache
+        return run_imports( repeats, env )
+
+def run_imports(repeats, env):
+    results = { "modules" : {}, "forbidden_loaded" : [] }
+    import_all = "\n".join( "import {}".format(module) for module in MODULES )
+    time_import( import_all, env )
+
+    for module in MODULES:
+        times = []
+        for i in range(repeats):
+            seconds, loaded = time_import( "import {}".format(module), env )
+            times.append( seconds )
+        results["modules"][module] = median(times) * 1000
+
+        for name in FORBIDDEN:
+            if name in loaded and not name in results["forbidden_loaded"]:
+                results["forbidden_loaded"].append( name )
+
+    times = [ time_import( import_all, env )[0] for i in range(repeats) ]
+    results["all_ms"] = median(times) * 1000
+    return results
+
+def main():
+    parser = argparse.ArgumentParser( description="Check the import time of the puzzle modules" )
+    parser.add_argument( "--budget-ms", type=float, default=BUDGET_MS, help="Allowed time to import every puzzle module, on top of numpy" )
+    parser.add_argument( "--repeats", type=int, default=5 )
+    parser.add_argument( "--json", action="store_true", help="Print the results as JSON" )
+    args = parser.parse_args()
+
+    results = run( args.repeats )
+    results["budget_ms"] = args.budget_ms
+    results["passed"] = results["all_ms"] <= args.budget_ms and len( results["forbidden_loaded"] ) == 0
+
+    if args.json:
+        print( json.dumps( results, indent=2 ) )
+    else:
+        for module in results["modules"]:
+            print( "{:<28} {:8.1f} ms".format( module, results["modules"][module] ) )
+        print( "{:<28} {:8.1f} ms (budget {:.0f} ms)".format( "all", results["all_ms"], args.budget_ms ) )
+        if len( results["forbidden_loaded"] ) > 0:
+            print( "Loaded at import: {}".format( ", ".join( results["forbidden_loaded"] ) ) )
+        print( "PASS" if results["passed"] else "FAIL" )
+
+    return 0 if results["passed"] else 1
+
+if __name__ == "__main__":
+    sys.exit( main() )
@@ -0,0 +1,182 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+# Solver benchmark over the corpora in Benchmarks/corpora, one row per puzzle type, size and tier
+# Run from anywhere: python Benchmarks/suite.py [--type T] [--tier T] [--limit N] [--output results.json] [--compare old.json]
+#
+# Each puzzle is solved in this process with BatchSolver.solve_puzzle (build, load, reduce, then search),
+# the same work a batch worker does for it
+# Reported per corpus: puzzles/sec, p50/p99 latency, peak traced memory of a single solve and solve rate
+# The corpora are written by Benchmarks/generate.py
+
+ROOT = os.path.dirname( os.path.dirname( os.path.abspath(__file__) ) )
+sys.path.insert( 0, ROOT )
+
+CORPUS_DIR = os.path.join( os.path.dirname( os.path.abspath(__file__) ), "corpora" )
+
+# "generate" holds the parameters used by generate.py for the tier:
+#   givens              -> Fraction of cells given (Sudoku keeps removing while the solution stays unique)
+#   relations           -> Fraction of neighbouring pairs given an inequality (Futoshiki)
+#   cage_size           -> Largest cage (KenKen, Killer Sudoku)
+CORPORA = [
+    { "type" : "Sudoku", "dimension" : 4, "tier" : "easy", "options" : { "subgrid_shape" : (2,2) }, "generate" : { "givens" : 0.5 } },
+    { "type" : "Sudoku", "dimension" : 4, "tier" : "hard", "options" : { "subgrid_shape" : (2,2) }, "generate" : { "givens" : 0 } },
+    { "type" : "Sudoku", "dimension" : 6, "tier" : "easy", "options" : { "subgrid_shape" : (2,3) }, "generate" : { "givens" : 0.5 } },
+    { "type" : "Sudoku", "dimension" : 6, "tier" : "hard", "options" : { "subgrid_shape" : (2,3) }, "generate" : { "givens" : 0 } },
+    { "type" : "Sudoku", "dimension" : 9, "tier" : "easy", "options" : { "subgrid_shape" : (3,3) }, "generate" : { "givens" : 0.5 } },
+    { "type" : "Sudoku", "dimension" : 9, "tier" : "medium", "options" : { "subgrid_shape" : (3,3) }, "generate" : { "givens" : 0.38 } },
+    { "type" : "Sudoku", "dimension" : 9, "tier" : "hard", "options" : { "subgrid_shape" : (3,3) }, "generate" : { "givens" : 0 } },
+    { "type" : "Sudoku", "dimension" : 16, "tier" : "easy", "options" : { "subgrid_shape" : (4,4) }, "generate" : { "givens" : 0.6 } },
+    { "type" : "Sudoku", "dimension" : 16, "tier" : "hard", "options" : { "subgrid_shape" : (4,4) }, "generate" : { "givens" : 0.45 } },
+    { "type" : "Kropki", "dimension" : 6, "tier" : "easy", "options" : {}, "generate" : { "givens" : 0.2 } },
+    { "type" : "Kropki", "dimension" : 6, "tier" : "hard", "options" : {}, "generate" : { "givens" : 0 } },
+    { "type" : "Kropki", "dimension" : 9, "tier" : "medium", "options" : {}, "generate" : { "givens" : 0.1 } },
+    { "type" : "Futoshiki", "dimension" : 5, "tier" : "easy", "options" : {}, "generate" : { "givens" : 0.2, "relations" : 0.5 } },
+    { "type" : "Futoshiki", "dimension" : 5, "tier" : "hard", "options" : {}, "generate" : { "givens" : 0.05, "relations" : 0.35 } },
+    { "type" : "Futoshiki", "dimension" : 7, "tier" : "medium", "options" : {}, "generate" : { "givens" : 0.1, "relations" : 0.4 } },
+    { "type" : "KenKen", "dimension" : 4, "tier" : "easy", "options" : { "subgrid_shape" : None }, "generate" : { "cage_size" : 2 } },
+    { "type" : "KenKen", "dimension" : 6, "tier" : "medium", "options" : { "subgrid_shape" : None }, "generate" : { "cage_size" : 3 } },
+    { "type" : "KenKen", "dimension" : 6, "tier" : "hard", "options" : { "subgrid_shape" : None }, "generate" : { "cage_size" : 4 } },
+    { "type" : "Killer Sudoku", "dimension" : 6, "tier" : "easy", "options" : { "subgrid_shape" : (2,3) }, "generate" : { "givens" : 0.1, "cage_size" : 3 } },
+    { "type" : "Killer Sudoku", "dimension" : 9, "tier" : "medium", "options" : { "subgrid_shape" : (3,3) }, "generate" : { "cage_size" : 3 } },
+    { "type" : "Killer Sudoku", "dimension" : 9, "tier" : "hard", "options" : { "subgrid_shape" : (3,3) }, "generate" : { "cage_size" : 4 } },
+]
+
+for corpus in CORPORA:
+    corpus["file"] = "{}_{}x{}_{}.txt".format( corpus["type"].lower().replace( " ", "_" ), corpus["dimension"], corpus["dimension"], corpus["tier"] )
+    corpus["count"] = 20 if corpus["dimension"] < 16 else 5
+
+##### MEASURING #######################################
+
+# Nearest rank percentile, so p99 of a small corpus is its slowest puzzle
+def percentile(values, p):
+    values = sorted(values)
+    rank = int( np.ceil( p / 100 * len(values) ) )
+    return values[ max( rank - 1, 0 ) ]
+
+def run_corpus(corpus, limit=None, search=True, memory=True):
+    from Puzzles.BatchSolver import solve_puzzle
+    from Puzzles.PuzzleReader import PuzzleReader
+
+    puzzles = list( PuzzleReader( os.path.join( CORPUS_DIR, corpus["file"] ) ) )
+    if not limit is None:
+        puzzles = puzzles[:limit]
+
+    latencies = []
+    solved = 0
+    errors = []
+    for spec in puzzles:
+        start = time.perf_counter()
+        result = solve_puzzle( corpus["type"], corpus["options"], search, spec )
+        latencies.append( time.perf_counter() - start )
+
+        solved += int( result["solved"] )
+        if not result["error"] is None:
+            errors.append( result["error"] )
+
+    # Tracing slows the solver down, so memory is measured on a separate pass
+    peak = None
+    if memory:
+        peak = 0
+        for spec in puzzles:
+            tracemalloc.start()
+            solve_puzzle( corpus["type"], corpus["options"], search, spec )
+            peak = max( peak, tracemalloc.get_traced_memory()[1] )
+            tracemalloc.stop()
+
+    total = sum( latencies )
+    return {
+        "type" : corpus["type"],
+        "dimension" : corpus["dimension"],
+        "tier" : corpus["tier"],
+        "puzzles" : len(puzzles),
+        "solved" : solved,
+        "solve_rate" : solved / len(puzzles) if len(puzzles) > 0 else None,
+        "puzzles_per_sec" : len(puzzles) / total if total > 0 else None,
+        "p50_ms" : percentile( latencies, 50 ) * 1000 if len(puzzles) > 0 else None,
+        "p99_ms" : percentile( latencies, 99 ) * 1000 if len(puzzles) > 0 else None,
+        "peak_memory_kb" : peak / 1024 if not peak is None else None,
+        "errors" : sorted( set( errors ) ),
+    }
+
+def get_commit():
+    try:
+        return subprocess.run( [ "git", "rev-parse", "--short", "HEAD" ], cwd=ROOT, capture_output=True, text=True, check=True ).stdout.strip()
+    except Exception:
+        return None
+
+def key(result):
+    return ( result["type"], result["dimension"], result["tier"] )
+
+##### REPORTING #######################################
+
+def print_results(results, baseline=None):
+    previous = {}
+    if not baseline is None:
+        previous = { key(result) : result for result in baseline["results"] }
+
+    print( "{:<14} {:>5} {:<7} {:>7} {:>10} {:>10} {:>10} {:>10} {:>7}".format(
+        "type", "size", "tier", "solved", "puzzles/s", "p50 ms", "p99 ms", "peak KB", "change" ) )
+    for result in results:
+        size = "{}x{}".format( result["dimension"], result["dimension"] )
+        peak = "{:10.0f}".format( result["peak_memory_kb"] ) if not result["peak_memory_kb"] is None else "{:>10}".format( "-" )
+
+        # Speedup of puzzles/sec over the same corpus in the baseline run
+        change = ""
+        old = previous.get( key(result) )
+        if not old is None and old["puzzles_per_sec"] and result["puzzles_per_sec"]:
+            change = "{:.2f}x".format( result["puzzles_per_sec"] / old["puzzles_per_sec"] )
+
+        print( "{:<14} {:>5} {:<7} {:>7} {:10.1f} {:10.2f} {:10.2f} {} {:>7}".format(
+            result["type"], size, result["tier"], "{}/{}".format( result["solved"], result["puzzles"] ),
+            result["puzzles_per_sec"], result["p50_ms"], result["p99_ms"], peak, change ) )
+
+        for error in result["errors"]:
+            print( "    {}".format( error ) )
+
+def main():
+    parser = argparse.ArgumentParser( description="Benchmark the solvers over the bundled corpora" )
+    parser.add_argument( "--type", action="append", help="Only run this puzzle type (can be repeated)" )
+    parser.add_argument( "--tier", action="append", help="Only run this tier (can be repeated)" )
+    parser.add_argument( "--limit", type=int, default=None, help="Puzzles per corpus" )
+    parser.add_argument( "--no-search", action="store_true", help="Stop once the rules make no more progress" )
+    parser.add_argument( "--no-memory", action="store_true", help="Skip the memory pass" )
+    parser.add_argument( "--output", default=None, help="Write the results as JSON to this file" )
+    parser.add_argument( "--compare", default=None, help="JSON results of an earlier run to compare against" )
+    args = parser.parse_args()
+
+    corpora = [ corpus for corpus in CORPORA if ( args.type is None or corpus["type"] in args.type ) and ( args.tier is None or corpus["tier"] in args.tier ) ]
+
+    results = []
+    for corpus in corpora:
+        results.append( run_corpus( corpus, args.limit, not args.no_search, not args.no_memory ) )
+
+    baseline = None
+    if not args.compare is None:
+        with open( args.compare ) as f:
+            baseline = json.load( f )
+    print_results( results, baseline )
+
+    if not args.output is None:
+        report = {
+            "commit" : get_commit(),
+            "python" : platform.python_version(),
+            "numpy" : np.__version__,
+            "machine" : platform.machine(),
+            "time" : time.strftime( "%Y-%m-%dT%H:%M:%S" ),
+            "search" : not args.no_search,
+            "results" : results,
+        }
+        with open( args.output, "w" ) as f:
+            json.dump( report, f, indent=2 )
+
+if __name__ == "__main__":
+    main()
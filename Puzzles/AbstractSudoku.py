@@ -1,9 +1,18 @@
 import numpy as np
-import pandas as pd
-import itertools
-from copy import deepcopy
+import json
+import time
+from collections import deque
+from .SolveTrace import SolveTrace
 
 class AbstractSudoku:
+    # Largest hidden subset N_of_N_counts looks for (1 -> singles, 2 -> pairs, 3 -> triples, 4 -> quads)
+    # Each size tries at most (dim choose size) sets of values per group, so this caps the cost of the search
+    max_subset_size = 4
+
+    # Strategies by name in tiers of increasing cost, see reduce
+    # A tier only runs once the cheaper ones make no more progress, group functions not named here run in the last tier
+    strategy_tiers = [ [ "hidden_singles" ], [ "N_of_N_possibilities", "force_group" ], [ "N_of_N_counts" ] ]
+
     def __init__(self, dimension=9, setup_groups=True, subgrid_shape=None):
         self.initialize_sudoku(dimension, setup_groups, subgrid_shape)
         
@@ -12,34 +21,86 @@ class AbstractSudoku:
     def initialize_sudoku(self, dimension, setup_groups=True, subgrid_shape=None):
         self.dim = dimension
         self.values = set([ i+1 for i in range(self.dim) ])
+        self.full_mask = ( 1 << self.dim ) - 1
         
         # Grids for the puzzle itself
+        # possible holds one bitmask per cell, bit (value-1) is set if value is still a candidate
         self.grid = np.zeros( (self.dim, self.dim) ).astype(int)
         self.solved = np.zeros( (self.dim, self.dim) ).astype(bool)
-        self.possible = np.repeat( None, self.dim*self.dim ).reshape( (self.dim, self.dim) )
+        self.possible = np.zeros( (self.dim, self.dim), dtype=self.mask_dtype() )
         self.set_possibilities()
         
         # Groups for things like rows, columns, subgrids, etc
         self.groups = {}
 
+        # Index from each cell to the groups containing it and to its peers
+        # Built from self.groups the first time it is needed after the groups change
+        self.cell_groups = None
+        self.peers = None
+        self.group_types = None
+
+        # Cells each group shares with the others, see get_intersections
+        self.intersections = None
+
+        # Propagation state
+        # Placements waiting to be made, groups whose cells changed since their functions last ran,
+        # and whether the puzzle has been found to have no solution
+        self.pending = deque()
+        self.propagating = False
+        self.dirty_groups = {}
+        self.contradiction = False
+
+        # Groups waiting for each tier above the first, and the functions of each group split by tier, see apply_group_functions
+        self.waiting_groups = [ {} for tier in self.strategy_tiers[1:] ]
+        self.tier_functions = None
+
+        # Count of placements and eliminations made, used to tell when a pass changed nothing
+        self.changes = 0
+        self.search_stats = None
+
+        # Log of every placement and elimination as (x, y, prior mask, placed), used to undo them
+        # Only kept while a checkpoint is open (or a counted strategy runs), see checkpoint and release
+        self.trail = []
+        self.recording = False
+
+        # Position masks of the group last looked at, see get_position_masks
+        self.position_masks = None
+
+        # Per strategy counts, only recorded once enable_strategy_stats() has been called
+        # Kept when the puzzle is reset by load_grid so they cover a whole solve
+        if not hasattr( self, "strategy_stats" ):
+            self.strategy_stats = None
+
+        # Record of every placement and elimination, only kept once enable_trace() has been called
+        # Kept by load_grid like the strategy stats, so the givens are part of it
+        if not hasattr( self, "trace" ):
+            self.trace = None
+
         if setup_groups:
             self.set_groups()
 
     def set_possibilities(self):
-        for i in range(self.dim):
-            for j in range(self.dim):
-                self.possible[j,i] = set( self.values )
+        self.possible[:,:] = self.full_mask
+
+    # Smallest unsigned integer type with one bit per value
+    def mask_dtype(self):
+        if self.dim <= 16:
+            return np.uint16
+        elif self.dim <= 32:
+            return np.uint32
+        return np.uint64
         
     # Make groups for simplicity when applying the various rules of sudoku
     # e.g. each number in self. values can only appear once in a group
     def set_groups(self):
+        self.clear_group_index()
         
         # Create the row groups
         self.groups["row"] = np.repeat(None, self.dim)
         for i in range(self.dim):
             group = {}
             group["coords"] = set( [ (x,i) for x in range(self.dim) ] )
-            group["functions"] = [ self.N_of_N_counts, self.N_of_N_possibilities ]
+            group["functions"] = [ self.hidden_singles, self.N_of_N_counts, self.N_of_N_possibilities ]
             group["properties"] = {}
             
             self.groups["row"][i] = group
@@ -48,97 +109,320 @@ class AbstractSudoku:
         for i in range(self.dim):
             group = {}
             group["coords"] = set( [ (i,y) for y in range(self.dim) ] )
-            group["functions"] = [ self.N_of_N_counts, self.N_of_N_possibilities ]
+            group["functions"] = [ self.hidden_singles, self.N_of_N_counts, self.N_of_N_possibilities ]
             group["properties"] = {}
             
             self.groups["column"][i] = group
 
+    # The group index must be rebuilt whenever groups are added or changed
+    def clear_group_index(self):
+        self.cell_groups = None
+        self.peers = None
+        self.group_types = None
+        self.intersections = None
+
+        # Queued groups may have been dropped, index_groups marks every live group dirty again
+        self.dirty_groups = {}
+        self.waiting_groups = [ {} for tier in self.strategy_tiers[1:] ]
+        self.tier_functions = None
+
+    # Build the cell -> groups and cell -> peers lookups
+    # Peers of a cell are all other cells sharing at least one distinct group with it
+    # Every group starts out dirty so its functions run at least once
+    def index_groups(self):
+        self.cell_groups = { (x,y) : [] for y in range(self.dim) for x in range(self.dim) }
+        self.group_types = {}
+        peers = { coord : set() for coord in self.cell_groups }
+
+        for group_type in self.groups:
+            for group in self.groups[group_type].flatten():
+                self.dirty_groups[ id(group) ] = group
+                self.group_types[ id(group) ] = group_type
+                for coord in group["coords"]:
+                    self.cell_groups[coord].append( group )
+                    if self.is_distinct( group_type ):
+                        peers[coord].update( group["coords"] )
+
+        self.peers = {}
+        for coord in peers:
+            peers[coord].discard( coord )
+            self.peers[coord] = tuple( peers[coord] )
+
+    # Groups sharing cells with group, as ( inside, group2 ) for every distinct group2 with cells outside of group
+    #   inside              -> Mask of the shared cells, with bit i for the i-th coord of group as ordered by get_position_masks
+    # Built the first time each group asks for them
+    def get_intersections(self, group):
+        if self.cell_groups is None:
+            self.index_groups()
+        if self.intersections is None:
+            self.intersections = {}
+
+        if not id(group) in self.intersections:
+            # id of group2 -> [ inside, group2 ]
+            shared = {}
+            coords = list( group["coords"] )
+            for i in range(len(coords)):
+                for group2 in self.cell_groups[ coords[i] ]:
+                    if not id(group2) in shared:
+                        shared[ id(group2) ] = [ 0, group2 ]
+                    shared[ id(group2) ][0] |= 1 << i
+
+            # Groups inside this one have nowhere to force values out of
+            self.intersections[ id(group) ] = [ ( inside, group2 ) for inside, group2 in shared.values()
+                                                    if not group2 is group and self.is_distinct( self.group_types[ id(group2) ] )
+                                                    and self.popcount( inside ) < len( group2["coords"] ) ]
+
+        return self.intersections[ id(group) ]
+
+    # Whether a value can appear at most once in each group of this type
+    def is_distinct(self, group_type):
+        return True
+
+    def get_cell_groups(self, coord):
+        if self.cell_groups is None:
+            self.index_groups()
+        return self.cell_groups[coord]
+
+    def get_peers(self, coord):
+        if self.peers is None:
+            self.index_groups()
+        return self.peers[coord]
+
     # Load grid with pre-solved cells
     # This function does not read a grid from a file, but turns a read grid into a puzzle
     def load_grid(self, grid):
-        self.initialize_sudoku( len(grid) )
+        self.initialize_sudoku( len(grid), subgrid_shape=self.get_subgrid_shape() )
 
         for i in range(self.dim):
             for j in range(self.dim):
                 if grid[j,i] in self.values:
                     self.solve_cell( (i,j), grid[j,i] )
     
+    # Shape of the subgrids, kept when the puzzle is reset by load_grid
+    def get_subgrid_shape(self):
+        return None
+
     # Reads a CSV sudoku puzzle where blank spots are 0
     # Reads it and turns it into a numerical grid
     def read_grid_from_csv(self, f_name):
+        import pandas as pd     # Only needed for reading CSVs, so not imported with the module
         grid = np.array( pd.read_csv( f_name, header=None, index_col=None ) )
         return grid
 
     ##### SOLVE FUNCTIONS ######################################
         
+    # Placements and eliminations never recurse into each other
+    # Cells left with a single possibility are queued and placed by propagate()
     def solve_cell(self, coord, value):
+        self.pending.append( (coord, value) )
+        self.propagate()
+    
+    def remove_possibility(self, coord, value):
+        self.eliminate( coord, self.value_to_bit( value ) )
+        self.propagate()
+
+    # Remove every value in mask from the possibilities of coord
+    def remove_possibilities(self, coord, mask):
+        self.eliminate( coord, mask )
+        self.propagate()
+
+    # Place queued values until nothing is left to place
+    # Nested calls (from strategies running inside a propagation) return immediately
+    # and leave the work to the outermost call
+    def propagate(self):
+        if self.propagating:
+            return
+
+        self.propagating = True
+        try:
+            while self.pending:
+                coord, value = self.pending.popleft()
+                self.place( coord, value )
+        finally:
+            self.propagating = False
+
+    # Run a strategy with propagation held back until it returns,
+    # so groups aren't changed underneath the function while it works on them
+    # The trace puts the changes down to name, or the function's name
+    def apply_strategy(self, func, *args, name=None):
+        if not self.trace is None:
+            previous = self.trace.set_strategy( func.__name__ if name is None else name )
+
+        held = self.propagating
+        self.propagating = True
+        try:
+            func( *args )
+        finally:
+            self.propagating = held
+        self.propagate()
+
+        if not self.trace is None:
+            self.trace.restore_strategy( previous )
+
+    # apply_strategy, recording the time taken and the changes made under (name, group_type) in strategy_stats
+    # Placements that follow from the strategy's eliminations count towards it too
+    def apply_counted_strategy(self, name, group_type, func, *args):
+        # The changes are read back from the trail, which is dropped again afterwards if nothing else needs it
+        held = self.recording
+        self.recording = True
+        start = len(self.trail)
+        started = time.perf_counter()
+
+        self.apply_strategy( func, *args, name=name )
+
+        elapsed = time.perf_counter() - started
+        key = ( name, group_type )
+        if not key in self.strategy_stats:
+            self.strategy_stats[key] = { "calls" : 0, "time" : 0.0, "eliminations" : 0, "solved" : 0 }
+        stats = self.strategy_stats[key]
+        stats["calls"] += 1
+        stats["time"] += elapsed
+
+        # Candidates removed from each cell, from the first mask it had in the trail to the one it has now
+        # Solved cells count their value as the one candidate left
+        first = {}
+        for x, y, prior, placed in self.trail[start:]:
+            if placed:
+                stats["solved"] += 1
+            if not (x,y) in first:
+                first[ (x,y) ] = prior
+        for (x,y), prior in first.items():
+            remaining = 1 if self.solved[y,x] else self.popcount( self.possible[y,x] )
+            stats["eliminations"] += self.popcount( prior ) - remaining
+
+        if not held:
+            self.recording = False
+            self.trail = []
+
+    # Set a value and remove it from all peers
+    # Peers reduced to a single possibility are queued rather than placed here
+    def place(self, coord, value):
         x,y = coord
-        
+
+        if self.solved[y,x]:
+            if self.grid[y,x] != value:
+                self.contradiction = True
+            return
+
+        if not int( self.possible[y,x] ) & self.value_to_bit( value ):
+            self.contradiction = True
+
+        if not self.trace is None:
+            self.trace.record( SolveTrace.PLACED, x, y, self.value_to_bit( value ) )
+
         # Set the value in the proper place and let solved show that
+        if self.recording:
+            self.trail.append( ( x, y, int( self.possible[y,x] ), True ) )
         self.grid[y,x] = value
         self.solved[y,x] = True
-        self.possible[y,x] = set()
+        self.possible[y,x] = 0
+        self.changes += 1
+        self.mark_dirty( coord )
         
         # Remove value from the possibilities of all other cells in a group containing
         # the cell being set
-        for key in self.groups:
-            groups = self.groups[key].flatten()
-            for group in groups:
-                if not coord in group["coords"]:
-                    continue
-                
-                # Remove value from all unsolved cells
-                for coord2 in group["coords"]:
-                    self.remove_possibility( coord2, value )
-    
-    def remove_possibility(self, coord, value):
+        bit = self.value_to_bit( value )
+        for coord2 in self.get_peers( coord ):
+            x2, y2 = coord2
+            if self.solved[y2,x2]:
+                if self.grid[y2,x2] == value:
+                    self.contradiction = True
+            else:
+                self.eliminate( coord2, bit )
+
+    # Remove the values in mask from an unsolved cell without propagating
+    # A cell left with one possibility is queued to be placed, a cell left with none is a contradiction
+    def eliminate(self, coord, mask):
         x, y = coord
-        if not self.solved[y, x] and value in self.possible[y, x]:
-            # Only remove if the cell isn't already solved and if the value
-            # can be removed
-            self.possible[y, x].remove(value)
-        if len(self.possible[y, x]) == 1:
+        if self.solved[y, x]:
+            return
+
+        prior = int( self.possible[y, x] )
+        remaining = prior & ~mask
+        if remaining == prior:
+            return
+
+        if not self.trace is None:
+            self.trace.record( SolveTrace.ELIMINATED, x, y, prior & mask )
+
+        if self.recording:
+            self.trail.append( ( x, y, prior, False ) )
+        self.possible[y, x] = remaining
+        self.changes += 1
+        self.mark_dirty( coord )
+
+        if remaining == 0:
+            self.contradiction = True
+        elif remaining & ( remaining - 1 ) == 0:
             # Solve cells with only one possibility remaining
-            self.solve_cell( coord, self.possible[y, x].pop() )
+            self.pending.append( ( coord, self.bit_to_value( remaining ) ) )
+
+    # Flag every group containing coord to have its functions run again
+    def mark_dirty(self, coord):
+        for group in self.get_cell_groups( coord ):
+            self.dirty_groups[ id(group) ] = group
     
-    # Given a group, if N values appear only in the same N sets as possibilities,
-    # Remove other values from those possibilities
+    # Place every value the group has to hold that can only go in one of its cells
+    # The same as N_of_N_counts with subsets of one value, for the cheapest tier
+    def hidden_singles(self, group):
+        coords, positions = self.get_position_masks( group )
+
+        for val in self.mask_to_values( self.required_values( group ) ):
+            cells = positions[val]
+            if cells and cells & ( cells - 1 ) == 0:
+                x,y = coords[ cells.bit_length() - 1 ]
+                self.remove_possibilities( (x,y), int( self.possible[y,x] ) & ~self.value_to_bit( val ) )
+
+    # Given a group, if N values can only go in the same N cells (a hidden subset),
+    # Remove other values from those cells
+    # Values and cells are handled as bitmasks: each value gets a mask of the positions in the group it can still go in,
+    # and N values form a subset when their position masks together cover only N cells
+    # Subsets larger than max_subset_size are not looked for
     # Params:
     #   group               -> Group of cells
     # Returns:
     #   None                -> This function alters the cells in the group
     def N_of_N_counts(self, group):
-        unsolved = len(group["coords"]) - self.solved_in_group( group )
-        coord_sets, frequencies = self.get_frequencies( group )
-
-        for freq in frequencies:
-            if freq >= unsolved or freq == 0:
+        coords, positions = self.get_position_masks( group )
+        unsolved = len(coords) - self.solved_in_group( group )
+
+        # Only values the group has to hold can be pinned to the cells they appear in
+        required = self.required_values( group )
+        candidates = [ val for val in positions if required & self.value_to_bit( val ) and positions[val] ]
+
+        # Values already pinned are left out of larger subsets, whatever those would find follows from the smaller one
+        pinned = 0
+        for size in range( 1, min( self.max_subset_size, unsolved - 1 ) + 1 ):
+            values = [ val for val in candidates if not pinned & self.value_to_bit( val ) and self.popcount( positions[val] ) <= size ]
+
+            for subset, cells in self.find_hidden_subsets( values, positions, size ):
+                values_mask = self.values_to_mask( subset )
+                pinned |= values_mask
+
+                # Remove other possibilities from these cells
+                for i in range(len(coords)):
+                    if cells & ( 1 << i ):
+                        x,y = coords[i]
+                        self.remove_possibilities( coords[i], int( self.possible[y,x] ) & ~values_mask )
+
+    # Sets of size values, taken in order from values, whose positions together cover exactly size cells
+    # Sets are built up one value at a time and dropped as soon as their positions cover more than size cells
+    # Yields:
+    #   ( subset, cells )   -> List of values and the mask of the positions they cover
+    def find_hidden_subsets(self, values, positions, size):
+        stack = [ ( 0, [], 0 ) ]
+        while stack:
+            start, subset, cells = stack.pop()
+            if len(subset) == size:
+                if self.popcount( cells ) == size:
+                    yield subset, cells
                 continue
 
-            for values in itertools.combinations( frequencies[freq], freq ):
-                primary = values[0]
-                seed = coord_sets[primary]
-                matching = True
-
-                for secondary in values[1:]:
-                    remaining = coord_sets[secondary]
-                    matching = matching and ( seed == remaining )
-
-                if matching:
-                    # Remove other possibilities from these cells
-                    for coord in seed:
-                        x,y = coord
-                        # Remove the other possibilities one by one
-                        # do it this way to trigger the "if only one remains" possibility of remove_possibility
-                        outcast = self.possible[y,x] - set(values)
-                        for val in outcast:
-                            self.remove_possibility( coord, val )
-
-                    # Remove these possibilities from other coords
-                    for coord in group["coords"]:
-                        if not coord in seed:
-                            for val in values:
-                                self.remove_possibility( coord, val )
+            for ind in range( len(values) - 1, start - 1, -1 ):
+                val = values[ind]
+                union = cells | positions[val]
+                if self.popcount( union ) <= size and len(values) - ind >= size - len(subset):
+                    stack.append( ( ind + 1, subset + [val], union ) )
 
     # Similar to N_of_N_counts, but distinct
     # If N of the cells in the group only have the same N possibilities,
@@ -152,59 +436,161 @@ class AbstractSudoku:
     #   None                -> This function alters the cells in the group
     def N_of_N_possibilities(self, group):
         
-        unsolved = len(group) - self.solved_in_group(group)
+        unsolved = len(group["coords"]) - self.solved_in_group(group)
 
-        # make a dict linking each coord with each set of possibilities
-        coord_possibilities = { coord : self.possible[ coord[1], coord[0] ] for coord in group["coords"] }
-
-        # Now link each distinct set of possibilities to the coords that hold them
+        # Link each distinct mask of possibilities to the coords that hold them
         distinct_possibilities = {}
-        for coord in coord_possibilities:
-            possible_values = tuple( coord_possibilities[coord] )
-            if not possible_values in distinct_possibilities:
-                distinct_possibilities[possible_values] = []
-            distinct_possibilities[possible_values].append( coord )
+        for coord in group["coords"]:
+            x,y = coord
+            mask = int( self.possible[y,x] )
+            if mask == 0:
+                continue
+            if not mask in distinct_possibilities:
+                distinct_possibilities[mask] = []
+            distinct_possibilities[mask].append( coord )
 
         # Now loop through distinct possibilities and if any set of possibilities has the same length
         # as the number of coords it maps to, and that number is less than the total remaining unsolved cells,
         # eliminate those possibilities from other cells in the group
-        for values in distinct_possibilities:
-            if ( len(values) == len( distinct_possibilities[values] ) ) and ( len(values) < unsolved ):
-                self.remove_from_complement( group, distinct_possibilities[values], values )
+        for mask in distinct_possibilities:
+            count = self.popcount( mask )
+            if ( count == len( distinct_possibilities[mask] ) ) and ( count < unsolved ):
+                self.remove_from_complement( group, distinct_possibilities[mask], self.mask_to_values( mask ) )
     
-    def apply_group_functions(self):
-        for group_type in self.groups:
-            for group in self.groups[group_type].flatten():
-                for func in group["functions"]:
-                    func(group)
+    # Change the order the strategies run in, for this puzzle only
+    # Groups waiting for a tier go back to the first one
+    def set_strategy_tiers(self, strategy_tiers):
+        for waiting in self.waiting_groups:
+            self.dirty_groups.update( waiting )
+
+        self.strategy_tiers = strategy_tiers
+        self.waiting_groups = [ {} for tier in self.strategy_tiers[1:] ]
+        self.tier_functions = None
+
+    # Tier of strategy_tiers a strategy runs in
+    def get_strategy_tier(self, name):
+        for tier in range(len(self.strategy_tiers)):
+            if name in self.strategy_tiers[tier]:
+                return tier
+        return len(self.strategy_tiers) - 1
+
+    # Functions of the group that run in the tier
+    def get_tier_functions(self, group, tier):
+        if self.tier_functions is None:
+            self.tier_functions = {}
+
+        if not id(group) in self.tier_functions:
+            functions = [ [] for tiers in self.strategy_tiers ]
+            for func in group["functions"]:
+                functions[ self.get_strategy_tier( func.__name__ ) ].append( func )
+            self.tier_functions[ id(group) ] = functions
+
+        return self.tier_functions[ id(group) ][tier]
+
+    # Run the functions in one tier of strategy_tiers on the groups that changed since that tier last ran
+    # Changed groups go to the first tier (dirty_groups), and each tier hands the groups it ran on to the next one,
+    # so by the time a tier runs it has every group changed since it last did
+    # Groups changed while this runs are left dirty for the next pass
+    def apply_group_functions(self, tier=0):
+        if self.cell_groups is None:
+            self.index_groups()
+
+        if tier == 0:
+            dirty = self.dirty_groups
+            self.dirty_groups = {}
+        else:
+            dirty = self.waiting_groups[tier-1]
+            self.waiting_groups[tier-1] = {}
 
-    # If a value appears N times (1-3 in this case) in group1 (row, column, subgrid) as possibilities,
-    # and all N of those occurances also exist in group2, remove all other
-    # instances of these values grom group2 (other than those also in group1)
-    # e.g. if 2 appears three times in a subgrid, and all three of those exist in row 2,
-    # then remove all other instances of 2 from row2 (force the row)
-    def force_group(self, group, group_type):
-        # Get the set of coordinates where each value exists as a possibility
-        possible_coords = { value : self.get_possibility_coords(group, value) for value in self.values }
+        if tier < len(self.waiting_groups):
+            self.waiting_groups[tier].update( dirty )
 
-        for other_group_type in self.groups:
-            if other_group_type == group_type:
-                continue
+        for group in dirty.values():
+            for func in self.get_tier_functions( group, tier ):
+                if self.strategy_stats is None:
+                    self.apply_strategy( func, group )
+                else:
+                    self.apply_counted_strategy( func.__name__, self.group_types[ id(group) ], func, group )
 
-            for group2 in self.groups[other_group_type]:
-                # For each other group, get the set of coordinates where each value exists as a possibility
-                possible_coords2 = { value : self.get_possibility_coords(group2, value) for value in self.values }
+    # If every cell where a value can go in group1 (row, column, subgrid, cage) is also in group2,
+    # remove that value from the rest of group2 (pointing and claiming)
+    # e.g. if 2 appears three times in a subgrid, and all three of those exist in row 2,
+    # then remove all other instances of 2 from row2 (force the row)
+    # Only the groups sharing cells with group1 are looked at, see get_intersections
+    # Only values group1 has to hold are forced, and only into groups where values can't repeat
+    # Params:
+    #   group               -> Group of cells (group1)
+    #   group_type          -> Type of the group, not needed since the intersections cover every other group
+    # Returns:
+    #   None                -> This function alters the cells of the other groups
+    def force_group(self, group, group_type=None):
+        required = self.required_values( group )
+        if required == 0:
+            return
+
+        coords, positions = self.get_position_masks( group )
+        values = [ val for val in self.mask_to_values( required ) if positions[val] ]
+
+        for inside, group2 in self.get_intersections( group ):
+            forced = 0
+            for val in values:
+                if positions[val] & ~inside == 0:
+                    forced |= self.value_to_bit( val )
+
+            if forced:
+                for coord in group2["coords"]:
+                    if not coord in group["coords"]:
+                        self.remove_possibilities( coord, forced )
 
-                # For each value, if the coords in group1 are a subset of those in group2, remove the complement from group2
-                for val in possible_coords:
-                    coords1 = possible_coords[val]
-                    coords2 = possible_coords2[val]
+    ##### AUXILIARY FUNCTIONS ##################################
 
-                    if coords1 == coords1 & coords2:
-                        self.remove_from_complement(group2, coords1, [val])
+    # Bit representing value in a candidate mask
+    def value_to_bit(self, value):
+        return 1 << ( int(value) - 1 )
+
+    # Value represented by a single bit of a candidate mask
+    def bit_to_value(self, bit):
+        return int(bit).bit_length()
+
+    def values_to_mask(self, values):
+        mask = 0
+        for val in values:
+            mask |= 1 << ( int(val) - 1 )
+        return mask
+
+    # Values in the mask, in increasing order
+    def mask_to_values(self, mask):
+        mask = int(mask)
+        values = []
+        while mask:
+            bit = mask & -mask
+            values.append( bit.bit_length() )
+            mask ^= bit
+        return values
+
+    # Number of values still possible in the mask
+    def popcount(self, mask):
+        return bin( int(mask) ).count("1")
+
+    def lowest_bit(self, mask):
+        mask = int(mask)
+        return mask & -mask
+
+    # Number of possibilities left in every cell
+    def candidate_counts(self):
+        counts = np.zeros( self.possible.shape, dtype=int )
+        for i in range(self.dim):
+            counts += ( self.possible >> i ) & 1
+        return counts
 
+    # Set of the values still possible for a cell
+    def get_possible(self, coord):
+        x,y = coord
+        return set( self.mask_to_values( self.possible[y,x] ) )
 
-    ##### AUXILIARY FUNCTIONS ##################################
+    def has_possibility(self, coord, value):
+        x,y = coord
+        return bool( int( self.possible[y,x] ) & self.value_to_bit( value ) )
     
     # Given a group and value, return the set of all coordinates in group
     # containing that value as a possibility
@@ -213,11 +599,18 @@ class AbstractSudoku:
         
         for coord in group["coords"]:
             x,y = coord
-            if ( not self.solved[y,x] ) and  ( value in self.possible[y,x] ):
+            if ( not self.solved[y,x] ) and ( int( self.possible[y,x] ) & self.value_to_bit( value ) ):
                 all_coords.add( coord )
         
         return all_coords
 
+    # Mask of the values that must appear somewhere in the group
+    # A group with a cell for every value holds all of them
+    def required_values(self, group):
+        if len( group["coords"] ) == self.dim:
+            return self.full_mask
+        return 0
+
     def solved_in_group(self, group):
         total = 0
         for x,y in group["coords"]:
@@ -225,6 +618,33 @@ class AbstractSudoku:
     
         return total
 
+    # Given a group, return its coords in a fixed order and the positions each value can still go in
+    # The strategies of a group run one after the other, so the masks are kept until anything in the puzzle changes
+    # (every change adds to the change count, an undo shortens the trail without taking back from the count)
+    # Returns:
+    #   coords              -> List of the coords of the group
+    #   positions           -> dict from value to a mask with bit i set if coords[i] is unsolved and has that value as a possibility
+    def get_position_masks(self, group):
+        key = ( id(group), self.changes, len(self.trail) )
+        if not self.position_masks is None and self.position_masks[0] == key:
+            return self.position_masks[1], self.position_masks[2]
+
+        coords = list( group["coords"] )
+        positions = { val : 0 for val in self.values }
+        for i in range(len(coords)):
+            x,y = coords[i]
+            if self.solved[y,x]:
+                continue
+
+            mask = int( self.possible[y,x] )
+            while mask:
+                bit = mask & -mask
+                positions[ bit.bit_length() ] |= 1 << i
+                mask ^= bit
+
+        self.position_masks = ( key, coords, positions )
+        return coords, positions
+
     # Given a group, return how often and where each possibility occurs
     # Params:
     #   group               -> Group of cells
@@ -258,55 +678,247 @@ class AbstractSudoku:
                 for val in values:
                     self.remove_possibility(coord, val)
     
+    # One pass of every tier
     def basic_loop(self):
-        self.apply_group_functions()
+        for tier in range(len(self.strategy_tiers)):
+            self.apply_group_functions( tier )
+
+    # Apply the rules until they make no more progress or the puzzle turns out to have no solution
+    # With debug every change is traced, see enable_trace
+    # Strategies run by tier: the next tier only runs once a pass of the current one changes nothing,
+    # and a pass that changes anything goes back to the first tier
+    # A solved grid is left for is_valid to check, there is nothing left for the strategies to remove
+    def reduce(self, debug=False):
+        tier = 0
 
-    def solve(self, debug=False):
-        changed = True
+        if debug and self.trace is None:
+            self.enable_trace()
 
-        while changed:
-            changed = False
+        while tier < len(self.strategy_tiers) and not self.contradiction and not self.is_solved():
+            changes = self.changes
 
-            pre_grid = deepcopy( self.grid )
-            pre_possible = deepcopy( self.possible )
+            if not self.trace is None:
+                self.trace.pass_number += 1
 
-            if debug:
-                self.write_log("Pre")
+            self.apply_group_functions( tier )
 
-            self.basic_loop()
+            if self.changes != changes:
+                tier = 0
+            else:
+                tier += 1
 
-            if debug:
-                self.write_log("Post")
+    # With search, guess values once the rules stop making progress
+    def solve(self, debug=False, search=False):
+        self.reduce(debug)
 
-            changed = changed or ( not ( np.all( self.grid == pre_grid ) ) )
-            changed = changed or ( not ( np.all( self.possible == pre_possible ) ) )
+        if search and not self.is_solved():
+            self.search()
 
         if self.is_solved():
             print("Success!")
         else:
             print("Not yet...")
 
+    ##### INSTRUMENTATION FUNCTIONS ############################
+
+    # Start recording calls, time, eliminations and cells solved for every strategy, split by group type
+    # Off by default, when off the only cost is one check per strategy call
+    def enable_strategy_stats(self):
+        self.strategy_stats = {}
+
+    def disable_strategy_stats(self):
+        self.strategy_stats = None
+
+    # One dict per (strategy, group type) with its "strategy", "group_type", "calls", "time" (seconds),
+    # "eliminations" and "solved", most time consuming first
+    def get_strategy_stats(self):
+        if self.strategy_stats is None:
+            return []
+
+        stats = [ dict( strategy=name, group_type=group_type, **counts ) for (name, group_type), counts in self.strategy_stats.items() ]
+        return sorted( stats, key=lambda row : row["time"], reverse=True )
+
+    # JSON of get_strategy_stats, also written to f_name if given
+    def export_strategy_stats(self, f_name=None):
+        text = json.dumps( self.get_strategy_stats(), indent=2 )
+        if not f_name is None:
+            with open( f_name, "w" ) as f:
+                f.write( text )
+        return text
+
+    # Start recording every placement and elimination in a SolveTrace, keeping the latest capacity of them
+    def enable_trace(self, capacity=65536):
+        self.trace = SolveTrace( capacity )
+
+    def disable_trace(self):
+        self.trace = None
+
+    def get_trace(self):
+        return self.trace
+
+    ##### SEARCH FUNCTIONS #####################################
+
+    # Depth first search over the values of the cell with the fewest possibilities,
+    # running the full set of rules after every guess and backing up as soon as a cell has no possibilities left
+    # Leaves the puzzle solved, or as it was before the search if there is no solution
+    # Returns:
+    #   stats               -> dict with the number of guesses made (nodes), dead ends hit (backtracks) and deepest guess (max_depth)
+    def search(self):
+        stats = { "nodes" : 0, "backtracks" : 0, "max_depth" : 0 }
+        root = self.checkpoint()
+        self.reduce()
+
+        # Each level holds the checkpoint before the guess, the cell guessed, and the values not yet tried
+        stack = []
+
+        while True:
+            if self.contradiction or ( self.is_solved() and not self.is_valid() ):
+                stats["backtracks"] += 1
+            elif self.is_solved():
+                break
+            else:
+                coord = self.choose_cell()
+                x,y = coord
+                stack.append( ( self.checkpoint(), coord, self.mask_to_values( self.possible[y,x] ) ) )
+                stats["max_depth"] = max( stats["max_depth"], len(stack) )
+
+            # Drop levels that have run out of values to try
+            while stack and len( stack[-1][2] ) == 0:
+                stack.pop()
+
+            if len(stack) == 0:
+                self.rollback( root )
+                break
+
+            checkpoint, coord, values = stack[-1]
+            self.rollback( checkpoint )
+            stats["nodes"] += 1
+            self.guess( coord, values.pop(0) )
+
+        self.release( root )
+        self.search_stats = stats
+        return stats
+
+    # Count the solutions with the same search, going on past each one until limit of them have been found
+    # The rules prune every branch as they do for search, so a unique puzzle is usually settled in a handful of guesses
+    # Leaves the puzzle as it was before the count
+    # Params:
+    #   limit               -> Stop once this many solutions have been found, count them all if None
+    # Returns:
+    #   count               -> Number of solutions found, at most limit
+    def count_solutions(self, limit=2):
+        root = self.checkpoint()
+        self.reduce()
+
+        count = 0
+        stack = []
+        while limit is None or count < limit:
+            if self.contradiction or ( self.is_solved() and not self.is_valid() ):
+                pass
+            elif self.is_solved():
+                count += 1
+            else:
+                coord = self.choose_cell()
+                x,y = coord
+                stack.append( ( self.checkpoint(), coord, self.mask_to_values( self.possible[y,x] ) ) )
+
+            while stack and len( stack[-1][2] ) == 0:
+                stack.pop()
+
+            if len(stack) == 0:
+                break
+
+            checkpoint, coord, values = stack[-1]
+            self.rollback( checkpoint )
+            self.guess( coord, values.pop(0) )
+
+        self.rollback( root )
+        return count
+
+    def has_unique_solution(self):
+        return self.count_solutions( limit=2 ) == 1
+
+    # Place value in coord and run the rules, with the placement traced as a guess
+    def guess(self, coord, value):
+        if self.trace is None:
+            self.solve_cell( coord, value )
+        else:
+            previous = self.trace.set_strategy( "guess" )
+            self.solve_cell( coord, value )
+            self.trace.restore_strategy( previous )
+        self.reduce()
+
+    # Unsolved cell with the fewest possibilities remaining
+    def choose_cell(self):
+        counts = self.candidate_counts()
+        counts[ self.solved ] = self.dim + 1
+        y, x = np.unravel_index( np.argmin( counts ), counts.shape )
+        return ( int(x), int(y) )
+
+    # Mark the current state so it can be returned to with rollback()
+    # Only the trail position and the (usually empty) dirty groups are recorded, nothing is copied from the grid
+    # The trail is only kept from the outermost checkpoint on, until that checkpoint is rolled back to or released
+    def checkpoint(self):
+        outermost = not self.recording
+        if outermost:
+            self.recording = True
+            self.trail = []
+        return ( len(self.trail), dict( self.dirty_groups ), [ dict( waiting ) for waiting in self.waiting_groups ], self.contradiction, outermost )
+
+    # Undo every placement and elimination made since the checkpoint
+    # Takes time proportional to the number of changes undone
+    # Inner checkpoints can be rolled back to any number of times, the outermost one is done with once it has been
+    def rollback(self, checkpoint):
+        length, dirty_groups, waiting_groups, contradiction, outermost = checkpoint
+
+        if not self.trace is None:
+            previous = self.trace.set_strategy( "backtrack" )
+
+        while len(self.trail) > length:
+            x, y, prior, placed = self.trail.pop()
+
+            # The trace gets the undone change as a change of its own
+            if not self.trace is None:
+                if placed:
+                    self.trace.record( SolveTrace.UNPLACED, x, y, self.value_to_bit( self.grid[y,x] ) )
+                self.trace.record( SolveTrace.RESTORED, x, y, prior & ~int( self.possible[y,x] ) )
+
+            self.possible[y,x] = prior
+            if placed:
+                self.grid[y,x] = 0
+                self.solved[y,x] = False
+
+        if not self.trace is None:
+            self.trace.restore_strategy( previous )
+
+        self.dirty_groups = dict( dirty_groups )
+        self.waiting_groups = [ dict( waiting ) for waiting in waiting_groups ]
+        self.contradiction = contradiction
+        self.pending.clear()
+
+        if outermost:
+            self.recording = False
+            self.trail = []
+
+    # Keep the changes made since the checkpoint
+    # Releasing the outermost checkpoint drops the trail and stops recording it
+    def release(self, checkpoint):
+        if checkpoint[-1]:
+            self.recording = False
+            self.trail = []
+
     def is_solved(self):
         return np.all( self.solved )
 
-    def write_log(self, pre_f_name, grid=None, possible=None):
-        if grid is None:
-            grid = self.grid
-        if possible is None:
-            possible = self.possible
-
-        f = open( "{}_values.txt".format(pre_f_name), "w" )
-        for i in range(self.dim):
-            for j in range(self.dim):
-                f.write(str(grid[i,j]))
-                f.write("\t")
-            f.write("\n")
-        f.close()
+    # Whether the solved cells break any rule of the puzzle
+    # Placement already keeps peers apart, subclasses check the rules placement doesn't cover
+    def is_valid(self):
+        for group_type in self.groups:
+            if not self.is_distinct( group_type ):
+                continue
 
-        f = open( "{}_possible.txt".format(pre_f_name), "w" )
-        for i in range(self.dim):
-            for j in range(self.dim):
-                f.write(str(possible[i,j]))
-                f.write("\n")
-            f.write("\n>>>>>\n")
-        f.close()
\ No newline at end of file
+            for group in self.groups[group_type].flatten():
+                values = [ self.grid[y,x] for x,y in group["coords"] if self.solved[y,x] ]
+                if len( set(values) ) != len(values):
+                    return False
+        return True
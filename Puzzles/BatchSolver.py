@@ -0,0 +1,155 @@
+from collections import deque
+import itertools
+import os
+import numpy as np
+
+from .Sudoku import Sudoku
+from .Kropki import Kropki
+from .Futoshiki import Futoshiki
+from .KenKen import KenKen
+from .KillerSudoku import KillerSudoku
+from .PuzzleReader import PuzzleReader
+
+PUZZLE_TYPES = {
+    "Sudoku" : Sudoku,
+    "Killer Sudoku" : KillerSudoku,
+    "KenKen" : KenKen,
+    "Futoshiki" : Futoshiki,
+    "Kropki" : Kropki,
+}
+
+# Build a puzzle from its description and solve it without printing
+# A puzzle is either a grid, or a dict with any of "grid", "relations", "blobs" and "dimension",
+# or the error PuzzleReader hit reading it
+# Blobs are given as the grid of "key:total:operation" strings read by KenKen.parse_blobs
+# With count_limit, the solutions are counted up to that many before solving, in "solutions"
+# Errors are returned in the result instead of raised, so one bad puzzle doesn't stop a batch
+def solve_puzzle(puzzle_type, options, search, spec, count_limit=None):
+    result = { "solved" : False, "grid" : None, "stats" : None, "solutions" : None, "error" : None }
+
+    try:
+        if isinstance(spec, Exception):
+            raise spec
+        if not isinstance(spec, dict):
+            spec = { "grid" : spec }
+
+        grid = spec.get("grid")
+        dimension = spec.get("dimension")
+        if dimension is None:
+            dimension = len(grid)
+
+        puzzle = PUZZLE_TYPES[puzzle_type]( dimension=dimension, **options )
+        if not grid is None:
+            puzzle.load_grid( np.asarray(grid) )
+        if not spec.get("relations") is None:
+            puzzle.load_relations( np.asarray( spec["relations"] ) )
+        if not spec.get("blobs") is None:
+            puzzle.parse_blobs( np.asarray( spec["blobs"] ) )
+            puzzle.load_blobs()
+
+        if not count_limit is None:
+            result["solutions"] = puzzle.count_solutions( count_limit )
+
+        puzzle.reduce()
+        if search and not puzzle.is_solved():
+            result["stats"] = puzzle.search()
+
+        result["solved"] = bool( puzzle.is_solved() and puzzle.is_valid() )
+        result["grid"] = puzzle.grid
+    except Exception as e:
+        result["error"] = "{}: {}".format( type(e).__name__, e )
+
+    return result
+
+def solve_chunk(puzzle_type, options, search, chunk, count_limit=None):
+    return [ solve_puzzle( puzzle_type, options, search, spec, count_limit ) for spec in chunk ]
+
+class BatchSolver:
+    # Solve many puzzles of one type across a pool of worker processes
+    # Params:
+    #   puzzle_type         -> Key of PUZZLE_TYPES
+    #   workers             -> Number of processes, defaults to the number of CPUs. 1 solves in this process
+    #   chunk_size          -> Puzzles sent to a worker at a time
+    #   search              -> Whether to search once the rules stop making progress
+    #   puzzle_options      -> Extra keyword arguments for the puzzle constructor, e.g. subgrid_shape
+    #   count_limit         -> Count each puzzle's solutions up to this many, e.g. 2 to check they're unique
+    def __init__(self, puzzle_type="Sudoku", workers=None, chunk_size=64, search=True, puzzle_options=None, count_limit=None):
+        if not puzzle_type in PUZZLE_TYPES:
+            raise ValueError( "{} not supported".format(puzzle_type) )
+
+        self.puzzle_type = puzzle_type
+        self.workers = workers if not workers is None else os.cpu_count()
+        self.chunk_size = chunk_size
+        self.search = search
+        self.puzzle_options = puzzle_options if not puzzle_options is None else {}
+        self.count_limit = count_limit
+
+    # Yield one result dict per puzzle, in input order, as soon as it is available
+    def solve(self, puzzles):
+        for index, result in enumerate( self.solve_chunks( self.get_chunks( puzzles ) ) ):
+            result["index"] = index
+            yield result
+
+    # Only a couple of chunks per worker are in flight at once, so the input can be any size
+    # A worker dying breaks the whole pool: the chunks in flight are reported as failed and the rest go to a new pool
+    def solve_chunks(self, chunks):
+        if self.workers <= 1:
+            for chunk in chunks:
+                for result in solve_chunk( self.puzzle_type, self.puzzle_options, self.search, chunk, self.count_limit ):
+                    yield result
+            return
+
+        # Only needed once there are workers, and slow to import (multiprocessing)
+        from concurrent.futures import ProcessPoolExecutor
+        from concurrent.futures.process import BrokenProcessPool
+
+        executor = ProcessPoolExecutor( max_workers=self.workers )
+        in_flight = deque()
+        try:
+            for chunk in chunks:
+                try:
+                    future = self.submit( executor, chunk )
+                except BrokenProcessPool:
+                    while in_flight:
+                        for result in self.get_chunk_results( *in_flight.popleft() ):
+                            yield result
+                    executor.shutdown()
+                    executor = ProcessPoolExecutor( max_workers=self.workers )
+                    future = self.submit( executor, chunk )
+                in_flight.append( ( future, len(chunk) ) )
+
+                # Hand back the oldest chunk once enough are queued to keep every worker busy
+                if len(in_flight) >= 2 * self.workers:
+                    for result in self.get_chunk_results( *in_flight.popleft() ):
+                        yield result
+
+            while in_flight:
+                for result in self.get_chunk_results( *in_flight.popleft() ):
+                    yield result
+        finally:
+            executor.shutdown()
+
+    def submit(self, executor, chunk):
+        return executor.submit( solve_chunk, self.puzzle_type, self.puzzle_options, self.search, chunk, self.count_limit )
+
+    # Puzzles are streamed from the file by PuzzleReader, in either of its formats
+    # A puzzle that can't be read gets an error result of its own
+    def solve_file(self, f_name):
+        for result in self.solve( PuzzleReader( f_name, yield_errors=True ) ):
+            yield result
+
+    def get_chunks(self, puzzles):
+        puzzles = iter(puzzles)
+        while True:
+            chunk = list( itertools.islice( puzzles, self.chunk_size ) )
+            if len(chunk) == 0:
+                return
+            yield chunk
+
+    # If a worker dies or the pool breaks the whole chunk is reported as failed
+    def get_chunk_results(self, future, size):
+        try:
+            return future.result()
+        except Exception as e:
+            error = "{}: {}".format( type(e).__name__, e )
+            return [ { "solved" : False, "grid" : None, "stats" : None, "solutions" : None, "error" : error } for i in range(size) ]
@@ -0,0 +1,159 @@
+class DancingLinks:
+    # Exact cover solver using Knuth's Algorithm X on a dancing links matrix
+    # Nodes live in flat lists (left, right, up, down, column) instead of objects
+    # Node 0 is the root, nodes 1..columns are the column headers
+    def __init__(self, columns):
+        self.columns = columns
+        self.left = [ i-1 for i in range(columns+1) ]
+        self.right = [ i+1 for i in range(columns+1) ]
+        self.left[0] = columns
+        self.right[columns] = 0
+        self.up = [ i for i in range(columns+1) ]
+        self.down = [ i for i in range(columns+1) ]
+        self.column = [ i for i in range(columns+1) ]
+        self.size = [ 0 for i in range(columns+1) ]
+
+        # Row id of every node (None for headers)
+        self.row_of = [ None for i in range(columns+1) ]
+
+    # Add a row covering the given columns (0 indexed)
+    # Params:
+    #   row_id              -> Identifier returned in solutions when this row is chosen
+    #   columns             -> Columns this row covers
+    def add_row(self, row_id, columns):
+        first = None
+        for col in columns:
+            header = col + 1
+            node = len(self.column)
+
+            # Insert at the bottom of the column
+            self.column.append( header )
+            self.up.append( self.up[header] )
+            self.down.append( header )
+            self.down[ self.up[header] ] = node
+            self.up[header] = node
+            self.size[header] += 1
+            self.row_of.append( row_id )
+
+            # Link into the row
+            if first is None:
+                first = node
+                self.left.append( node )
+                self.right.append( node )
+            else:
+                self.left.append( self.left[first] )
+                self.right.append( first )
+                self.right[ self.left[first] ] = node
+                self.left[first] = node
+
+    def cover(self, header):
+        left, right, up, down, column, size = self.left, self.right, self.up, self.down, self.column, self.size
+
+        right[ left[header] ] = right[header]
+        left[ right[header] ] = left[header]
+
+        i = down[header]
+        while i != header:
+            j = right[i]
+            while j != i:
+                down[ up[j] ] = down[j]
+                up[ down[j] ] = up[j]
+                size[ column[j] ] -= 1
+                j = right[j]
+            i = down[i]
+
+    def uncover(self, header):
+        left, right, up, down, column, size = self.left, self.right, self.up, self.down, self.column, self.size
+
+        i = up[header]
+        while i != header:
+            j = left[i]
+            while j != i:
+                size[ column[j] ] += 1
+                down[ up[j] ] = j
+                up[ down[j] ] = j
+                j = left[j]
+            i = up[i]
+
+        right[ left[header] ] = header
+        left[ right[header] ] = header
+
+    # Cover the columns of the other nodes in node's row
+    def cover_row(self, node):
+        j = self.right[node]
+        while j != node:
+            self.cover( self.column[j] )
+            j = self.right[j]
+
+    def uncover_row(self, node):
+        j = self.left[node]
+        while j != node:
+            self.uncover( self.column[j] )
+            j = self.left[j]
+
+    # Column with the fewest rows left
+    def choose_column(self):
+        right, size = self.right, self.size
+
+        best = right[0]
+        j = right[best]
+        while j != 0 and size[best] > 1:
+            if size[j] < size[best]:
+                best = j
+            j = right[j]
+        return best
+
+    # Yield every exact cover as a list of row ids, stopping after limit solutions
+    # The search is iterative, so the depth is not bounded by the recursion limit
+    # The matrix is restored when the generator finishes or is closed
+    def solutions(self, limit=None):
+        found = 0
+        chosen = []
+
+        try:
+            while True:
+                advance = True
+
+                if self.right[0] == 0:
+                    yield [ self.row_of[node] for node in chosen ]
+                    found += 1
+                    if not limit is None and found >= limit:
+                        return
+                else:
+                    header = self.choose_column()
+                    if self.size[header] > 0:
+                        self.cover( header )
+                        node = self.down[header]
+                        chosen.append( node )
+                        self.cover_row( node )
+                        advance = False
+
+                if not advance:
+                    continue
+
+                # Move to the next row of the deepest column that still has one
+                while chosen:
+                    node = chosen.pop()
+                    self.uncover_row( node )
+                    header = self.column[node]
+                    node = self.down[node]
+
+                    if node != header:
+                        chosen.append( node )
+                        self.cover_row( node )
+                        break
+
+                    self.uncover( header )
+                else:
+                    return
+        finally:
+            while chosen:
+                node = chosen.pop()
+                self.uncover_row( node )
+                self.uncover( self.column[node] )
+
+    def count_solutions(self, limit=None):
+        total = 0
+        for solution in self.solutions( limit ):
+            total += 1
+        return total
@@ -1,8 +1,22 @@
 from .RelationalSudoku import RelationalSudoku
+from collections import deque
 
 class Futoshiki(RelationalSudoku):
+    # Each run of the relations goes over every inequality chain, so they wait for the hidden singles
+    strategy_tiers = [ [ "hidden_singles" ], [ "relations", "N_of_N_possibilities" ], [ "N_of_N_counts" ] ]
+
     def __init__(self, dimension=9):
         self.initialize_sudoku(dimension)
+
+    def initialize_sudoku(self, dimension, setup_groups=True, subgrid_shape=None):
+        super().initialize_sudoku(dimension, setup_groups, subgrid_shape)
+
+        # Inequality graph built from the relations, see get_inequality_order
+        self.inequalities = None
+
+    def load_relations(self, relation_grid):
+        super().load_relations( relation_grid )
+        self.inequalities = None
     
     ##### RELATION FUNCTIONS #######################################
 
@@ -24,27 +38,131 @@ class Futoshiki(RelationalSudoku):
     def greater_than(self, coord1, coord2):
         x1, y1 = coord1
         x2, y2 = coord2
-        values1 = self.possible[y1,x1]
-        values2 = self.possible[y2,x2]
+        values1 = int( self.possible[y1,x1] )
+        values2 = int( self.possible[y2,x2] )
 
         if self.solved[y1,x1]:
-            values1 = set( [ self.grid[y1,x1] ] )
+            values1 = self.value_to_bit( self.grid[y1,x1] )
         if self.solved[y2,x2]:
-            values2 = set( [ self.grid[y2,x2] ] )
+            values2 = self.value_to_bit( self.grid[y2,x2] )
+
+        if values2 == 0:
+            return 0
 
-        remaining = set( [ el for el in values1 if el > min(values2) ] )
+        # Keep only the values above the smallest value of coord2
+        minimum = self.bit_to_value( self.lowest_bit( values2 ) )
+        remaining = values1 & ~( ( 1 << minimum ) - 1 )
         return remaining
     
     def less_than(self, coord1, coord2):
         x1, y1 = coord1
         x2, y2 = coord2
-        values1 = self.possible[y1,x1]
-        values2 = self.possible[y2,x2]
+        values1 = int( self.possible[y1,x1] )
+        values2 = int( self.possible[y2,x2] )
 
         if self.solved[y1,x1]:
-            values1 = set( [ self.grid[y1,x1] ] )
+            values1 = self.value_to_bit( self.grid[y1,x1] )
         if self.solved[y2,x2]:
-            values2 = set( [ self.grid[y2,x2] ] )
+            values2 = self.value_to_bit( self.grid[y2,x2] )
+
+        if values2 == 0:
+            return 0
+
+        # Keep only the values below the largest value of coord2
+        maximum = self.bit_to_value( values2 )
+        remaining = values1 & ( ( 1 << ( maximum - 1 ) ) - 1 )
+        return remaining
+
+    ##### BOUND FUNCTIONS #######################################
+
+    # Every cell of the inequality graph in topological order (each cell after all the cells that must be smaller),
+    # with the cells that must be smaller and larger than each one
+    # The order is None if the inequalities go around in a cycle
+    def get_inequality_order(self):
+        if self.inequalities is None:
+            smaller = {}
+            larger = {}
+            for coord1, func, coord2 in self.relations:
+                if func == self.greater_than:
+                    low, high = coord2, coord1
+                elif func == self.less_than:
+                    low, high = coord1, coord2
+                else:
+                    continue
+
+                for coord in [ low, high ]:
+                    if not coord in smaller:
+                        smaller[coord] = []
+                        larger[coord] = []
+                # Each inequality is in the relations both ways
+                if not high in larger[low]:
+                    larger[low].append( high )
+                    smaller[high].append( low )
+
+            # Kahn's algorithm, cells left over are on a cycle
+            waiting = { coord : len( smaller[coord] ) for coord in smaller }
+            ready = deque( coord for coord in waiting if waiting[coord] == 0 )
+            order = []
+            while ready:
+                coord = ready.popleft()
+                order.append( coord )
+                for coord2 in larger[coord]:
+                    waiting[coord2] -= 1
+                    if waiting[coord2] == 0:
+                        ready.append( coord2 )
+
+            if len(order) < len(smaller):
+                order = None
+            self.inequalities = ( order, smaller, larger )
+
+        return self.inequalities
+
+    # Push the smallest values up every chain of inequalities, then the largest values down,
+    # so a < b < c < d is settled in one pass each way instead of one relation at a time
+    # Each bound moves to the nearest value the cell can still take, which leaves every inequality satisfied
+    def propagate_bounds(self):
+        order, smaller, larger = self.get_inequality_order()
+        if order is None:
+            self.contradiction = True
+            return
+
+        masks = {}
+        for x,y in order:
+            masks[ (x,y) ] = self.value_to_bit( self.grid[y,x] ) if self.solved[y,x] else int( self.possible[y,x] )
+
+        # Lower bounds, smallest cells first
+        for coord in order:
+            for coord2 in smaller[coord]:
+                if masks[coord2] == 0:
+                    masks[coord] = 0
+                    break
+                minimum = self.bit_to_value( self.lowest_bit( masks[coord2] ) )
+                masks[coord] &= ~( ( 1 << minimum ) - 1 )
+
+        # Upper bounds, largest cells first
+        for coord in reversed(order):
+            for coord2 in larger[coord]:
+                if masks[coord2] == 0:
+                    masks[coord] = 0
+                    break
+                maximum = self.bit_to_value( masks[coord2] )
+                masks[coord] &= ( 1 << ( maximum - 1 ) ) - 1
+
+        for coord in order:
+            x,y = coord
+            if self.solved[y,x]:
+                if masks[coord] == 0:
+                    self.contradiction = True
+            else:
+                self.remove_possibilities( coord, int( self.possible[y,x] ) & ~masks[coord] )
+
+    # All the inequalities are applied together by propagate_bounds, whenever any cell changed since the last pass
+    def apply_relations(self):
+        if len( self.dirty_cells ) == 0:
+            return
+        self.dirty_cells = set()
 
-        remaining = set( [ el for el in values1 if el < max(values2) ] )
-        return remaining
\ No newline at end of file
+        if self.strategy_stats is None:
+            self.apply_strategy( self.propagate_bounds )
+        else:
+            self.apply_counted_strategy( "propagate_bounds", "relation", self.propagate_bounds )
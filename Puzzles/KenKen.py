@@ -1,8 +1,17 @@
 from .Sudoku import Sudoku
 import numpy as np
-import pandas as pd
 
 class KenKen(Sudoku):
+    # Cages are the main rule, so they are culled alongside the naked subsets
+    strategy_tiers = [ [ "hidden_singles" ], [ "N_of_N_possibilities", "cull_possibilities" ], [ "N_of_N_counts", "force_group" ] ]
+
+    # Tables of the assignments that reach a total, shared by every puzzle
+    # Keyed by (operation name, total, cage size, dimension), see get_combination_table
+    combination_tables = {}
+
+    # Cages with more assignments than this before any pruning (dim ** size) are enumerated instead of tabled
+    table_limit = 1 << 20
+
     def __init__(self, dimension=6, setup_groups=True, subgrid_shape=None):
         super().__init__(dimension, setup_groups=False, subgrid_shape=subgrid_shape)
         self.blobs = {}
@@ -11,6 +20,9 @@ class KenKen(Sudoku):
     def initialize_sudoku(self, dimension=6, setup_groups=True, subgrid_shape=(2,3)):
         super().initialize_sudoku(dimension, setup_groups=False, subgrid_shape=subgrid_shape)
 
+        # Combination table of each blob, narrowed down to the assignments its shape allows
+        self.cage_tables = {}
+
         if setup_groups:
             self.set_groups()
     
@@ -23,20 +35,30 @@ class KenKen(Sudoku):
         if not blobs is None:
             self.blobs = blobs
 
+        self.clear_group_index()
+        self.cage_tables = {}
         self.groups["arithmetic"] = np.repeat( None, len(self.blobs) )
         ind = 0
         for key in self.blobs:
             self.groups["arithmetic"][ind] = self.blobs[key]
-            self.groups["arithmetic"][ind]["functions"] = []
+            if not "functions" in self.blobs[key]:
+                self.groups["arithmetic"][ind]["functions"] = [ self.cull_possibilities ]
             ind += 1
 
     def read_blobs_from_csv(self, f_name):
+        import pandas as pd
         blobs = np.array( pd.read_csv( f_name, header=None, index_col=None ) )
+        self.parse_blobs( blobs )
+
+    # Each cell of the blob grid reads "key", "key:total" or "key:total:operation"
+    # Cells sharing a key form a blob
+    def parse_blobs(self, blobs):
         for row in range(len(blobs)):
             for col in range(len(blobs[row])):
                 element = [el.strip() for el in blobs[row,col].split(":") ]
                 if len( element ) == 3:
                     key, val, operation = element
+                    val = int(val)
                 elif len( element ) == 2:
                     key, val = element
                     val = int(val)
@@ -64,11 +86,11 @@ class KenKen(Sudoku):
             return
         
         x,y = list( group["coords"] )[ind]
-        possible = self.possible[y,x]
+        possible = self.mask_to_values( self.possible[y,x] )
 
         # If a cell is already solved, make sure that value is taken into account
         if self.solved[y,x]:
-            possible = set( [ self.grid[y,x] ] )
+            possible = [ self.grid[y,x] ]
 
         for val in possible:
             self.get_permutations( group, ind+1, current+[val], all_results )
@@ -125,21 +147,214 @@ class KenKen(Sudoku):
         
         return combos
     
+    # Blobs without an operation (single cells) just hold their total
+    def get_operation(self, group):
+        return group["properties"].get( "operation", self.add_all )
+
+    # Every ordered assignment of values to a cage of size cells that reaches total with the operation,
+    # as a (combos, size) array. Built once per (operation, total, size, dimension) and shared by every puzzle
+    # Returns None for operations other than the four of map_symbol_to_operation
+    def get_combination_table(self, operation, total, size):
+        name = getattr( operation, "__name__", None )
+        if not name in [ "add_all", "subtract_all", "multiply_all", "divide_all" ]:
+            return None
+
+        key = ( name, total, size, self.dim )
+        if not key in KenKen.combination_tables:
+            KenKen.combination_tables[key] = self.build_combination_table( name, total, size )
+        return KenKen.combination_tables[key]
+
+    # Add one cell at a time, dropping partial assignments that can no longer reach the total
+    # (sums that are already too large or too small, products that don't divide the total)
+    def build_combination_table(self, name, total, size):
+        values = np.arange( 1, self.dim+1 )
+        combos = values.reshape( (-1, 1) )
+
+        for i in range( 1, size ):
+            combos = np.hstack( [ np.repeat( combos, self.dim, axis=0 ), np.tile( values, len(combos) ).reshape( (-1, 1) ) ] )
+            left = size - i - 1
+
+            if name == "add_all":
+                partial = combos.sum( axis=1 )
+                combos = combos[ ( partial + left <= total ) & ( partial + left*self.dim >= total ) ]
+            elif name == "multiply_all":
+                partial = np.prod( combos, axis=1 )
+                combos = combos[ total % partial == 0 ]
+
+        if name == "add_all":
+            reached = combos.sum( axis=1 ) == total
+        elif name == "multiply_all":
+            reached = np.prod( combos, axis=1 ) == total
+        elif name == "subtract_all":
+            reached = combos[:,0] - combos[:,1:].sum( axis=1 ) == total
+        else:
+            reached = combos[:,0] == total * np.prod( combos[:,1:], axis=1 )
+
+        return combos[ reached ]
+
+    # A value can repeat within a cage, as long as the cells holding it are in different rows and columns
+    def is_distinct(self, group_type):
+        return group_type != "arithmetic"
+
+    # Pairs of cells of the cage (as indices into its coords) that can't hold the same value
+    def get_cage_conflicts(self, group):
+        coords = group["coords"]
+        return [ (i, j) for i in range(len(coords)) for j in range(i+1, len(coords))
+                    if coords[i][0] == coords[j][0] or coords[i][1] == coords[j][1] ]
+
+    # Bits of the assignments of the combination table that fit the cage, one column per cell,
+    # or None if the cage's operation has no table or the cage is too large to table
+    # Short tables are kept as lists of tuples, scanning those is quicker than the numpy calls for an array
+    def get_cage_table(self, group):
+        if not id(group) in self.cage_tables:
+            table = None
+            if self.dim ** len( group["coords"] ) <= self.table_limit:
+                table = self.get_combination_table( self.get_operation( group ), group["properties"]["total"], len( group["coords"] ) )
+
+            if not table is None:
+                for i, j in self.get_cage_conflicts( group ):
+                    table = table[ table[:,i] != table[:,j] ]
+                table = np.left_shift( 1, table - 1 )
+                if len(table) <= 64:
+                    table = [ tuple( int(bit) for bit in row ) for row in table ]
+
+            self.cage_tables[ id(group) ] = table
+        return self.cage_tables[ id(group) ]
+
+    # Keep only the values each cell takes in some assignment of the cage that fits every cell's possibilities
+    # The work is proportional to the number of assignments reaching the total, not to the product of the possibilities
     def cull_possibilities(self, group):
-        operation = group["properties"]["operation"]
-        total = group["properties"]["total"]
+        table = self.get_cage_table( group )
+        if table is None:
+            self.cull_enumerated( group )
+            return
 
-        combos = []
-        self.get_permutations( group, 0, [], combos )
-        combos = self.cull_combos( combos, operation, total )
-        combos = np.array(combos)
-        culled_sets = [ set( combos[:,i] ) for i in range( combos.shape[1] ) ]
+        masks = [ self.value_to_bit( self.grid[y,x] ) if self.solved[y,x] else int( self.possible[y,x] ) for x,y in group["coords"] ]
+        culled_masks = [ 0 for coord in group["coords"] ]
+
+        if isinstance( table, list ):
+            for combo in table:
+                fits = True
+                for i in range(len(combo)):
+                    if not combo[i] & masks[i]:
+                        fits = False
+                        break
+                if fits:
+                    for i in range(len(combo)):
+                        culled_masks[i] |= combo[i]
+        else:
+            fits = table[ np.all( table & np.array( masks ), axis=1 ) ]
+            if len(fits) > 0:
+                culled_masks = [ int(mask) for mask in np.bitwise_or.reduce( fits, axis=0 ) ]
 
         for i in range(len(group["coords"])):
             x,y = group["coords"][i]
 
             if not self.solved[y,x]:
-                self.possible[y,x] &= culled_sets[i]
+                self.remove_possibilities( (x,y), int( self.possible[y,x] ) & ~int( culled_masks[i] ) )
+
+    # cull_possibilities for cages without a combination table, using the assignments found by enumerate_cage
+    def cull_enumerated(self, group):
+        # Mask of the values each cell takes across the remaining combos
+        culled_masks = [ 0 for coord in group["coords"] ]
+        for combo in self.enumerate_cage( group ):
+            for i in range(len(combo)):
+                culled_masks[i] |= self.value_to_bit( combo[i] )
+
+        for i in range(len(group["coords"])):
+            x,y = group["coords"][i]
+
+            if not self.solved[y,x]:
+                self.remove_possibilities( (x,y), int( self.possible[y,x] ) & ~culled_masks[i] )
+
+    # Yield, one at a time, every assignment of the cage's possibilities (in the order of its coords) that reaches its total
+    # Values are tried cell by cell and a partial assignment is dropped as soon as
+    #   - a value repeats in a row or column of the cage
+    #   - the smallest and largest values left in the remaining cells can't bring it to the total
+    #     (sums, products, and the sum or product the rest must make for a subtraction or division)
+    # Operations other than the four of map_symbol_to_operation are only checked once every cell has a value
+    def enumerate_cage(self, group):
+        coords = group["coords"]
+        operation = self.get_operation( group )
+        name = getattr( operation, "__name__", None )
+        total = group["properties"]["total"]
+
+        options = []
+        for x,y in coords:
+            if self.solved[y,x]:
+                options.append( [ int( self.grid[y,x] ) ] )
+            else:
+                options.append( self.mask_to_values( self.possible[y,x] ) )
+        if min( len(values) for values in options ) == 0:
+            return
+
+        # Earlier cells each cell must differ from
+        conflicts = [ [] for coord in coords ]
+        for i, j in self.get_cage_conflicts( group ):
+            conflicts[ max(i,j) ].append( min(i,j) )
+
+        # Smallest and largest sum and product the cells from i onwards can make
+        size = len(coords)
+        low_sum = [ 0 for i in range(size+1) ]
+        high_sum = [ 0 for i in range(size+1) ]
+        low_product = [ 1 for i in range(size+1) ]
+        high_product = [ 1 for i in range(size+1) ]
+        for i in reversed( range(size) ):
+            low_sum[i] = low_sum[i+1] + options[i][0]
+            high_sum[i] = high_sum[i+1] + options[i][-1]
+            low_product[i] = low_product[i+1] * options[i][0]
+            high_product[i] = high_product[i+1] * options[i][-1]
+
+        # Whether values, given to the first cells, can still be completed to the total
+        def reachable(values):
+            k = len(values)
+            if name == "add_all":
+                needed = total - sum(values)
+                return low_sum[k] <= needed <= high_sum[k]
+            if name == "multiply_all":
+                product = self.multiply_all( values )
+                return total % product == 0 and low_product[k] <= total / product <= high_product[k]
+            if name == "subtract_all":
+                needed = values[0] - total - sum( values[1:] )
+                return low_sum[k] <= needed <= high_sum[k]
+            if name == "divide_all" and total != 0:
+                needed = values[0] / ( total * self.multiply_all( [1] + values[1:] ) )
+                return needed == int(needed) and low_product[k] <= needed <= high_product[k]
+            return True
+
+        values = []
+        def extend(i):
+            if i == size:
+                if operation( values ) == total:
+                    yield tuple( values )
+                return
+
+            for val in options[i]:
+                if any( values[j] == val for j in conflicts[i] ):
+                    continue
+
+                values.append( val )
+                if reachable( values ):
+                    for combo in extend( i+1 ):
+                        yield combo
+                values.pop()
+
+        for combo in extend(0):
+            yield combo
+
+    # Every fully solved blob must reach its total
+    def is_valid(self):
+        if not super().is_valid():
+            return False
+
+        for group in self.groups["arithmetic"]:
+            if not "total" in group["properties"] or not np.all( [ self.solved[y,x] for x,y in group["coords"] ] ):
+                continue
+
+            values = [ self.grid[y,x] for x,y in group["coords"] ]
+            if self.get_operation( group )( values ) != group["properties"]["total"]:
+                return False
+        return True
 
     def map_symbol_to_operation(self, symbol):
         if symbol == "+":
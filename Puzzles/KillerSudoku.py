@@ -1,26 +1,216 @@
 from .KenKen import KenKen
 import numpy as np
-import pandas as pd
 
 class KillerSudoku(KenKen):
+    # Digit combinations of every cage sum, shared by every puzzle
+    # Keyed by (total, cage size, dimension), see get_sum_table
+    sum_tables = {}
+
+    # Largest set of innies or outies the 45 rule turns into a sum region
+    max_region_size = 4
+
     def __init__(self, dimension=6, setup_groups=True, subgrid_shape=(2,3)):
         super().__init__(dimension, setup_groups=False, subgrid_shape=subgrid_shape)
         self.blobs = {}
         self.initialize_sudoku(dimension, setup_groups=setup_groups, subgrid_shape=subgrid_shape)
-    
+
     def initialize_sudoku(self, dimension=6, setup_groups=True, subgrid_shape=(2,3)):
         super().initialize_sudoku(dimension, setup_groups=False, subgrid_shape=subgrid_shape)
 
         if setup_groups:
             self.set_groups()
-    
+
     def set_groups(self):
         super().set_groups()
 
-    def read_blobs_from_csv(self, f_name):
-        blobs = np.array( pd.read_csv( f_name, header=None, index_col=None ) )
-        for row in range(len(blobs)):
-            for col in range(len(blobs[row])):
-                key, val = blobs[row,col].split(":")
-                if not key in self.blobs:
-                    pass
\ No newline at end of file
+    # Blobs are read as "key:total" cells by KenKen.read_blobs_from_csv and parse_blobs, the operation is always a sum
+    # Cages are groups where no digit repeats, so the subset rules of the rows, columns and subgrids run on them too
+    # The 45 rule adds a "sum" group for the innies and outies of each row, column and subgrid
+    def load_blobs(self, blobs=None):
+        super().load_blobs( blobs )
+
+        for group in self.groups["arithmetic"]:
+            strategies = [ self.hidden_singles, self.N_of_N_counts, self.N_of_N_possibilities ]
+            group["functions"] = strategies + [ func for func in group["functions"] if not func in strategies ]
+
+        self.set_sum_groups()
+
+        # Cells solved before the cages were loaded haven't been removed from their cage mates yet
+        for group in self.groups["arithmetic"]:
+            for x,y in group["coords"]:
+                if self.solved[y,x]:
+                    for coord in group["coords"]:
+                        self.eliminate( coord, self.value_to_bit( self.grid[y,x] ) )
+        self.propagate()
+
+    # Cages are distinct, the sum regions of the 45 rule can span cells that share no group
+    def is_distinct(self, group_type):
+        return group_type != "sum"
+
+    # Cells of a cage or sum region that see each other can't hold the same digit
+    def get_cage_conflicts(self, group):
+        coords = group["coords"]
+        return [ (i, j) for i in range(len(coords)) for j in range(i+1, len(coords)) if coords[j] in self.get_peers( coords[i] ) ]
+
+    ##### SUM FUNCTIONS #######################################
+
+    # Masks of the sets of size distinct digits adding up to total
+    # Built once per (total, size, dimension) and shared by every puzzle
+    def get_sum_table(self, total, size):
+        key = ( total, size, self.dim )
+        if not key in KillerSudoku.sum_tables:
+            KillerSudoku.sum_tables[key] = self.build_sum_table( total, size )
+        return KillerSudoku.sum_tables[key]
+
+    # Digits are picked in increasing order, stopping as soon as the smallest or largest digits left can't make the total
+    def build_sum_table(self, total, size):
+        table = []
+
+        def extend(start, left, remaining, mask):
+            if left == 0:
+                if remaining == 0:
+                    table.append( mask )
+                return
+
+            for val in range( start, self.dim+1 ):
+                smallest = val*left + int( left*(left-1) / 2 )
+                largest = self.dim*left - int( left*(left-1) / 2 )
+                if smallest > remaining:
+                    break
+                if largest < remaining:
+                    continue
+                extend( val+1, left-1, remaining-val, mask | self.value_to_bit(val) )
+
+        extend( 1, size, total, 0 )
+        return table
+
+    # Digit sets of the cage's sum that could still fill it: every cell keeps a candidate from the set,
+    # and every digit of the set is a candidate of some cell
+    def get_sum_combinations(self, group):
+        masks = [ self.value_to_bit( self.grid[y,x] ) if self.solved[y,x] else int( self.possible[y,x] ) for x,y in group["coords"] ]
+        union = 0
+        for mask in masks:
+            union |= mask
+
+        combos = []
+        for combo in self.get_sum_table( group["properties"]["total"], len( group["coords"] ) ):
+            if combo & union == combo and all( mask & combo for mask in masks ):
+                combos.append( combo )
+        return combos
+
+    # Sum regions of the 45 rule carry a "region" property, cages don't
+    def is_cage(self, group):
+        return not "region" in group["properties"]
+
+    # Digits that are in every combination left must be in the cage
+    def required_values(self, group):
+        if not self.is_cage( group ) or not "total" in group["properties"]:
+            return super().required_values( group )
+
+        combos = self.get_sum_combinations( group )
+        if len(combos) == 0:
+            return 0
+
+        required = self.full_mask
+        for combo in combos:
+            required &= combo
+
+        # Digits already placed in the cage have nowhere else to go
+        for x,y in group["coords"]:
+            if self.solved[y,x]:
+                required &= ~self.value_to_bit( self.grid[y,x] )
+        return required
+
+    # Cages keep only the digits of their remaining combinations (everything else is forbidden)
+    # A digit the cage must hold is removed from the cells outside it that see every cell of the cage it could go in
+    # Sum regions of the 45 rule can repeat digits, so they are culled by KenKen's ordered assignments instead
+    def cull_possibilities(self, group):
+        if not self.is_cage( group ):
+            super().cull_possibilities( group )
+            return
+
+        # Cages without a total only keep their digits apart
+        if not "total" in group["properties"]:
+            return
+
+        combos = self.get_sum_combinations( group )
+        allowed = 0
+        required = self.full_mask if len(combos) > 0 else 0
+        for combo in combos:
+            allowed |= combo
+            required &= combo
+
+        for x,y in group["coords"]:
+            if not self.solved[y,x]:
+                self.remove_possibilities( (x,y), int( self.possible[y,x] ) & ~allowed )
+
+        for val in self.mask_to_values( required ):
+            coords = self.get_possibility_coords( group, val )
+            if len(coords) == 0:
+                continue
+
+            seen = None
+            for coord in coords:
+                peers = set( self.get_peers( coord ) )
+                seen = peers if seen is None else seen & peers
+
+            for coord in seen:
+                if not coord in group["coords"]:
+                    self.remove_possibility( coord, val )
+
+    ##### 45 RULE FUNCTIONS #######################################
+
+    # Every full group adds up to 1 + 2 + ... + dim
+    # Innies: the cells of a group outside the cages it contains add up to the rest of its total
+    # Outies: the cells outside a group of the cages that cover it add up to the amount those cages go over its total
+    # Either set, when small enough, becomes a "sum" group with that total
+    def set_sum_groups(self):
+        group_total = int( self.dim * (self.dim+1) / 2 )
+        cage_of = {}
+        for cage in self.groups["arithmetic"]:
+            if not "total" in cage["properties"]:
+                continue
+            for coord in cage["coords"]:
+                cage_of[coord] = cage
+
+        # Innies or outies -> (region, total)
+        regions = {}
+        for group_type in [ "row", "column", "subgrid" ]:
+            if not group_type in self.groups:
+                continue
+
+            for group in self.groups[group_type].flatten():
+                coords = set( group["coords"] )
+                if len(coords) != self.dim:
+                    continue
+
+                cages = []
+                for coord in coords:
+                    if coord in cage_of and not any( cage is cage_of[coord] for cage in cages ):
+                        cages.append( cage_of[coord] )
+                inside = [ cage for cage in cages if set( cage["coords"] ) <= coords ]
+
+                innies = coords - set( coord for cage in inside for coord in cage["coords"] )
+                regions[ frozenset(innies) ] = ( "innies", group_total - sum( cage["properties"]["total"] for cage in inside ) )
+
+                if all( coord in cage_of for coord in coords ):
+                    outies = set( coord for cage in cages for coord in cage["coords"] ) - coords
+                    regions[ frozenset(outies) ] = ( "outies", sum( cage["properties"]["total"] for cage in cages ) - group_total )
+
+        # Regions that are empty, too large, or already a cage add nothing
+        cages = set( frozenset( cage["coords"] ) for cage in self.groups["arithmetic"] )
+        sum_groups = []
+        for coords in regions:
+            if len(coords) == 0 or len(coords) > self.max_region_size or coords in cages:
+                continue
+
+            group = {}
+            group["coords"] = sorted( coords, key=lambda coord : ( coord[1], coord[0] ) )
+            group["functions"] = [ self.cull_possibilities ]
+            region, total = regions[coords]
+            group["properties"] = { "region" : region, "total" : total }
+            sum_groups.append( group )
+
+        self.groups["sum"] = np.repeat( None, len(sum_groups) )
+        for ind in range(len(sum_groups)):
+            self.groups["sum"][ind] = sum_groups[ind]
@@ -1,6 +1,17 @@
 from .RelationalSudoku import RelationalSudoku
+import numpy as np
 
 class Kropki(RelationalSudoku):
+    # The dots are table lookups, cheap enough to run with the hidden singles
+    strategy_tiers = [ [ "hidden_singles", "relations" ], [ "N_of_N_possibilities" ], [ "N_of_N_counts" ] ]
+
+    # Tables from a candidate mask to the mask of values with a partner in it, shared by every puzzle
+    # Keyed by (symbol, dimension), see get_support_table
+    support_tables = {}
+
+    # Largest dimension given a full table (2 ** dim entries), larger puzzles OR together the support of each value
+    max_table_dimension = 16
+
     def __init__(self, dimension=9):
         self.initialize_sudoku(dimension)
     
@@ -23,93 +34,72 @@ class Kropki(RelationalSudoku):
 
     # Black dot indicates a factor of 2 relation
     def black_dot(self, coord1, coord2):
-        x1, y1 = coord1
-        x2, y2 = coord2
-
-        if self.solved[y1,x1]:
-            return
+        return self.apply_support( "B", coord1, coord2 )
 
-        values1 = self.possible[y1,x1]
-        values2 = self.possible[y2,x2]
-
-        if self.solved[y2,x2]:
-            values2 = set()
-            values2.add( self.grid[y2,x2] )
-
-        remaining = set()
-        # Everything in values1 must be a factor of two of something in values2
-        for val in values2:
-            remaining |= self.factor_two( val )
-        # Of the factors of 2 of the values in values2,
-        # only the results already present in values1 can work
-        remaining &= values1
-
-        return remaining
-    
+    # White dot indicates a difference of 1
     def white_dot(self, coord1, coord2):
-        x1, y1 = coord1
-        x2, y2 = coord2
-        
-        if self.solved[y1,x1]:
-            return
-
-        values1 = self.possible[y1,x1]
-        values2 = self.possible[y2,x2]
-
-        if self.solved[y2,x2]:
-            values2 = set()
-            values2.add( self.grid[y2,x2] )
-
-        remaining = set()
-        # Everything in values1 must be one off of something in values2
-        for val in values2:
-            remaining |= self.difference_one( val )
-        # Of the factors of 2 of the values in values2,
-        # only the results already present in values1 can work
-        remaining &= values1
-
-        return remaining
-    
+        return self.apply_support( "W", coord1, coord2 )
+
+    # No dot means neither relation holds (and the values differ)
     def blank_relation(self, coord1, coord2):
+        return self.apply_support( ".", coord1, coord2 )
+
+    # Values of coord1 supported by some value of coord2, as one lookup into the table of the dot between them
+    def apply_support(self, symbol, coord1, coord2):
         x1, y1 = coord1
         x2, y2 = coord2
-        
-        if self.solved[y1,x1]:
-            return
-
-        values1 = self.possible[y1,x1]
-        values2 = self.possible[y2,x2]
-
-        if self.solved[y2,x2]:
-            values2 = set()
-            values2.add( self.grid[y2,x2] )
-
-        remaining = set()
-        # The final result in values1 can neither be off by one nor a factor of two
-        # different from the final result in values2
-        for val in values2:
-            seed = set([val])       # For each value we look at, that value could not be included
-            seed |= self.difference_one( val )
-            seed |= self.factor_two( val )
-            # Only values that don't satisfy either of the above are possible
-            remaining |= self.values - seed
-    
-        remaining &= values1
 
-        return remaining
+        values1 = self.value_to_bit( self.grid[y1,x1] ) if self.solved[y1,x1] else int( self.possible[y1,x1] )
+        values2 = self.value_to_bit( self.grid[y2,x2] ) if self.solved[y2,x2] else int( self.possible[y2,x2] )
+
+        table = self.get_support_table( symbol )
+        if table is None:
+            return self.get_support( symbol, values2 ) & values1
+        return table[values2] & values1
+
+    ##### SUPPORT TABLES #######################################
+
+    # Mask of the values that can sit across the dot from value
+    def get_value_support(self, symbol, value):
+        if symbol == "B":
+            return self.values_to_mask( self.factor_two(value) )
+        elif symbol == "W":
+            return self.values_to_mask( self.difference_one(value) )
+        seed = set([value]) | self.difference_one(value) | self.factor_two(value)
+        return self.full_mask & ~self.values_to_mask( seed )
+
+    # Table indexed by the neighbour's candidate mask, or None if the puzzle is too large for one
+    # Built a bit at a time: the entries with bit i set are the entries below 1 << i with the support of value i+1 added
+    def get_support_table(self, symbol):
+        if self.dim > self.max_table_dimension:
+            return None
+
+        key = ( symbol, self.dim )
+        if not key in Kropki.support_tables:
+            table = np.zeros( 1 << self.dim ).astype(int)
+            for i in range(self.dim):
+                table[ 1 << i : 1 << (i+1) ] = table[ : 1 << i ] | self.get_value_support( symbol, i+1 )
+            Kropki.support_tables[key] = table.tolist()
+        return Kropki.support_tables[key]
+
+    def get_support(self, symbol, mask):
+        support = 0
+        for val in self.mask_to_values( mask ):
+            support |= self.get_value_support( symbol, val )
+        return support
 
     def factor_two(self, value):
-        results = set( [ value*2, value/2 ] )
         final = set()
-        for num in results:
-            if ( num == int(num) ) and ( num >= min(self.values) ) and ( num <= max(self.values) ):
-                final.add( int(num) )
+        if value*2 <= self.dim:
+            final.add( int( value*2 ) )
+        if value % 2 == 0 and value >= 2:
+            final.add( int( value/2 ) )
         return final
     
     def difference_one(self, value):
-        results = set( [ int(value - 1), int(value + 1) ] )
         final = set()
-        for num in results:
-            if isinstance(num, int) and num >= min(self.values) and num <= max(self.values):
-                final.add(num)
-        return final
\ No newline at end of file
+        if value - 1 >= 1:
+            final.add( int( value - 1 ) )
+        if value + 1 <= self.dim:
+            final.add( int( value + 1 ) )
+        return final
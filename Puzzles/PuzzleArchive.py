@@ -0,0 +1,277 @@
+import numpy as np
+
+class PuzzleArchive:
+    # Fixed record binary file of puzzles of one type and size, opened with numpy.memmap
+    # Records are only read when they are indexed, so any puzzle of a large archive can be loaded without reading the rest
+    #
+    # The file starts with a HEADER_SIZE byte header:
+    #   magic               -> MAGIC (8 bytes)
+    #   version             -> uint8
+    #   dimension           -> uint8
+    #   subgrid shape       -> uint8 rows, uint8 columns (0, 0 for none)
+    #   fields              -> uint8 flags of the fields stored, see FIELDS
+    #   count               -> uint64 number of records, at byte 16
+    #   record size         -> uint32 bytes per record
+    #   type                -> Class name of the puzzles, UTF-8 padded with zeros to 32 bytes, at byte 32
+    # followed by the records, record i starting at byte HEADER_SIZE + i * record size
+    #
+    # Each record holds the fields the archive was written with:
+    #   grid                -> uint8 (dim, dim), 0 for unsolved cells
+    #   possible            -> (dim, dim) candidate masks, as AbstractSudoku.possible
+    #   relations           -> uint8 (2*dim-1, dim) codes of RELATION_SYMBOLS, laid out as RelationalSudoku.load_relations
+    #   cages               -> uint16 (dim, dim) cage of each cell, 1 up (0 for none),
+    #                          with int32 cage_totals (-1 for none) and uint8 cage_operations codes of OPERATION_SYMBOLS, one per cage
+    MAGIC = b"SUDOKUPZ"
+    VERSION = 1
+    HEADER_SIZE = 64
+
+    FIELDS = [ "grid", "possible", "relations", "cages" ]
+    RELATION_SYMBOLS = [ "", "<", ">", "^", "v", "B", "W", "." ]
+    # Other spellings the puzzles accept, stored as the symbol they mean
+    RELATION_ALIASES = { "V" : "v" }
+    OPERATION_SYMBOLS = [ "", "+", "-", "*", "/" ]
+    OPERATION_NAMES = [ None, "add_all", "subtract_all", "multiply_all", "divide_all" ]
+
+    def __init__(self, f_name):
+        self.f_name = f_name
+
+        with open( f_name, "rb" ) as f:
+            header = f.read( self.HEADER_SIZE )
+        if len(header) < self.HEADER_SIZE or header[:len(self.MAGIC)] != self.MAGIC:
+            raise ValueError( "{} is not a puzzle archive".format(f_name) )
+        if header[8] != self.VERSION:
+            raise ValueError( "{} is version {} of the archive format, expected {}".format( f_name, header[8], self.VERSION ) )
+
+        self.dim = header[9]
+        self.subgrid_shape = ( header[10], header[11] ) if header[10] > 0 else None
+        self.fields = [ self.FIELDS[i] for i in range(len(self.FIELDS)) if header[12] & ( 1 << i ) ]
+        self.count = int( np.frombuffer( header, dtype="<u8", count=1, offset=16 )[0] )
+        self.puzzle_type = header[32:64].rstrip( b"\0" ).decode( "utf-8" )
+
+        self.record_dtype = self.get_record_dtype( self.dim, self.fields )
+        record_size = int( np.frombuffer( header, dtype="<u4", count=1, offset=24 )[0] )
+        if record_size != self.record_dtype.itemsize:
+            raise ValueError( "{} has records of {} bytes, expected {}".format( f_name, record_size, self.record_dtype.itemsize ) )
+
+        self.records = None
+        if self.count > 0:
+            self.records = np.memmap( f_name, dtype=self.record_dtype, mode="r", offset=self.HEADER_SIZE, shape=(self.count,) )
+
+    def __len__(self):
+        return self.count
+
+    # Record i, a view into the file
+    def __getitem__(self, i):
+        if self.records is None:
+            raise IndexError( "archive is empty" )
+        return self.records[i]
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self.get_spec(i)
+
+    @staticmethod
+    def get_record_dtype(dimension, fields):
+        mask_dtype = "<u2" if dimension <= 16 else ( "<u4" if dimension <= 32 else "<u8" )
+        layout = {
+            "grid" : [ ("grid", "u1", (dimension, dimension)) ],
+            "possible" : [ ("possible", mask_dtype, (dimension, dimension)) ],
+            "relations" : [ ("relations", "u1", (2*dimension - 1, dimension)) ],
+            "cages" : [ ("cages", "<u2", (dimension, dimension)), ("cage_totals", "<i4", (dimension*dimension,)), ("cage_operations", "u1", (dimension*dimension,)) ],
+        }
+        return np.dtype( [ field for name in fields for field in layout[name] ] )
+
+    ##### READING FUNCTIONS ######################################
+
+    # Record i as the dict PuzzleReader yields and BatchSolver.solve_puzzle takes,
+    # with "dimension" and whichever of "grid", "relations" and "blobs" were stored
+    # Candidates aren't part of a spec, load_puzzle restores them
+    def get_spec(self, i):
+        record = self[i]
+        spec = { "dimension" : self.dim }
+
+        if "grid" in self.fields:
+            spec["grid"] = np.array( record["grid"] ).astype(int)
+        if "relations" in self.fields:
+            symbols = np.array( self.RELATION_SYMBOLS, dtype=object )
+            spec["relations"] = symbols[ record["relations"] ]
+        if "cages" in self.fields:
+            spec["blobs"] = self.get_blob_grid( record )
+
+        return spec
+
+    # Cages as the "key:total:operation" grid read by KenKen.parse_blobs
+    def get_blob_grid(self, record):
+        blobs = np.repeat( "", self.dim*self.dim ).reshape( (self.dim, self.dim) ).astype(object)
+        for y in range(self.dim):
+            for x in range(self.dim):
+                cage = int( record["cages"][y,x] )
+                if cage == 0:
+                    continue
+
+                total = int( record["cage_totals"][cage-1] )
+                operation = self.OPERATION_SYMBOLS[ record["cage_operations"][cage-1] ]
+                cell = str(cage)
+                if total >= 0:
+                    cell += ":{}".format(total)
+                    if operation != "":
+                        cell += ":{}".format(operation)
+                blobs[y,x] = cell
+        return blobs
+
+    # Build puzzle i with load_grid, load_relations and load_blobs, then take away the candidates it had when it was stored
+    # Params:
+    #   puzzle              -> Puzzle to load into, a new one of the stored type if None.
+    #                          Whatever it held before is cleared, so one puzzle can be reused for every record
+    def load_puzzle(self, i, puzzle=None):
+        if puzzle is None:
+            puzzle = self.new_puzzle()
+
+        # load_grid sets the cages back up, which would remove the new givens from the old cages
+        # (the relations are reset by load_grid itself)
+        if hasattr( puzzle, "blobs" ):
+            puzzle.blobs = {}
+
+        spec = self.get_spec(i)
+        puzzle.load_grid( spec.get( "grid", np.zeros( (self.dim, self.dim) ).astype(int) ) )
+        if "relations" in spec:
+            puzzle.load_relations( spec["relations"] )
+        if "blobs" in spec:
+            puzzle.parse_blobs( spec["blobs"] )
+            puzzle.load_blobs()
+
+        if "possible" in self.fields:
+            possible = self[i]["possible"]
+            for y in range(self.dim):
+                for x in range(self.dim):
+                    if not puzzle.solved[y,x]:
+                        puzzle.eliminate( (x,y), int( puzzle.possible[y,x] ) & ~int( possible[y,x] ) )
+            puzzle.propagate()
+
+        return puzzle
+
+    def new_puzzle(self):
+        from .BatchSolver import PUZZLE_TYPES
+        classes = { cls.__name__ : cls for cls in PUZZLE_TYPES.values() }
+        if not self.puzzle_type in classes:
+            raise ValueError( "{} not supported".format( self.puzzle_type ) )
+
+        cls = classes[ self.puzzle_type ]
+        if self.subgrid_shape is None and cls.__name__ in [ "Sudoku", "KenKen", "KillerSudoku" ]:
+            return cls( dimension=self.dim, subgrid_shape=None )
+        if not self.subgrid_shape is None:
+            return cls( dimension=self.dim, subgrid_shape=self.subgrid_shape )
+        return cls( dimension=self.dim )
+
+    ##### WRITING FUNCTIONS ######################################
+
+    # Write puzzles of the same type and size to an archive, one record at a time
+    # Params:
+    #   f_name              -> File to write
+    #   puzzles             -> Iterable of puzzles
+    #   fields              -> Fields to store, by default the grid and candidates, plus the relations and cages the puzzles have
+    # Returns:
+    #   count               -> Number of puzzles written
+    @classmethod
+    def write(cls, f_name, puzzles, fields=None):
+        count = 0
+        first = None
+        with open( f_name, "wb" ) as f:
+            f.write( bytes( cls.HEADER_SIZE ) )
+
+            for puzzle in puzzles:
+                if count == 0:
+                    first = puzzle
+                    if fields is None:
+                        fields = cls.get_fields( puzzle )
+                    record_dtype = cls.get_record_dtype( puzzle.dim, fields )
+                elif puzzle.dim != first.dim or type(puzzle) != type(first):
+                    raise ValueError( "Puzzle {} is a {}x{} {}, the archive holds {}x{} {}".format(
+                        count, puzzle.dim, puzzle.dim, type(puzzle).__name__, first.dim, first.dim, type(first).__name__ ) )
+
+                f.write( cls.encode( puzzle, record_dtype ).tobytes() )
+                count += 1
+
+            # The header is written last, once the count is known
+            f.seek(0)
+            f.write( cls.get_header( first, fields, count ) )
+
+        return count
+
+    # Relations and cages are stored when the puzzle has them
+    @classmethod
+    def get_fields(cls, puzzle):
+        fields = [ "grid", "possible" ]
+        if not getattr( puzzle, "relation_grid", None ) is None:
+            fields.append( "relations" )
+        if len( getattr( puzzle, "blobs", {} ) ) > 0:
+            fields.append( "cages" )
+        return fields
+
+    # An archive without puzzles has no type or size, only the count of 0
+    @classmethod
+    def get_header(cls, puzzle, fields, count):
+        header = bytearray( cls.HEADER_SIZE )
+        header[:len(cls.MAGIC)] = cls.MAGIC
+        header[8] = cls.VERSION
+        header[16:24] = np.array( [ count ], dtype="<u8" ).tobytes()
+        if puzzle is None:
+            return bytes( header )
+
+        header[9] = puzzle.dim
+        subgrid_shape = puzzle.get_subgrid_shape()
+        if not subgrid_shape is None:
+            header[10], header[11] = subgrid_shape
+
+        header[12] = sum( 1 << cls.FIELDS.index(name) for name in fields )
+        header[24:28] = np.array( [ cls.get_record_dtype( puzzle.dim, fields ).itemsize ], dtype="<u4" ).tobytes()
+
+        name = type(puzzle).__name__.encode( "utf-8" )
+        header[32:32+len(name)] = name
+        return bytes( header )
+
+    @classmethod
+    def encode(cls, puzzle, record_dtype):
+        record = np.zeros( 1, dtype=record_dtype )[0]
+        fields = record_dtype.names
+
+        if "grid" in fields:
+            record["grid"] = puzzle.grid
+        if "possible" in fields:
+            record["possible"] = puzzle.possible
+        if "relations" in fields:
+            record["relations"] = cls.encode_relations( puzzle )
+        if "cages" in fields:
+            cls.encode_cages( puzzle, record )
+
+        return record
+
+    # Codes of the relation symbols the puzzle was loaded with, blank where the grid leaves them out
+    @classmethod
+    def encode_relations(cls, puzzle):
+        codes = np.zeros( (2*puzzle.dim - 1, puzzle.dim), dtype="u1" )
+        relation_grid = puzzle.relation_grid
+        for j in range( min( len(relation_grid), len(codes) ) ):
+            for i in range( min( len(relation_grid[j]), puzzle.dim ) ):
+                symbol = str( relation_grid[j][i] ).strip()
+                symbol = cls.RELATION_ALIASES.get( symbol, symbol )
+                if not symbol in cls.RELATION_SYMBOLS:
+                    raise ValueError( "Relation symbol {} can't be stored".format( repr(symbol) ) )
+                codes[j,i] = cls.RELATION_SYMBOLS.index( symbol )
+        return codes
+
+    @classmethod
+    def encode_cages(cls, puzzle, record):
+        record["cage_totals"] = -1
+        cage = 0
+        for key in puzzle.blobs:
+            blob = puzzle.blobs[key]
+            cage += 1
+            for x,y in blob["coords"]:
+                record["cages"][y,x] = cage
+
+            properties = blob["properties"]
+            if "total" in properties:
+                record["cage_totals"][cage-1] = properties["total"]
+            if "operation" in properties:
+                record["cage_operations"][cage-1] = cls.OPERATION_NAMES.index( properties["operation"].__name__ )
@@ -0,0 +1,150 @@
+import numpy as np
+
+class PuzzleReader:
+    # Reads puzzles one at a time from files holding many of them, without pandas
+    # Only the current line (or record) is kept in memory
+    #
+    # Two formats are understood:
+    #   Line format     -> One puzzle per line, one character per cell, row by row.
+    #                      "0" or "." for blanks, 1-9 then A-Z for 10 and up (e.g. 81 characters for a 9x9).
+    #                      Anything after the first space or comma on the line (ratings, solutions) is ignored,
+    #                      and a header line (e.g. "quizzes,solutions") before the first puzzle is skipped.
+    #   Record format   -> Puzzles separated by blank lines. Each record is made of sections of comma separated rows,
+    #                      each section started by a line naming it ("grid", "relations" or "blobs").
+    #                      The grid uses 0 or nothing for blanks, relations use the layout of RelationalSudoku.load_relations
+    #                      and blobs the "key:total:operation" cells of KenKen.parse_blobs.
+    #                      A record that starts without a section name starts with its grid.
+    # Lines starting with # are comments in both formats
+    #
+    # A puzzle that can't be parsed raises ValueError, or with yield_errors the ValueError is yielded in its place
+    # and reading goes on with the next one
+    SECTIONS = [ "grid", "relations", "blobs" ]
+    CHARACTERS = set( "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ." )
+
+    def __init__(self, f_name, yield_errors=False):
+        self.f_name = f_name
+        self.yield_errors = yield_errors
+
+    # Read in whichever format the file is written in
+    def __iter__(self):
+        if self.is_record_format():
+            return self.read_records()
+        return self.read_lines()
+
+    def open(self):
+        return open( self.f_name, encoding="utf-8-sig" )
+
+    # Record format files start with a section name or a row of comma separated cells,
+    # where a line format file starts with a puzzle of a square number of cells (after any header line)
+    def is_record_format(self):
+        with self.open() as f:
+            for line in f:
+                line = line.strip()
+                if line == '' or line.startswith('#'):
+                    continue
+
+                if line.lower() in self.SECTIONS:
+                    return True
+                field = self.get_first_field( line )
+                if self.is_puzzle_field( field ) and len(field) >= 4 and self.is_square( len(field) ):
+                    return False
+                cells = [ cell.strip() for cell in line.split(",") ]
+                if len(cells) > 1 and all( cell == "" or cell == "." or cell.isdigit() for cell in cells ):
+                    return True
+        return False
+
+    # Yield a (dim, dim) grid for every line of a line format file
+    def read_lines(self):
+        with self.open() as f:
+            first = True
+            for number, line in enumerate(f):
+                line = line.strip()
+                if line == '' or line.startswith('#'):
+                    continue
+
+                # A header names the columns with characters no puzzle uses
+                if first and not self.is_puzzle_field( self.get_first_field( line ) ):
+                    first = False
+                    continue
+                first = False
+                yield self.parse( self.parse_line, line, number+1 )
+
+    # Parse one puzzle, handing back the error instead of raising it with yield_errors
+    def parse(self, func, *args):
+        try:
+            return func( *args )
+        except ValueError as e:
+            if not self.yield_errors:
+                raise
+            return e
+
+    def get_first_field(self, line):
+        return line.replace( ",", " " ).split()[0]
+
+    def is_puzzle_field(self, field):
+        return set( field ) <= self.CHARACTERS
+
+    def is_square(self, n):
+        dim = int( round( n ** 0.5 ) )
+        return dim * dim == n
+
+    def parse_line(self, line, number=None):
+        cells = self.get_first_field( line )
+        if not self.is_square( len(cells) ):
+            raise ValueError( "Line {}: {} cells is not a square grid".format( number, len(cells) ) )
+        dim = int( round( len(cells) ** 0.5 ) )
+
+        values = [ 0 if c in "0." else int( c, 36 ) for c in cells ]
+        return np.array( values ).reshape( (dim, dim) )
+
+    # Yield a dict for every record with "dimension" and whichever of "grid", "relations" and "blobs" it holds
+    def read_records(self):
+        with self.open() as f:
+            sections = {}
+            section = "grid"
+
+            for line in f:
+                line = line.strip()
+                if line.startswith('#'):
+                    continue
+
+                if line == '':
+                    if len(sections) > 0:
+                        yield self.parse( self.parse_record, sections )
+                    sections = {}
+                    section = "grid"
+                elif line.lower() in self.SECTIONS:
+                    section = line.lower()
+                else:
+                    if not section in sections:
+                        sections[section] = []
+                    sections[section].append( [ cell.strip() for cell in line.split(",") ] )
+
+            if len(sections) > 0:
+                yield self.parse( self.parse_record, sections )
+
+    def parse_record(self, sections):
+        record = {}
+
+        if "grid" in sections:
+            rows = sections["grid"]
+            record["grid"] = np.array( [ [ int(cell) if not cell in [ "", "." ] else 0 for cell in row ] for row in rows ] )
+            record["dimension"] = len(rows)
+        if "blobs" in sections:
+            record["blobs"] = np.array( sections["blobs"] ).astype(object)
+            record["dimension"] = len( sections["blobs"] )
+        if "relations" in sections:
+            rows = sections["relations"]
+            dim = record.get( "dimension", int( ( len(rows) + 1 ) / 2 ) )
+            record["relations"] = self.pad_rows( rows, dim )
+            record["dimension"] = dim
+
+        return record
+
+    # Relation rows between left and right cells may leave out their last (empty) cell
+    def pad_rows(self, rows, width):
+        relations = np.repeat( "", len(rows)*width ).reshape( (len(rows), width) ).astype(object)
+        for j in range(len(rows)):
+            for i in range( min( len(rows[j]), width ) ):
+                relations[j,i] = rows[j][i]
+        return relations
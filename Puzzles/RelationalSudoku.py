@@ -1,20 +1,28 @@
 from .AbstractSudoku import AbstractSudoku
 import numpy as np
-import pandas as pd
-from copy import deepcopy
 
 class RelationalSudoku(AbstractSudoku):
     def __init__(self, dimension=9):
         self.initialize_sudoku(dimension)
 
     # In addition to parent class functions, add relations
-    def initialize_sudoku(self, dimension):
-        super().initialize_sudoku(dimension)
+    def initialize_sudoku(self, dimension, setup_groups=True, subgrid_shape=None):
+        super().initialize_sudoku(dimension, setup_groups, subgrid_shape)
         self.relations = []
+
+        # Symbols the relations were loaded from, kept so the puzzle can be written back out (see PuzzleArchive)
+        self.relation_grid = None
+
+        # Relations of each cell, see get_relation_index
+        self.relation_index = None
+
+        # Cells whose candidates changed since the relations depending on them were last applied
+        self.dirty_cells = set()
     
     def read_relations_from_csv(self, f_name):
         # Does not need to have the full (2*dim-1, dim) size
         # Will read up to as many relations as there are
+        import pandas as pd
         symbols = np.array( pd.read_csv( f_name, header=None, index_col=None, keep_default_na=False ) )
         return symbols
     
@@ -32,6 +40,8 @@ class RelationalSudoku(AbstractSudoku):
     # Odd rows can have dim elements and represent relations between up and down
     def load_relations(self, relation_grid):
         self.relations = []
+        self.relation_index = None
+        self.relation_grid = relation_grid
 
         rows, columns = relation_grid.shape
         for j in range(rows):
@@ -56,24 +66,79 @@ class RelationalSudoku(AbstractSudoku):
                 self.relations.append( [ (x1, y1), self.map_symbol_to_function(symbol), (x2, y2) ] )
                 self.relations.append( [ (x2, y2), self.map_symbol_to_function( self.invert_symbol(symbol) ), (x1, y1) ] )
 
+                # Every relation gets applied at least once
+                self.dirty_cells.add( (x1, y1) )
+                self.dirty_cells.add( (x2, y2) )
+
+    def mark_dirty(self, coord):
+        super().mark_dirty( coord )
+        self.dirty_cells.add( coord )
+
+    # Map from each cell to the (coord1, func) of the relations that read its candidates (where it is coord2)
+    def get_relation_index(self):
+        if self.relation_index is None:
+            self.relation_index = {}
+            for coord1, func, coord2 in self.relations:
+                if not coord2 in self.relation_index:
+                    self.relation_index[coord2] = []
+                self.relation_index[coord2].append( ( coord1, func ) )
+        return self.relation_index
+
     # The specific relation functions will be tailored to the implemented classes
-    # They will all take the two sets of possible values for coord1 and coord2
-    # And will return the subset of coord1 that remains possible after applying the relation
+    # They will all take the two coords whose candidate masks are compared
+    # And will return the mask of coord1's values that remain possible after applying the relation
     # Remove the complement of coord1's before and after from the possibilities of coord1
+    # A relation only needs to be applied again once the candidates of coord2 have changed, so as in AC-3
+    # dirty cells are taken off a queue one at a time and only their relations are applied
+    # Cells changed along the way join the queue, so the relations are consistent when it runs out
     def apply_relations(self):
-        for coord1, func, coord2 in self.relations:
-            x, y = coord1
+        index = self.get_relation_index()
 
-            if self.solved[y,x]:
-                continue
+        while self.dirty_cells and not self.contradiction:
+            coord2 = self.dirty_cells.pop()
 
-            prior = self.possible[y,x]
-            remainder = func( coord1, coord2 )
+            for coord1, func in index.get( coord2, [] ):
+                x, y = coord1
+                if self.solved[y,x]:
+                    continue
 
-            for value in prior - remainder:
-                self.remove_possibility( coord1, value )
+                if self.strategy_stats is None:
+                    self.apply_strategy( self.apply_relation, coord1, func, coord2, name=func.__name__ )
+                else:
+                    self.apply_counted_strategy( func.__name__, "relation", self.apply_relation, coord1, func, coord2 )
+
+    def apply_relation(self, coord1, func, coord2):
+        x, y = coord1
+        prior = int( self.possible[y,x] )
+        remainder = func( coord1, coord2 )
+
+        self.remove_possibilities( coord1, prior & ~remainder )
+
+    def checkpoint(self):
+        return ( super().checkpoint(), set( self.dirty_cells ) )
+
+    def rollback(self, checkpoint):
+        parent_checkpoint, dirty_cells = checkpoint
+        super().rollback( parent_checkpoint )
+        self.dirty_cells = set( dirty_cells )
+
+    def release(self, checkpoint):
+        super().release( checkpoint[0] )
+
+    # A relation between two solved cells holds if it leaves coord1's value possible
+    def is_valid(self):
+        if not super().is_valid():
+            return False
+
+        for coord1, func, coord2 in self.relations:
+            x1, y1 = coord1
+            x2, y2 = coord2
+            if self.solved[y1,x1] and self.solved[y2,x2] and not func( coord1, coord2 ):
+                return False
+        return True
 
-    def basic_loop(self):
-        self.apply_group_functions()
-        self.apply_relations()
-    
\ No newline at end of file
+    # The relations run in the tier of strategy_tiers named "relations"
+    def apply_group_functions(self, tier=0):
+        super().apply_group_functions( tier )
+        if self.get_strategy_tier( "relations" ) == tier:
+            self.apply_relations()
@@ -0,0 +1,150 @@
+import numpy as np
+
+class SolveTrace:
+    # Record of every change a solve makes to the candidates, one record per value, kept in a ring buffer
+    # Once capacity records have been made each new one overwrites the oldest, so memory stays fixed however long the solve
+    #
+    # Records are packed into 10 bytes:
+    #   pass                -> Pass of reduce the change was made in
+    #   strategy            -> Index of the strategy that made it in strategies ("given", "guess" and "backtrack" outside of strategies)
+    #   x, y                -> Cell
+    #   value               -> Value placed or candidate changed
+    #   kind                -> One of KINDS
+    # Backtracking records the changes it undoes, so replaying the records in order always gives the state they were made in
+    KINDS = [ "eliminated", "placed", "restored", "unplaced" ]
+    ELIMINATED, PLACED, RESTORED, UNPLACED = range(4)
+
+    record_dtype = np.dtype( [ ("pass", "<u4"), ("strategy", "<u2"), ("x", "u1"), ("y", "u1"), ("value", "u1"), ("kind", "u1") ] )
+
+    # Start of a dump, followed by the version
+    MAGIC = b"SUDOKUTRACE"
+    VERSION = 1
+
+    def __init__(self, capacity=65536):
+        self.capacity = capacity
+        self.records = np.zeros( capacity, dtype=self.record_dtype )
+
+        # Total records made, including the ones overwritten
+        self.count = 0
+
+        self.pass_number = 0
+        self.strategies = []
+        self.strategy_ids = {}
+        self.strategy = self.get_strategy_id( "given" )
+
+    def __len__(self):
+        return min( self.count, self.capacity )
+
+    # Records overwritten since the trace started
+    def dropped(self):
+        return self.count - len(self)
+
+    def get_strategy_id(self, name):
+        if not name in self.strategy_ids:
+            self.strategy_ids[name] = len(self.strategies)
+            self.strategies.append( name )
+        return self.strategy_ids[name]
+
+    # Attribute the records that follow to the named strategy
+    # Returns:
+    #   previous            -> Id of the strategy records were attributed to before, to hand back to restore_strategy
+    def set_strategy(self, name):
+        previous = self.strategy
+        self.strategy = self.get_strategy_id( name )
+        return previous
+
+    def restore_strategy(self, previous):
+        self.strategy = previous
+
+    # Add a record of the given kind for every value in mask
+    def record(self, kind, x, y, mask):
+        while mask:
+            bit = mask & -mask
+            self.records[ self.count % self.capacity ] = ( self.pass_number, self.strategy, x, y, bit.bit_length(), kind )
+            self.count += 1
+            mask ^= bit
+
+    def clear(self):
+        self.count = 0
+        self.pass_number = 0
+
+    ##### READING FUNCTIONS ######################################
+
+    # Records kept, oldest first
+    def get_records(self):
+        if self.count <= self.capacity:
+            return self.records[:self.count].copy()
+
+        start = self.count % self.capacity
+        return np.concatenate( [ self.records[start:], self.records[:start] ] )
+
+    # Records kept as dicts with "pass", "strategy", "cell", "value" and "kind", oldest first
+    def get_events(self):
+        return [ { "pass" : int( record["pass"] ), "strategy" : self.strategies[ record["strategy"] ], "cell" : ( int( record["x"] ), int( record["y"] ) ),
+                   "value" : int( record["value"] ), "kind" : self.KINDS[ record["kind"] ] } for record in self.get_records() ]
+
+    # Apply the records kept to a puzzle, as it was when the oldest of them was made
+    # (a puzzle loaded with the same grid when nothing has been dropped)
+    # Params:
+    #   puzzle              -> Puzzle to change, only its grid, solved and possible are written
+    #   stop                -> Number of records to apply, all of them if None
+    # Returns:
+    #   puzzle              -> The puzzle, as it was after the last record applied
+    def replay(self, puzzle, stop=None):
+        for record in self.get_records()[:stop]:
+            x, y, value, kind = int( record["x"] ), int( record["y"] ), int( record["value"] ), int( record["kind"] )
+            bit = puzzle.value_to_bit( value )
+
+            if kind == self.ELIMINATED:
+                puzzle.possible[y,x] = int( puzzle.possible[y,x] ) & ~bit
+            elif kind == self.RESTORED:
+                puzzle.possible[y,x] = int( puzzle.possible[y,x] ) | bit
+            elif kind == self.PLACED:
+                puzzle.grid[y,x] = value
+                puzzle.solved[y,x] = True
+                puzzle.possible[y,x] = 0
+            else:
+                puzzle.grid[y,x] = 0
+                puzzle.solved[y,x] = False
+
+        return puzzle
+
+    ##### BINARY FUNCTIONS ######################################
+
+    # Write the records kept to a file:
+    #   MAGIC, version (uint8), capacity, records kept, records dropped (uint64 each), length of the strategy names (uint32),
+    #   the strategy names as newline separated UTF-8, then the records as packed by record_dtype
+    def dump(self, f_name):
+        names = "\n".join( self.strategies ).encode( "utf-8" )
+        with open( f_name, "wb" ) as f:
+            f.write( self.MAGIC )
+            f.write( np.array( [ self.VERSION ], dtype="u1" ).tobytes() )
+            f.write( np.array( [ self.capacity, len(self), self.dropped() ], dtype="<u8" ).tobytes() )
+            f.write( np.array( [ len(names) ], dtype="<u4" ).tobytes() )
+            f.write( names )
+            f.write( self.get_records().tobytes() )
+
+    @classmethod
+    def load(cls, f_name):
+        with open( f_name, "rb" ) as f:
+            if f.read( len(cls.MAGIC) ) != cls.MAGIC:
+                raise ValueError( "{} is not a solve trace".format(f_name) )
+            version = np.frombuffer( f.read(1), dtype="u1" )[0]
+            if version != cls.VERSION:
+                raise ValueError( "{} is version {} of the trace format, expected {}".format( f_name, version, cls.VERSION ) )
+
+            capacity, kept, dropped = [ int(n) for n in np.frombuffer( f.read(24), dtype="<u8" ) ]
+            length = int( np.frombuffer( f.read(4), dtype="<u4" )[0] )
+            names = f.read( length ).decode( "utf-8" )
+            records = np.frombuffer( f.read( kept * cls.record_dtype.itemsize ), dtype=cls.record_dtype )
+
+        trace = cls( capacity )
+        trace.strategies = names.split( "\n" ) if length > 0 else []
+        trace.strategy_ids = { trace.strategies[i] : i for i in range(len(trace.strategies)) }
+        trace.records[:kept] = records
+        trace.count = kept + dropped
+
+        # The oldest record kept goes back where get_records expects it
+        if dropped > 0:
+            trace.records = np.roll( trace.records, trace.count % capacity )
+        return trace
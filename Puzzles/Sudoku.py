@@ -1,5 +1,5 @@
-from setuptools import setup
 from .AbstractSudoku import AbstractSudoku
+from .DancingLinks import DancingLinks
 import numpy as np
 
 class Sudoku(AbstractSudoku):
@@ -18,24 +18,95 @@ class Sudoku(AbstractSudoku):
         if setup_groups:
             self.set_groups()
 
+    def get_subgrid_shape(self):
+        if self.subgrid_rows is None or self.subgrid_columns is None:
+            return None
+        return ( self.subgrid_rows, self.subgrid_columns )
+
     def set_groups(self):
         super().set_groups()
 
         if self.subgrid_rows is None or self.subgrid_columns is None:
             return
 
+        # Number of subgrids down and across
         grids_y, grids_x = ( int(self.dim/self.subgrid_rows), int(self.dim/self.subgrid_columns) )
         self.groups["subgrid"] = np.repeat( None, grids_x*grids_y ).reshape( (grids_y, grids_x) )
         for row in range(grids_y):
             for col in range(grids_x):
                 group = {}
                 group["coords"] = set()
-                group["functions"] = [ self.N_of_N_counts, self.N_of_N_possibilities ]
+                group["functions"] = [ self.hidden_singles, self.N_of_N_counts, self.N_of_N_possibilities, self.force_group ]
                 group["properties"] = {}
                 self.groups["subgrid"][row,col] = group
         
         for row in range(self.dim):
             for col in range(self.dim):
-                x = int( col / grids_x )
-                y = int( row / grids_y )
+                x = int( col / self.subgrid_columns )
+                y = int( row / self.subgrid_rows )
                 self.groups["subgrid"][y,x]["coords"].add( (col,row) )
+
+        # Rows and columns meet the subgrids in more than one cell, so values locked into those cells can be forced out of the rest
+        for group_type in [ "row", "column" ]:
+            for group in self.groups[group_type]:
+                group["functions"].append( self.force_group )
+
+    ##### EXACT COVER FUNCTIONS ################################
+
+    # Encode the puzzle as an exact cover problem
+    # Columns are "cell is filled" for every cell, and "value appears" for every value of every full group (rows, columns, subgrids)
+    # Rows are the (x, y, value) placements still possible in the current candidates
+    # Cage arithmetic and sums can't be encoded, so puzzles with cages (KenKen, Killer Sudoku) raise ValueError
+    def build_exact_cover(self):
+        for group_type in [ "arithmetic", "sum" ]:
+            if group_type in self.groups and len( self.groups[group_type] ) > 0:
+                raise ValueError( "{} groups can't be encoded as an exact cover problem".format(group_type) )
+
+        full_groups = [ group for group_type in self.groups for group in self.groups[group_type].flatten()
+                            if len( group["coords"] ) == self.dim and self.is_distinct( group_type ) ]
+
+        cell_columns = { (x,y) : y*self.dim + x for y in range(self.dim) for x in range(self.dim) }
+        offset = self.dim * self.dim
+        value_columns = { (x,y) : [] for (x,y) in cell_columns }
+        for ind in range(len(full_groups)):
+            for coord in full_groups[ind]["coords"]:
+                value_columns[coord].append( offset + ind*self.dim )
+
+        links = DancingLinks( offset + len(full_groups)*self.dim )
+        for y in range(self.dim):
+            for x in range(self.dim):
+                if self.solved[y,x]:
+                    values = [ self.grid[y,x] ]
+                else:
+                    values = self.mask_to_values( self.possible[y,x] )
+
+                for value in values:
+                    columns = [ cell_columns[(x,y)] ] + [ col + value - 1 for col in value_columns[(x,y)] ]
+                    links.add_row( (x, y, int(value)), columns )
+
+        return links
+
+    # Yield solved grids found with Dancing Links, up to limit of them
+    def exact_cover_solutions(self, limit=None):
+        for rows in self.build_exact_cover().solutions( limit ):
+            grid = np.zeros( (self.dim, self.dim) ).astype(int)
+            for x, y, value in rows:
+                grid[y,x] = value
+            yield grid
+
+    def count_exact_cover(self, limit=None):
+        return self.build_exact_cover().count_solutions( limit )
+
+    # Solve with Dancing Links rather than the rules and search, writing the solution into the grid
+    # Returns:
+    #   solved              -> False if the puzzle has no solution
+    def solve_exact_cover(self):
+        for grid in self.exact_cover_solutions( limit=1 ):
+            for y in range(self.dim):
+                for x in range(self.dim):
+                    if not self.solved[y,x]:
+                        self.pending.append( ( (x,y), grid[y,x] ) )
+            self.propagate()
+            return True
+
+        return False
@@ -0,0 +1,151 @@
+from .Sudoku import Sudoku
+import numpy as np
+
+class VectorizedSudoku:
+    # Many classic Sudoku puzzles of the same shape propagated at once with array operations
+    # candidates[n, c, v] is True while value v+1 is possible for cell c (= y*dim + x) of puzzle n
+    # Rows, columns and subgrids are taken from Sudoku.set_groups
+    def __init__(self, dimension=9, subgrid_shape=(3,3)):
+        self.dim = dimension
+        self.subgrid_shape = subgrid_shape
+        self.set_units()
+
+        self.candidates = np.zeros( (0, self.dim*self.dim, self.dim) ).astype(bool)
+        self.contradiction = np.zeros( 0 ).astype(bool)
+
+    # Each group type splits the grid into dim units of dim cells
+    # units[t] holds the cell indices of the units of type t, one unit per row
+    # inverse[t] sends cells listed in unit order back to their own index
+    def set_units(self):
+        puzzle = Sudoku( self.dim, subgrid_shape=self.subgrid_shape )
+        self.units = []
+        self.inverse = []
+
+        for group_type in puzzle.groups:
+            groups = puzzle.groups[group_type].flatten()
+            units = np.array( [ sorted( y*self.dim + x for x,y in group["coords"] ) for group in groups ] )
+            self.units.append( units )
+            self.inverse.append( np.argsort( units.flatten() ) )
+
+    # Grids are (N, dim, dim) with 0 for blanks
+    def load_grids(self, grids):
+        grids = np.asarray( grids ).astype(int).reshape( (-1, self.dim*self.dim) )
+        given = grids > 0
+
+        self.candidates = np.ones( ( len(grids), self.dim*self.dim, self.dim ) ).astype(bool)
+        values = np.arange( 1, self.dim+1 )
+        self.candidates[given] = ( grids[given][:,None] == values[None,:] )
+        self.contradiction = np.zeros( len(grids) ).astype(bool)
+
+    # Apply peer elimination, naked singles and hidden singles until nothing changes
+    # Only puzzles that are neither solved nor contradicted are worked on
+    # Returns:
+    #   passes              -> Number of passes made
+    def propagate(self, max_passes=None):
+        active = np.nonzero( ~self.contradiction & ~self.is_solved() )[0]
+        passes = 0
+
+        while len(active) > 0 and ( max_passes is None or passes < max_passes ):
+            passes += 1
+            candidates = self.candidates[active]
+            updated, contradiction = self.propagate_pass( candidates )
+
+            self.candidates[active] = updated
+            self.contradiction[active] |= contradiction
+
+            changed = np.any( updated != candidates, axis=(1,2) )
+            active = active[ changed & ~contradiction ]
+
+        return passes
+
+    def propagate_pass(self, candidates):
+        contradiction = np.zeros( len(candidates) ).astype(bool)
+        singles = candidates & ( candidates.sum( axis=2 ) == 1 )[:,:,None]
+
+        # Remove values placed in a unit from every other cell of that unit
+        eliminate = np.zeros( candidates.shape ).astype(bool)
+        for units, inverse in zip( self.units, self.inverse ):
+            unit_singles = singles[:,units,:]
+            placed = unit_singles.any( axis=2 )
+            contradiction |= np.any( unit_singles.sum( axis=2 ) > 1, axis=(1,2) )
+
+            spread = np.repeat( placed[:,:,None,:], self.dim, axis=2 ).reshape( candidates.shape )
+            eliminate |= spread[:,inverse,:]
+
+        candidates = candidates & ~( eliminate & ~singles )
+
+        # A value with only one place left in a unit goes there
+        hidden = np.zeros( candidates.shape ).astype(bool)
+        for units, inverse in zip( self.units, self.inverse ):
+            unit_candidates = candidates[:,units,:]
+            positions = unit_candidates.sum( axis=2 )
+            contradiction |= np.any( positions == 0, axis=(1,2) )
+
+            found = unit_candidates & ( positions == 1 )[:,:,None,:]
+            hidden |= found.reshape( candidates.shape )[:,inverse,:]
+
+        forced = hidden.any( axis=2 )
+        contradiction |= np.any( hidden.sum( axis=2 ) > 1, axis=1 )
+        candidates = np.where( forced[:,:,None], hidden, candidates )
+
+        contradiction |= np.any( candidates.sum( axis=2 ) == 0, axis=1 )
+        return candidates, contradiction
+
+    def is_solved(self):
+        return np.all( self.candidates.sum( axis=2 ) == 1, axis=1 ) & ~self.contradiction
+
+    # Indices of puzzles the rules could not finish
+    def stalled(self):
+        return np.nonzero( ~self.contradiction & ~self.is_solved() )[0]
+
+    # (N, dim, dim) grids with 0 in every cell that isn't down to one value
+    # Of every puzzle, or of the candidates given (e.g. a slice of them)
+    def get_grids(self, candidates=None):
+        if candidates is None:
+            candidates = self.candidates
+        values = np.argmax( candidates, axis=2 ) + 1
+        values[ candidates.sum( axis=2 ) != 1 ] = 0
+        return values.reshape( (-1, self.dim, self.dim) )
+
+    # (N, dim, dim) candidate bitmasks in the layout of AbstractSudoku.possible
+    def get_masks(self, candidates=None):
+        if candidates is None:
+            candidates = self.candidates
+        bits = 1 << np.arange( self.dim )
+        return ( candidates * bits ).sum( axis=2 ).reshape( (-1, self.dim, self.dim) )
+
+    # Scalar Sudoku holding the current state of puzzle n
+    # Only puzzle n is converted, so handing every stalled puzzle over stays linear in the batch size
+    def to_puzzle(self, n):
+        candidates = self.candidates[n:n+1]
+        puzzle = Sudoku( self.dim, subgrid_shape=self.subgrid_shape )
+        puzzle.load_grid( self.get_grids( candidates )[0] )
+
+        masks = self.get_masks( candidates )[0]
+        for y in range(self.dim):
+            for x in range(self.dim):
+                if not puzzle.solved[y,x]:
+                    puzzle.remove_possibilities( (x,y), puzzle.full_mask & ~int( masks[y,x] ) )
+
+        return puzzle
+
+    # Propagate everything together, then finish stalled puzzles one at a time with the scalar solver
+    # Returns:
+    #   grids               -> (N, dim, dim) solutions, unsolvable puzzles are left partly filled
+    def solve(self, search=True):
+        self.propagate()
+
+        for n in self.stalled():
+            puzzle = self.to_puzzle( n )
+            puzzle.reduce()
+            if search and not puzzle.is_solved():
+                puzzle.search()
+
+            # A search that finds nothing leaves the puzzle as it was, contradiction and all, so failing it is what counts
+            if puzzle.contradiction or ( search and not puzzle.is_solved() ):
+                self.contradiction[n] = True
+            elif puzzle.is_solved():
+                grid = puzzle.grid.reshape( -1 )
+                self.candidates[n] = grid[:,None] == np.arange( 1, self.dim+1 )[None,:]
+
+        return self.get_grids()
@@ -2,10 +2,22 @@ import unittest
 from AbstractSudoku import AbstractSudoku
 from Sudoku import Sudoku
 from Kropki import Kropki
+from Futoshiki import Futoshiki
 from KenKen import KenKen
+from KillerSudoku import KillerSudoku
+from BatchSolver import BatchSolver, PUZZLE_TYPES
+from VectorizedSudoku import VectorizedSudoku
+from PuzzleReader import PuzzleReader
+from PuzzleArchive import PuzzleArchive
 import numpy as np
 import pandas as pd
 import os
+import json
+import tempfile
+import multiprocessing
+
+# A 9x9 Sudoku the rules alone leave unsolved, so solving it takes a search
+HARD_GRID = np.array( [ [ int(c) for c in row ] for row in [ "100007090", "030020008", "009600500", "005300900", "010080002", "600004000", "300000010", "040000007", "007000300" ] ] )
 
 # Test methods in LogicPuzzle
 class AbstractSudokuTest(unittest.TestCase):
@@ -18,7 +30,7 @@ class AbstractSudokuTest(unittest.TestCase):
         for i in range(dim):
             for j in range(dim):
                 assert( not puzzle.solved[j,i] )
-                assert( puzzle.possible[j,i] == values )
+                assert( puzzle.get_possible((i,j)) == values )
                 assert( puzzle.grid[j,i] == 0 )
         
         puzzle.solve_cell( (4,6), 2 )
@@ -28,15 +40,15 @@ class AbstractSudokuTest(unittest.TestCase):
             for j in range(dim):
                 if (i,j) == (4,6):
                     assert( puzzle.solved[j,i] )
-                    assert( puzzle.possible[j,i] == set() )
+                    assert( puzzle.get_possible((i,j)) == set() )
                     assert( puzzle.grid[j,i] == 2 )
                 elif i == 4 or j == 6:
                     assert( not puzzle.solved[j,i] )
-                    assert( puzzle.possible[j,i] == lower_values )
+                    assert( puzzle.get_possible((i,j)) == lower_values )
                     assert( puzzle.grid[j,i] == 0 )
                 else:
                     assert( not puzzle.solved[j,i] )
-                    assert( puzzle.possible[j,i] == values )
+                    assert( puzzle.get_possible((i,j)) == values )
                     assert( puzzle.grid[j,i] == 0 )
 
     def test_remove_possibility(self):
@@ -47,7 +59,7 @@ class AbstractSudokuTest(unittest.TestCase):
         for i in range(dim):
             for j in range(dim):
                 assert( not puzzle.solved[j,i] )
-                assert( puzzle.possible[j,i] == values )
+                assert( puzzle.get_possible((i,j)) == values )
                 assert( puzzle.grid[j,i] == 0 )
         
         x,y = 4,6
@@ -57,11 +69,11 @@ class AbstractSudokuTest(unittest.TestCase):
                 for j in range(dim):
                     if (i,j) == (4,6):
                         assert( not puzzle.solved[j,i] )
-                        assert( puzzle.possible[j,i] == lower_values )
+                        assert( puzzle.get_possible((i,j)) == lower_values )
                         assert( puzzle.grid[j,i] == 0 )
                     else:
                         assert( not puzzle.solved[j,i] )
-                        assert( puzzle.possible[j,i] == values )
+                        assert( puzzle.get_possible((i,j)) == values )
                         assert( puzzle.grid[j,i] == 0 )
 
             puzzle.remove_possibility( (x,y), val+1 )
@@ -75,15 +87,15 @@ class AbstractSudokuTest(unittest.TestCase):
             for j in range(dim):
                 if (i,j) == (4,6):
                     assert( puzzle.solved[j,i] )
-                    assert( puzzle.possible[j,i] == set() )
+                    assert( puzzle.get_possible((i,j)) == set() )
                     assert( puzzle.grid[j,i] == 9 )
                 elif i == 4 or j == 6:
                     assert( not puzzle.solved[j,i] )
-                    assert( puzzle.possible[j,i] == lower_values )
+                    assert( puzzle.get_possible((i,j)) == lower_values )
                     assert( puzzle.grid[j,i] == 0 )
                 else:
                     assert( not puzzle.solved[j,i] )
-                    assert( puzzle.possible[j,i] == values )
+                    assert( puzzle.get_possible((i,j)) == values )
                     assert( puzzle.grid[j,i] == 0 )
 
     def test_N_of_N_counts(self):
@@ -101,27 +113,57 @@ class AbstractSudokuTest(unittest.TestCase):
 
         for i in range(dim):
             if i == 0 or i == 1:
-                assert( puzzle.possible[0,i] == set( [ 1,2 ] ) )
+                assert( puzzle.get_possible((i,0)) == set( [ 1,2 ] ) )
             else:
-                assert( puzzle.possible[0,i] == set( [ 3,4,5,6,7,8,9 ] ) )
+                assert( puzzle.get_possible((i,0)) == set( [ 3,4,5,6,7,8,9 ] ) )
+
+    def test_hidden_subsets(self):
+        # 1 can go in cells 0 and 1, 2 in cells 1 and 2, 3 in cells 0, 1 and 2
+        def make_puzzle():
+            puzzle = AbstractSudoku(dimension=9)
+            for i in range(3,9):
+                puzzle.remove_possibilities( (i,0), puzzle.values_to_mask( [1,2,3] ) )
+            puzzle.remove_possibility( (2,0), 1 )
+            puzzle.remove_possibility( (0,0), 2 )
+            return puzzle
+
+        puzzle = make_puzzle()
+        group = puzzle.groups["row"][0]
+        coords, positions = puzzle.get_position_masks( group )
+        assert( positions[1] == ( 1 << coords.index( (0,0) ) ) | ( 1 << coords.index( (1,0) ) ) )
+        assert( puzzle.popcount( positions[3] ) == 3 )
+        assert( puzzle.popcount( positions[4] ) == 9 )
+
+        # The three values have different frequencies but are still a hidden triple
+        puzzle.N_of_N_counts( group )
+        assert( puzzle.get_possible( (0,0) ) == set([1,3]) )
+        assert( puzzle.get_possible( (1,0) ) == set([1,2,3]) )
+        assert( puzzle.get_possible( (2,0) ) == set([2,3]) )
+        assert( puzzle.get_possible( (3,0) ) == set([4,5,6,7,8,9]) )
+
+        # Triples aren't looked for when the search stops at pairs
+        puzzle = make_puzzle()
+        puzzle.max_subset_size = 2
+        puzzle.N_of_N_counts( puzzle.groups["row"][0] )
+        assert( puzzle.get_possible( (1,0) ) == set(range(1,10)) )
 
     def test_N_of_N_possibilities(self):
         dim = 9
         puzzle = AbstractSudoku(dimension=dim)
         group = puzzle.groups["row"][0]
 
-        puzzle.possible[0,0] = set([1,2])
-        puzzle.possible[0,4] = set([1,2])
+        puzzle.possible[0,0] = puzzle.values_to_mask([1,2])
+        puzzle.possible[0,4] = puzzle.values_to_mask([1,2])
         puzzle.N_of_N_possibilities(group)
 
         for coord in group["coords"]:
             x,y = coord
             if coord == (0,0) or coord == (4,0):
-                assert( puzzle.possible[y,x] == set([1,2]) )
+                assert( puzzle.get_possible((x,y)) == set([1,2]) )
             else:
-                assert( len( puzzle.possible[y,x] ) == 7 )
-                assert( not 1 in puzzle.possible[y,x] )
-                assert( not 2 in puzzle.possible[y,x] )
+                assert( len( puzzle.get_possible((x,y)) ) == 7 )
+                assert( not 1 in puzzle.get_possible((x,y)) )
+                assert( not 2 in puzzle.get_possible((x,y)) )
 
     def test_force_group(self):
         puzzle = AbstractSudoku(9)
@@ -139,11 +181,11 @@ class AbstractSudokuTest(unittest.TestCase):
         for row in range(puzzle.dim):
             for col in range(puzzle.dim):
                 if (col, row) == (3,2):
-                    assert( puzzle.possible[row,col] == values )
+                    assert( puzzle.get_possible((col,row)) == values )
                 elif (col, row) in group1["coords"] or (col, row) in group2["coords"]:
-                    assert( puzzle.possible[row,col] == set([1,2,4,5,6,7,8,9]) )
+                    assert( puzzle.get_possible((col,row)) == set([1,2,4,5,6,7,8,9]) )
                 else:
-                    assert( puzzle.possible[row,col] == values )
+                    assert( puzzle.get_possible((col,row)) == values )
 
     def test_get_possibility_coords(self):
         dim = 9
@@ -222,6 +264,113 @@ class AbstractSudokuTest(unittest.TestCase):
             else:
                 assert( len( coord_sets[val] ) == 9 )
 
+    def test_masks(self):
+        puzzle = AbstractSudoku(dimension=9)
+
+        assert( puzzle.possible.dtype == np.uint16 )
+        assert( puzzle.possible.nbytes == 162 )
+        assert( puzzle.possible[0,0] == puzzle.full_mask )
+
+        mask = puzzle.values_to_mask( [2,5,9] )
+        assert( mask == 0b100010010 )
+        assert( puzzle.mask_to_values(mask) == [2,5,9] )
+        assert( puzzle.popcount(mask) == 3 )
+        assert( puzzle.bit_to_value( puzzle.lowest_bit(mask) ) == 2 )
+
+        puzzle.remove_possibility( (3,2), 5 )
+        assert( not puzzle.has_possibility( (3,2), 5 ) )
+        assert( puzzle.has_possibility( (3,2), 4 ) )
+
+        puzzle = AbstractSudoku(dimension=25)
+        assert( puzzle.possible.dtype == np.uint32 )
+
+    def test_propagate(self):
+        dim = 40
+        puzzle = AbstractSudoku(dimension=dim)
+
+        # Chain the first row so each placement forces the next one
+        for i in range(1, dim):
+            puzzle.possible[0,i] = puzzle.values_to_mask( [i, i+1] )
+
+        puzzle.solve_cell( (0,0), 1 )
+
+        for i in range(dim):
+            assert( puzzle.solved[0,i] )
+            assert( puzzle.grid[0,i] == i+1 )
+        assert( len(puzzle.pending) == 0 )
+        assert( not puzzle.contradiction )
+
+        puzzle = AbstractSudoku(dimension=4)
+        puzzle.remove_possibilities( (1,1), puzzle.values_to_mask( [1,2,3] ) )
+        assert( puzzle.grid[1,1] == 4 )
+        puzzle.remove_possibilities( (1,2), puzzle.values_to_mask( [1,2,3] ) )
+        assert( puzzle.contradiction )
+
+    def test_dirty_groups(self):
+        puzzle = AbstractSudoku(dimension=9)
+        puzzle.apply_group_functions()
+        assert( len(puzzle.dirty_groups) == 0 )
+
+        puzzle.remove_possibility( (2,5), 3 )
+        assert( len(puzzle.dirty_groups) == 2 )
+        assert( id( puzzle.groups["row"][5] ) in puzzle.dirty_groups )
+        assert( id( puzzle.groups["column"][2] ) in puzzle.dirty_groups )
+
+    def test_changes(self):
+        puzzle = AbstractSudoku(dimension=4)
+        assert( puzzle.changes == 0 )
+
+        puzzle.remove_possibility( (0,0), 1 )
+        assert( puzzle.changes == 1 )
+
+        # Removing a value that is already gone is not a change
+        puzzle.remove_possibility( (0,0), 1 )
+        assert( puzzle.changes == 1 )
+
+        # One placement, plus the removal of 2 from its peers
+        puzzle.solve_cell( (3,3), 2 )
+        assert( puzzle.changes == 1 + 1 + 6 )
+
+    def test_rollback(self):
+        puzzle = AbstractSudoku(dimension=9)
+        puzzle.remove_possibility( (0,0), 4 )
+
+        grid = puzzle.grid.copy()
+        solved = puzzle.solved.copy()
+        possible = puzzle.possible.copy()
+        checkpoint = puzzle.checkpoint()
+        length = len( puzzle.trail )
+
+        puzzle.solve_cell( (2,2), 7 )
+        puzzle.remove_possibilities( (0,2), puzzle.values_to_mask( [1,2,3,4,5,6,8] ) )
+        assert( puzzle.grid[2,0] == 9 )
+        assert( len( puzzle.trail ) > length )
+
+        puzzle.rollback( checkpoint )
+
+        assert( len( puzzle.trail ) == length )
+        assert( np.all( puzzle.grid == grid ) )
+        assert( np.all( puzzle.solved == solved ) )
+        assert( np.all( puzzle.possible == possible ) )
+
+        # Nothing is kept once the outermost checkpoint is done with
+        assert( not puzzle.recording and len( puzzle.trail ) == 0 )
+        puzzle.remove_possibility( (0,0), 5 )
+        assert( len( puzzle.trail ) == 0 )
+
+        # Inner checkpoints can be rolled back to again and again
+        outer = puzzle.checkpoint()
+        puzzle.remove_possibility( (1,1), 5 )
+        inner = puzzle.checkpoint()
+        for i in range(2):
+            puzzle.solve_cell( (2,2), 7 )
+            puzzle.rollback( inner )
+            assert( not puzzle.solved[2,2] and puzzle.recording )
+        puzzle.release( outer )
+        assert( not puzzle.recording and len( puzzle.trail ) == 0 )
+        assert( not puzzle.has_possibility( (1,1), 5 ) )
+        assert( not puzzle.contradiction )
+
     def test_remove_from_complement(self):
         dim = 9
         values = set([ i+1 for i in range(dim) ])
@@ -233,11 +382,11 @@ class AbstractSudokuTest(unittest.TestCase):
         for coord in group["coords"]:
             x,y = coord
             if coord == (0,0) or coord == (4,0):
-                assert( puzzle.possible[y,x] == values )
+                assert( puzzle.get_possible((x,y)) == values )
             else:
-                assert( len( puzzle.possible[y,x] ) == 7 )
-                assert( not 1 in puzzle.possible[y,x] )
-                assert( not 2 in puzzle.possible[y,x] )
+                assert( len( puzzle.get_possible((x,y)) ) == 7 )
+                assert( not 1 in puzzle.get_possible((x,y)) )
+                assert( not 2 in puzzle.get_possible((x,y)) )
 
 class RelationalSudokuTest(unittest.TestCase):
     pass
@@ -253,6 +402,25 @@ class KropkiTest(unittest.TestCase):
         assert( puzzle.factor_two(4) == set([2]) )
         assert( puzzle.factor_two(5) == set() )
     
+    def test_support_table(self):
+        puzzle = Kropki(6)
+        for symbol in [ "B", "W", "." ]:
+            table = puzzle.get_support_table( symbol )
+            assert( len(table) == 1 << 6 )
+            assert( table is Kropki(6).get_support_table( symbol ) )
+            for mask in range( 1 << 6 ):
+                assert( table[mask] == puzzle.get_support( symbol, mask ) )
+
+        assert( puzzle.get_support_table("B")[ puzzle.values_to_mask( [2,3] ) ] == puzzle.values_to_mask( [1,4,6] ) )
+        assert( puzzle.get_support_table("W")[ puzzle.values_to_mask( [1,6] ) ] == puzzle.values_to_mask( [2,5] ) )
+        assert( puzzle.get_support_table(".")[ puzzle.values_to_mask( [3] ) ] == puzzle.values_to_mask( [1,5] ) )
+
+        # Larger puzzles work out the support value by value
+        puzzle = Kropki(17)
+        assert( puzzle.get_support_table("B") is None )
+        puzzle.possible[0,1] = puzzle.values_to_mask( [8,17] )
+        assert( puzzle.black_dot( (0,0), (1,0) ) == puzzle.values_to_mask( [4,16] ) )
+
     def test_difference_one(self):
         puzzle = Kropki(5)
 
@@ -267,12 +435,12 @@ class KropkiTest(unittest.TestCase):
         puzzle = Kropki(dim)
         values = set([i+1 for i in range(dim)])
 
-        assert( puzzle.possible[0,0] == values )
-        assert( puzzle.possible[0,1] == values )
+        assert( puzzle.get_possible((0,0)) == values )
+        assert( puzzle.get_possible((1,0)) == values )
 
         result = puzzle.black_dot((0,0),(1,0))
 
-        assert( result == set( [1,2,4] ) )
+        assert( result == puzzle.values_to_mask( set( [1,2,4] ) ) )
 
     def test_white_dot(self):
         puzzle = Kropki(5)
@@ -281,48 +449,72 @@ class KropkiTest(unittest.TestCase):
         puzzle = Kropki(dim)
         values = set([i+1 for i in range(dim)])
 
-        assert( puzzle.possible[0,0] == values )
-        assert( puzzle.possible[0,1] == values )
+        assert( puzzle.get_possible((0,0)) == values )
+        assert( puzzle.get_possible((1,0)) == values )
 
         result = puzzle.white_dot((0,0),(1,0))
 
-        assert( result == values )
+        assert( result == puzzle.values_to_mask( values ) )
 
         puzzle.remove_possibility((1,0), 4)
         result = puzzle.white_dot((0,0),(1,0))
 
-        assert( result == set([1,2,3,4]) )
+        assert( result == puzzle.values_to_mask( set([1,2,3,4]) ) )
 
         puzzle.remove_possibility((1,0), 2)
         result = puzzle.white_dot((0,0),(1,0))
 
-        assert( result == set([2,4]) )
+        assert( result == puzzle.values_to_mask( set([2,4]) ) )
 
         puzzle.remove_possibility((1,0), 1)
         result = puzzle.white_dot((0,0),(1,0))
 
-        assert( result == set([2,4]) )      # Still have 3 adjacent to 2
+        assert( result == puzzle.values_to_mask( set([2,4]) ) )      # Still have 3 adjacent to 2
 
     def test_blank_relation(self):
         dim = 5
         puzzle = Kropki(dim)
 
-        puzzle.possible[0,1] = set([2,3])
+        puzzle.possible[0,1] = puzzle.values_to_mask([2,3])
         result = puzzle.blank_relation( (0,0), (1,0) )
 
-        assert( result == set([1,5]) )
+        assert( result == puzzle.values_to_mask( set([1,5]) ) )
 
         puzzle.solve_cell((1,0),3)
         result = puzzle.blank_relation( (0,0), (1,0) )
 
-        assert( result == set([1,5]) )
+        assert( result == puzzle.values_to_mask( set([1,5]) ) )
 
         puzzle = Kropki(dim)
 
         puzzle.solve_cell((1,0),2)
         result = puzzle.blank_relation( (0,0), (1,0) )
 
-        assert( result == set([5]) )
+        assert( result == puzzle.values_to_mask( set([5]) ) )
+
+    def test_relation_queue(self):
+        # White dots all along the first row
+        relations = np.repeat( "", 7*4 ).reshape( (7,4) ).astype(object)
+        for i in range(3):
+            relations[0,i] = "W"
+
+        puzzle = Kropki(4)
+        puzzle.load_relations( relations )
+        index = puzzle.get_relation_index()
+        assert( sorted( index[ (1,0) ] ) == sorted( [ ( (0,0), puzzle.white_dot ), ( (2,0), puzzle.white_dot ) ] ) )
+        assert( not (0,1) in index )
+
+        # Nothing has been narrowed down yet, so the relations change nothing
+        puzzle.apply_relations()
+        assert( len( puzzle.dirty_cells ) == 0 )
+        assert( puzzle.get_possible( (1,0) ) == set([1,2,3,4]) )
+
+        # Solving one end of the chain runs through the whole row in a single call
+        puzzle.solve_cell( (0,0), 1 )
+        puzzle.propagate()
+        puzzle.apply_relations()
+        assert( list( puzzle.grid[0,:] ) == [1,2,3,4] )
+        assert( len( puzzle.dirty_cells ) == 0 )
 
     def test_solve(self):
         puzzle = Kropki(6)
@@ -331,6 +523,61 @@ class KropkiTest(unittest.TestCase):
         puzzle.solve()
         assert( puzzle.is_solved() )
 
+class FutoshikiTest(unittest.TestCase):
+    def test_propagate_bounds(self):
+        # a < b < c < d < e along the first row and down the first column
+        relations = np.repeat( "", 9*5 ).reshape( (9,5) ).astype(object)
+        for i in range(4):
+            relations[0,i] = "<"
+        for j in range(4):
+            relations[2*j+1,0] = "^"
+
+        puzzle = Futoshiki(5)
+        puzzle.load_relations( relations )
+        puzzle.apply_relations()
+
+        assert( list( puzzle.grid[0,:] ) == [1,2,3,4,5] )
+        assert( list( puzzle.grid[:,0] ) == [1,2,3,4,5] )
+        assert( not puzzle.contradiction )
+
+        order, smaller, larger = puzzle.get_inequality_order()
+        assert( order.index( (0,0) ) < order.index( (4,0) ) )
+        assert( smaller[ (2,0) ] == [ (1,0) ] and larger[ (2,0) ] == [ (3,0) ] )
+
+        # Nothing changed, so the next pass does nothing
+        changes = puzzle.changes
+        puzzle.apply_relations()
+        assert( puzzle.changes == changes )
+
+        # Inequalities going around in a cycle can't all hold
+        relations = np.repeat( "", 5*3 ).reshape( (5,3) ).astype(object)
+        relations[0,0] = "<"
+        relations[1,1] = "^"
+        relations[2,0] = ">"
+        relations[1,0] = "v"
+        puzzle = Futoshiki(3)
+        puzzle.load_relations( relations )
+        puzzle.apply_relations()
+        assert( puzzle.get_inequality_order()[0] is None )
+        assert( puzzle.contradiction )
+
+    def test_search(self):
+        solution = np.array( [ [1,2,3,4], [3,4,1,2], [4,3,2,1], [2,1,4,3] ] )
+        relations = np.repeat( "", 7*4 ).reshape( (7,4) ).astype(object)
+        for i in range(3):
+            relations[0,i] = ">" if solution[0,i] > solution[0,i+1] else "<"
+            relations[2*i+1,0] = "v" if solution[i,0] > solution[i+1,0] else "^"
+
+        puzzle = Futoshiki(4)
+        puzzle.load_relations( relations )
+        puzzle.solve( search=True )
+
+        assert( puzzle.is_solved() )
+        assert( puzzle.is_valid() )
+        assert( np.all( puzzle.grid[0] == solution[0] ) )
+        for i in range(3):
+            assert( ( puzzle.grid[i,0] > puzzle.grid[i+1,0] ) == ( solution[i,0] > solution[i+1,0] ) )
+
 class SudokuTest(unittest.TestCase):
     def test_setup(self):
         puzzle = Sudoku()
@@ -350,6 +597,274 @@ class SudokuTest(unittest.TestCase):
         assert( puzzle.groups["subgrid"][2,1]["coords"] == set( [ (3,6), (4,6), (5,6), (3,7), (4,7), (5,7), (3,8), (4,8), (5,8) ] ) )
         assert( puzzle.groups["subgrid"][2,2]["coords"] == set( [ (6,6), (7,6), (8,6), (6,7), (7,7), (8,7), (6,8), (7,8), (8,8) ] ) )
 
+    def test_group_index(self):
+        puzzle = Sudoku()
+
+        groups = puzzle.get_cell_groups( (4,7) )
+        assert( len(groups) == 3 )
+        assert( puzzle.groups["row"][7] in groups )
+        assert( puzzle.groups["column"][4] in groups )
+        assert( puzzle.groups["subgrid"][2,1] in groups )
+
+        peers = puzzle.get_peers( (4,7) )
+        assert( len(peers) == 20 )
+        assert( not (4,7) in peers )
+        assert( (3,6) in peers and (4,0) in peers and (8,7) in peers )
+        assert( not (2,6) in peers )
+
+        puzzle.solve_cell( (4,7), 5 )
+        for y in range(puzzle.dim):
+            for x in range(puzzle.dim):
+                if (x,y) in peers:
+                    assert( not puzzle.has_possibility( (x,y), 5 ) )
+                elif (x,y) != (4,7):
+                    assert( puzzle.has_possibility( (x,y), 5 ) )
+
+    def test_rectangular_subgrids(self):
+        puzzle = Sudoku(6, subgrid_shape=(2,3))
+
+        assert( puzzle.groups["subgrid"].shape == (3,2) )
+        assert( puzzle.groups["subgrid"][0,1]["coords"] == set( [ (3,0), (4,0), (5,0), (3,1), (4,1), (5,1) ] ) )
+        assert( puzzle.groups["subgrid"][2,0]["coords"] == set( [ (0,4), (1,4), (2,4), (0,5), (1,5), (2,5) ] ) )
+
+        # Loading a grid keeps the subgrid shape
+        puzzle.load_grid( np.zeros( (6,6) ).astype(int) )
+        assert( puzzle.groups["subgrid"].shape == (3,2) )
+
+    def test_exact_cover(self):
+        grid = HARD_GRID.copy()
+
+        puzzle = Sudoku(9)
+        puzzle.load_grid(grid)
+        assert( puzzle.solve_exact_cover() )
+        assert( puzzle.is_solved() )
+        assert( puzzle.is_valid() )
+        assert( not puzzle.contradiction )
+
+        searched = Sudoku(9)
+        searched.load_grid(grid)
+        searched.search()
+        assert( np.all( puzzle.grid == searched.grid ) )
+
+        puzzle = Sudoku(9)
+        puzzle.load_grid(grid)
+        assert( puzzle.count_exact_cover() == 1 )
+
+        assert( Sudoku(4, subgrid_shape=(2,2)).count_exact_cover() == 288 )
+        assert( Sudoku(6, subgrid_shape=(2,3)).count_exact_cover( limit=10 ) == 10 )
+
+        puzzle = Sudoku(6, subgrid_shape=(2,3))
+        assert( puzzle.solve_exact_cover() )
+        assert( puzzle.is_valid() )
+
+        # No solution when two givens clash
+        grid[1,0] = 3
+        puzzle = Sudoku(9)
+        puzzle.load_grid(grid)
+        assert( not puzzle.solve_exact_cover() )
+
+    def test_force_group(self):
+        puzzle = Sudoku(9)
+        subgrid = puzzle.groups["subgrid"][0,0]
+        row = puzzle.groups["row"][0]
+
+        # A subgrid meets three rows and three columns, a row meets every column and three subgrids
+        assert( len( puzzle.get_intersections( subgrid ) ) == 6 )
+        assert( len( puzzle.get_intersections( row ) ) == 12 )
+
+        # 5 can only go in the first row of the top left subgrid
+        for x in range(3):
+            for y in range(1,3):
+                puzzle.remove_possibility( (x,y), 5 )
+
+        puzzle.force_group( subgrid )
+        for x in range(9):
+            assert( puzzle.has_possibility( (x,0), 5 ) == ( x < 3 ) )
+        assert( puzzle.has_possibility( (0,3), 5 ) )
+
+        # And back the other way, 7 can only go in the first subgrid of the row
+        for x in range(3,9):
+            puzzle.remove_possibility( (x,0), 7 )
+
+        puzzle.force_group( row )
+        for x,y in subgrid["coords"]:
+            assert( puzzle.has_possibility( (x,y), 7 ) == ( y == 0 ) )
+
+    def test_strategy_tiers(self):
+        puzzle = Sudoku(4, subgrid_shape=(2,2))
+        puzzle.index_groups()
+        assert( puzzle.get_strategy_tier( "hidden_singles" ) == 0 )
+        assert( puzzle.get_strategy_tier( "force_group" ) == 1 )
+        assert( puzzle.get_strategy_tier( "unlisted" ) == len( puzzle.strategy_tiers ) - 1 )
+
+        # Groups pass from one tier to the next as each one runs
+        assert( len( puzzle.dirty_groups ) == 12 )
+        puzzle.apply_group_functions( 0 )
+        assert( len( puzzle.dirty_groups ) == 0 and len( puzzle.waiting_groups[0] ) == 12 )
+        puzzle.apply_group_functions( 1 )
+        assert( len( puzzle.waiting_groups[0] ) == 0 and len( puzzle.waiting_groups[1] ) == 12 )
+        puzzle.apply_group_functions( 2 )
+        assert( len( puzzle.waiting_groups[1] ) == 0 )
+
+        # Hidden pair of 1 and 2 in the first row, with no hidden singles anywhere:
+        # nothing happens until the hidden subsets run
+        puzzle.enable_strategy_stats()
+        puzzle.set_strategy_tiers( [ [ "hidden_singles" ], [ "N_of_N_counts" ], [ "N_of_N_possibilities", "force_group" ] ] )
+        for x in range(2,4):
+            puzzle.remove_possibilities( (x,0), puzzle.values_to_mask( [1,2] ) )
+        puzzle.reduce()
+
+        assert( puzzle.get_possible( (0,0) ) == set([1,2]) )
+        assert( puzzle.get_possible( (1,0) ) == set([1,2]) )
+        eliminations = {}
+        for row in puzzle.get_strategy_stats():
+            eliminations[ row["strategy"] ] = eliminations.get( row["strategy"], 0 ) + row["eliminations"]
+        assert( eliminations["hidden_singles"] == 0 and eliminations["N_of_N_counts"] > 0 )
+        assert( len( puzzle.dirty_groups ) == 0 and all( len(waiting) == 0 for waiting in puzzle.waiting_groups ) )
+
+    def test_strategy_stats(self):
+        grid = HARD_GRID.copy()
+
+        puzzle = Sudoku(9)
+        puzzle.load_grid(grid)
+        puzzle.reduce()
+        assert( puzzle.get_strategy_stats() == [] )
+
+        puzzle = Sudoku(9)
+        puzzle.enable_strategy_stats()
+        puzzle.load_grid(grid)
+        unsolved = np.count_nonzero( ~puzzle.solved )
+        puzzle.reduce()
+
+        stats = puzzle.get_strategy_stats()
+        assert( set( row["group_type"] for row in stats ) == set( [ "row", "column", "subgrid" ] ) )
+        assert( set( row["strategy"] for row in stats ) == set( [ "hidden_singles", "N_of_N_counts", "N_of_N_possibilities", "force_group" ] ) )
+        assert( all( row["calls"] > 0 and row["time"] >= 0 for row in stats ) )
+        assert( sum( row["solved"] for row in stats ) == unsolved - np.count_nonzero( ~puzzle.solved ) )
+        assert( sum( row["eliminations"] for row in stats ) > 0 )
+        assert( json.loads( puzzle.export_strategy_stats() ) == stats )
+
+    def test_trace(self):
+        grid = HARD_GRID.copy()
+
+        puzzle = Sudoku(9)
+        puzzle.enable_trace( capacity=1 << 20 )
+        puzzle.load_grid( grid )
+        puzzle.search()
+        assert( puzzle.is_solved() )
+
+        trace = puzzle.get_trace()
+        events = trace.get_events()
+        assert( events[0]["strategy"] == "given" and events[0]["kind"] == "placed" )
+        assert( set( [ "hidden_singles", "guess", "backtrack" ] ) <= set( event["strategy"] for event in events ) )
+        assert( max( event["pass"] for event in events ) > 1 )
+
+        # Replaying onto an empty grid gives the same state, after the dead ends the search backed out of too
+        replayed = trace.replay( Sudoku(9) )
+        assert( np.array_equal( replayed.grid, puzzle.grid ) )
+        assert( np.array_equal( replayed.possible, puzzle.possible ) )
+
+        # Or stop anywhere along the way, here right after the givens are placed
+        givens = np.count_nonzero( grid )
+        placed = [ i for i in range(len(events)) if events[i]["kind"] == "placed" ]
+        replayed = trace.replay( Sudoku(9), stop=placed[givens-1] + 1 )
+        assert( np.count_nonzero( replayed.grid ) == givens )
+
+        with tempfile.TemporaryDirectory() as directory:
+            f_name = os.path.join( directory, "trace.bin" )
+            trace.dump( f_name )
+            assert( os.path.getsize( f_name ) < len(trace) * 10 + 1024 )
+
+            loaded = trace.load( f_name )
+            assert( loaded.strategies == trace.strategies )
+            assert( np.array_equal( loaded.get_records(), trace.get_records() ) )
+
+        # A small trace keeps the latest records only
+        small = Sudoku(9)
+        small.enable_trace( capacity=100 )
+        small.load_grid( grid )
+        small.search()
+        assert( len( small.get_trace() ) == 100 )
+        assert( small.get_trace().dropped() == trace.count - 100 )
+        assert( np.array_equal( small.get_trace().get_records(), trace.get_records()[-100:] ) )
+
+        with tempfile.TemporaryDirectory() as directory:
+            f_name = os.path.join( directory, "trace.bin" )
+            small.get_trace().dump( f_name )
+            assert( np.array_equal( small.get_trace().load( f_name ).get_records(), trace.get_records()[-100:] ) )
+
+    def test_search(self):
+        grid = HARD_GRID.copy()
+        puzzle = Sudoku(9)
+        puzzle.load_grid(grid)
+        puzzle.reduce()
+        assert( not puzzle.is_solved() )
+
+        stats = puzzle.search()
+
+        assert( puzzle.is_solved() )
+        assert( puzzle.is_valid() )
+        assert( np.all( puzzle.grid[ grid > 0 ] == grid[ grid > 0 ] ) )
+        assert( stats["nodes"] > 0 )
+        assert( stats["backtracks"] > 0 )
+        assert( puzzle.search_stats is stats )
+        assert( len( puzzle.trail ) == 0 )
+
+        # A puzzle with no solution is left as it was, including the eliminations of the rules it ran first
+        grid[0,1] = 2
+        puzzle = Sudoku(9)
+        puzzle.load_grid(grid)
+        possible = puzzle.possible.copy()
+        puzzle.search()
+        assert( not puzzle.is_solved() )
+        assert( np.all( puzzle.grid == grid ) )
+        assert( np.all( puzzle.possible == possible ) )
+
+        grid[0,1] = 1
+        puzzle = Sudoku(9)
+        puzzle.load_grid(grid)
+        puzzle.search()
+        assert( puzzle.contradiction )
+        assert( not puzzle.is_solved() )
+
+    def test_count_solutions(self):
+        grid = HARD_GRID.copy()
+        puzzle = Sudoku(9)
+        puzzle.load_grid(grid)
+        possible = puzzle.possible.copy()
+
+        assert( puzzle.count_solutions() == 1 )
+        assert( puzzle.count_solutions( limit=None ) == 1 )
+        assert( puzzle.has_unique_solution() )
+
+        # The puzzle is left as it was
+        assert( np.all( puzzle.grid == grid ) )
+        assert( np.all( puzzle.possible == possible ) )
+        puzzle.solve( search=True )
+        assert( puzzle.is_solved() )
+
+        # Taking out a given lets in more solutions, counted up to the limit
+        grid[0,7] = 0
+        puzzle = Sudoku(9)
+        puzzle.load_grid(grid)
+        total = puzzle.count_exact_cover()
+        assert( total > 2 )
+        assert( puzzle.count_solutions() == 2 )
+        assert( puzzle.count_solutions( limit=None ) == total )
+        assert( not puzzle.has_unique_solution() )
+
+        assert( Sudoku( 4, subgrid_shape=(2,2) ).count_solutions( limit=None ) == 288 )
+
+        grid[0,1] = 1
+        puzzle = Sudoku(9)
+        puzzle.load_grid(grid)
+        assert( puzzle.count_solutions() == 0 )
+
+        relations = Kropki(6).read_relations_from_csv( os.path.join( os.path.dirname(__file__), "Book2.csv" ) )
+        puzzle = Kropki(6)
+        puzzle.load_relations( relations )
+        assert( puzzle.count_solutions( limit=None ) == 1 )
+
     def test_solve(self):
         puzzle = Sudoku(9)
         grid = puzzle.read_grid_from_csv("Puzzles\\Book1.csv")
@@ -362,10 +877,11 @@ class KenKenTest(unittest.TestCase):
         group = puzzle.groups["row"][0]
         i = 0
         for x,y in group["coords"]:
-            puzzle.possible[y,x] = set( [ (i+1)%5, (i+2)%5 ] )
-            if 0 in puzzle.possible[y,x]:
-                puzzle.possible[y,x].remove(0)
-                puzzle.possible[y,x].add(1)
+            values = set( [ (i+1)%5, (i+2)%5 ] )
+            if 0 in values:
+                values.remove(0)
+                values.add(1)
+            puzzle.possible[y,x] = puzzle.values_to_mask( values )
             i += 1
         
         results = []
@@ -402,6 +918,58 @@ class KenKenTest(unittest.TestCase):
 
         assert( len(results) == 3*3*3 )
 
+    def test_group_index(self):
+        puzzle = KenKen(4)
+        blob = {}
+        blob["coords"] = [ (0,0), (1,0), (1,1) ]
+        blob["functions"] = []
+        blob["properties"] = { "operation":puzzle.add_all, "total":7 }
+        puzzle.blobs = {"A":blob}
+        puzzle.load_blobs()
+
+        assert( puzzle.groups["arithmetic"][0] in puzzle.get_cell_groups( (1,1) ) )
+
+        # Cells of a cage can share a value if they are in different rows and columns
+        assert( not (0,0) in puzzle.get_peers( (1,1) ) )
+        assert( len( puzzle.get_peers( (1,1) ) ) == 6 )
+        assert( puzzle.get_cage_conflicts( puzzle.groups["arithmetic"][0] ) == [ (0,1), (1,2) ] )
+
+    def test_search(self):
+        puzzle = KenKen(4)
+        cages = { "A" : ( [ (0,0), (1,0) ], puzzle.add_all, 3 ),
+                  "B" : ( [ (2,0), (3,0) ], puzzle.multiply_all, 12 ),
+                  "C" : ( [ (0,1), (0,2) ], puzzle.add_all, 7 ),
+                  "D" : ( [ (1,1), (2,1) ], puzzle.subtract_all, 3 ),
+                  "E" : ( [ (3,1), (3,2) ], puzzle.divide_all, 2 ),
+                  "F" : ( [ (1,2), (2,2) ], puzzle.multiply_all, 6 ),
+                  "G" : ( [ (0,3), (1,3) ], puzzle.subtract_all, 1 ),
+                  "H" : ( [ (2,3), (3,3) ], puzzle.add_all, 7 ) }
+        blobs = {}
+        for key in cages:
+            coords, operation, total = cages[key]
+            blobs[key] = { "coords" : coords, "properties" : { "operation" : operation, "total" : total } }
+        puzzle.load_blobs(blobs)
+
+        puzzle.solve( search=True )
+
+        assert( puzzle.is_solved() )
+        assert( puzzle.is_valid() )
+        for key in cages:
+            coords, operation, total = cages[key]
+            assert( operation( [ puzzle.grid[y,x] for x,y in coords ] ) == total )
+
+        # Without subgrids the cages leave two solutions
+        puzzle = KenKen(4)
+        puzzle.load_blobs(blobs)
+        assert( puzzle.count_solutions( limit=None ) == 2 )
+        assert( not puzzle.has_unique_solution() )
+
+        # Dancing Links only knows the rows and columns, so it refuses the cages instead of ignoring them
+        self.assertRaises( ValueError, puzzle.solve_exact_cover )
+        self.assertRaises( ValueError, puzzle.count_exact_cover )
+        assert( not puzzle.is_solved() )
+        assert( KenKen(4).count_exact_cover() == 576 )
+
     def test_add_all(self):
         puzzle = KenKen(4)
         values = [1,3,4,6]
@@ -441,6 +1009,61 @@ class KenKenTest(unittest.TestCase):
         combos = puzzle.cull_combos( combos, blob["properties"]["operation"], blob["properties"]["total"] )
         assert( len( combos ) == 3*2*1 )
 
+    def test_combination_table(self):
+        puzzle = KenKen(6)
+
+        # Compositions of 6 into three parts
+        table = puzzle.get_combination_table( puzzle.add_all, 6, 3 )
+        assert( len(table) == 10 )
+        assert( np.all( table.sum( axis=1 ) == 6 ) )
+        assert( table is KenKen(6).get_combination_table( puzzle.add_all, 6, 3 ) )
+
+        assert( sorted( map( tuple, puzzle.get_combination_table( puzzle.subtract_all, 4, 2 ) ) ) == [ (5,1), (6,2) ] )
+        assert( sorted( map( tuple, puzzle.get_combination_table( puzzle.divide_all, 3, 2 ) ) ) == [ (3,1), (6,2) ] )
+        assert( len( puzzle.get_combination_table( puzzle.multiply_all, 60, 3 ) ) == 3*2*1 + 3*2*1 )
+        assert( puzzle.get_combination_table( lambda values : sum(values), 6, 3 ) is None )
+
+        # Matches trying every permutation
+        for operation, total in [ ( puzzle.multiply_all, 24 ), ( puzzle.add_all, 9 ), ( puzzle.subtract_all, 1 ) ]:
+            combos = []
+            group = { "coords" : [ (0,0), (1,0), (2,0) ] }
+            puzzle.get_permutations( group, 0, [], combos )
+            combos = [ tuple( combo ) for combo in combos if operation( combo ) == total ]
+            assert( sorted( combos ) == sorted( map( tuple, puzzle.get_combination_table( operation, total, 3 ) ) ) )
+
+    def test_enumerate_cage(self):
+        puzzle = KenKen(6)
+        blob = {}
+        blob["coords"] = [ (0,0), (1,0), (1,1) ]
+        blob["functions"] = []
+        blob["properties"] = { "operation":puzzle.multiply_all, "total":12 }
+        puzzle.load_blobs( {"A":blob} )
+        group = puzzle.groups["arithmetic"][0]
+
+        # (0,0) and (1,1) may repeat, (1,0) shares a row with one and a column with the other
+        combos = list( puzzle.enumerate_cage( group ) )
+        assert( (2,3,2) in combos and (1,6,2) in combos and (3,4,1) in combos )
+        assert( not (2,2,3) in combos and not (1,1,12) in combos )
+        assert( len(combos) == len( set(combos) ) == 13 )
+
+        # Matches trying every permutation of the possibilities
+        puzzle.remove_possibilities( (0,0), puzzle.values_to_mask( [1] ) )
+        permutations = []
+        puzzle.get_permutations( group, 0, [], permutations )
+        permutations = [ tuple(combo) for combo in permutations if combo[0] != combo[1] and combo[1] != combo[2] and puzzle.multiply_all(combo) == 12 ]
+        assert( sorted( puzzle.enumerate_cage( group ) ) == sorted( permutations ) )
+
+        for operation, total in [ ( puzzle.add_all, 9 ), ( puzzle.subtract_all, 1 ), ( puzzle.divide_all, 1 ), ( lambda values : max(values), 4 ) ]:
+            blob["properties"] = { "operation":operation, "total":total }
+            permutations = []
+            puzzle.get_permutations( group, 0, [], permutations )
+            permutations = [ tuple(combo) for combo in permutations if combo[0] != combo[1] and combo[1] != combo[2] and operation(combo) == total ]
+            assert( sorted( puzzle.enumerate_cage( group ) ) == sorted( permutations ) )
+
+        # Nothing fits a cell with no possibilities
+        puzzle.possible[1,1] = 0
+        assert( list( puzzle.enumerate_cage( group ) ) == [] )
+
     def test_cull_possibilities(self):
         puzzle = KenKen(6)
         blob = {}
@@ -453,7 +1076,441 @@ class KenKenTest(unittest.TestCase):
 
         puzzle.cull_possibilities( group )
         for x,y in group["coords"]:
-            assert( puzzle.possible[y,x] == set([1,2,3]) )
+            assert( puzzle.get_possible((x,y)) == set([1,2,3]) )
+
+class KillerSudokuTest(unittest.TestCase):
+    def make_blobs(self, rows):
+        return np.array( [ [ cell.strip() for cell in row.split(",") ] for row in rows ] ).astype(object)
+
+    def test_sum_table(self):
+        puzzle = KillerSudoku(9, subgrid_shape=(3,3))
+        assert( puzzle.get_sum_table( 10, 4 ) == [ puzzle.values_to_mask( [1,2,3,4] ) ] )
+        assert( puzzle.get_sum_table( 17, 2 ) == [ puzzle.values_to_mask( [8,9] ) ] )
+        assert( len( puzzle.get_sum_table( 15, 2 ) ) == 2 )
+        assert( puzzle.get_sum_table( 46, 9 ) == [] )
+        assert( puzzle.get_sum_table( 10, 4 ) is KillerSudoku(9, subgrid_shape=(3,3)).get_sum_table( 10, 4 ) )
+
+    def test_cages(self):
+        puzzle = KillerSudoku(6, subgrid_shape=(2,3))
+        blobs = [ "A:3, A:3, B:11, B:11, C:7, C:7" ] + [ "{}, {}, {}, {}, {}, {}".format( *[ "{}{}".format(i,j) for i in range(6) ] ) for j in range(5) ]
+        puzzle.parse_blobs( self.make_blobs( blobs ) )
+        puzzle.load_blobs()
+        cage = puzzle.groups["arithmetic"][0]
+
+        # Cages are groups of their own, sums keep only the digits of their combinations
+        assert( (1,0) in puzzle.get_peers( (0,0) ) )
+        assert( puzzle.N_of_N_possibilities in cage["functions"] )
+        puzzle.reduce()
+        assert( puzzle.get_possible( (0,0) ) == set([1,2]) )
+        assert( puzzle.get_possible( (2,0) ) == set([5,6]) )
+        assert( puzzle.required_values( cage ) == puzzle.values_to_mask( [1,2] ) )
+
+        # 1 and 2 are locked into the cage, so they leave the rest of the row and subgrid
+        assert( not puzzle.has_possibility( (4,0), 1 ) )
+        assert( not puzzle.has_possibility( (2,1), 2 ) )
+        assert( puzzle.get_possible( (4,0) ) == set([3,4]) )
+
+    def test_reload_cages(self):
+        rest = [ "{}, {}, {}, {}, {}, {}".format( *[ "{}{}".format(i,j) for i in range(6) ] ) for j in range(5) ]
+        first = self.make_blobs( [ "A:3, A:3, B:11, B:11, C:7, C:7" ] + rest )
+        second = self.make_blobs( [ "A:11, A:11, B:3, B:3, C:7, C:7" ] + rest )
+
+        grid = np.zeros( (6,6) ).astype(int)
+        grid[5,0] = 1
+
+        fresh = KillerSudoku(6, subgrid_shape=(2,3))
+        fresh.load_grid( grid )
+        fresh.parse_blobs( second )
+        fresh.load_blobs()
+        fresh.reduce()
+
+        # Loading the grid queues the cages of the first puzzle, which the second then replaces
+        puzzle = KillerSudoku(6, subgrid_shape=(2,3))
+        puzzle.enable_strategy_stats()
+        puzzle.parse_blobs( first )
+        puzzle.load_blobs()
+        puzzle.load_grid( grid )
+        puzzle.blobs = {}
+        puzzle.parse_blobs( second )
+        puzzle.load_blobs()
+        puzzle.reduce()
+
+        assert( np.all( puzzle.possible == fresh.possible ) )
+        assert( all( row["group_type"] in puzzle.groups for row in puzzle.get_strategy_stats() ) )
+
+    def test_45_rule(self):
+        puzzle = KillerSudoku(9, subgrid_shape=(3,3))
+        blobs = [ "A:10, A:10, A:10, A:10, B:26, B:26, B:26, B:26, C:15" ] + [ ", ".join( "{}1".format(i) for i in range(8) ) + ", C:15" ] + \
+                [ ", ".join( "{}{}".format(i,j) for i in range(9) ) for j in range(2,9) ]
+        puzzle.parse_blobs( self.make_blobs( blobs ) )
+        puzzle.load_blobs()
+
+        # Row 0 minus cages A and B leaves an innie of 45 - 36, and the outie of C is then 15 - 9
+        regions = [ ( group["coords"], group["properties"]["total"] ) for group in puzzle.groups["sum"] ]
+        assert( ( [ (8,0) ], 9 ) in regions )
+        assert( ( [ (8,1) ], 6 ) in regions )
+
+        puzzle.reduce()
+        assert( puzzle.grid[0,8] == 9 )
+        assert( puzzle.grid[1,8] == 6 )
+
+    def test_search(self):
+        solution = np.array( [ [1,2,3,4], [3,4,1,2], [2,1,4,3], [4,3,2,1] ] )
+        blobs = [ "A:3, A:3, B:7, B:7", "C:5, D:5, D:5, E:5", "C:5, F:5, F:5, E:5", "G:7, G:7, H:3, H:3" ]
+
+        puzzle = KillerSudoku(4, subgrid_shape=(2,2))
+        puzzle.parse_blobs( self.make_blobs( blobs ) )
+        puzzle.load_blobs()
+        puzzle.solve( search=True )
+
+        assert( puzzle.is_solved() )
+        assert( puzzle.is_valid() )
+        for group in puzzle.groups["arithmetic"]:
+            assert( sum( puzzle.grid[y,x] for x,y in group["coords"] ) == group["properties"]["total"] )
+
+        puzzle = KillerSudoku(4, subgrid_shape=(2,2))
+        puzzle.parse_blobs( self.make_blobs( blobs ) )
+        puzzle.load_blobs()
+        self.assertRaises( ValueError, puzzle.solve_exact_cover )
+
+        # Givens loaded before the cages still count against them
+        puzzle = KillerSudoku(4, subgrid_shape=(2,2))
+        puzzle.load_grid( np.array( [ [1,0,0,0], [0,0,0,0], [0,0,0,0], [0,0,0,0] ] ) )
+        puzzle.parse_blobs( self.make_blobs( blobs ) )
+        puzzle.load_blobs()
+        assert( not puzzle.has_possibility( (1,0), 1 ) )
+        assert( not puzzle.has_possibility( (0,1), 1 ) )
+
+class VectorizedSudokuTest(unittest.TestCase):
+    def test_propagate(self):
+        easy = np.array( pd.read_csv( os.path.join( os.path.dirname(__file__), "Book1.csv" ), header=None, index_col=None ) )
+        hard = HARD_GRID.copy()
+        broken = easy.copy()
+        broken[0,0] = 5
+
+        engine = VectorizedSudoku()
+        engine.load_grids( [ easy, hard, broken, easy ] )
+        engine.propagate()
+
+        assert( list( engine.is_solved() ) == [ True, False, False, True ] )
+        assert( list( engine.contradiction ) == [ False, False, True, False ] )
+        assert( list( engine.stalled() ) == [1] )
+
+        puzzle = Sudoku(9)
+        puzzle.load_grid(easy)
+        puzzle.reduce()
+        assert( np.all( engine.get_grids()[0] == puzzle.grid ) )
+
+        # The stalled puzzle is handed to the scalar solver with its candidates
+        stalled = engine.to_puzzle(1)
+        unsolved = ~stalled.solved
+        assert( np.all( stalled.grid == engine.get_grids()[1] ) )
+        assert( np.all( stalled.possible[unsolved] == engine.get_masks()[1][unsolved] ) )
+
+        grids = engine.solve()
+        assert( engine.is_solved()[1] )
+        puzzle = Sudoku(9)
+        puzzle.load_grid(hard)
+        puzzle.search()
+        assert( np.all( grids[1] == puzzle.grid ) )
+
+        # A stalled puzzle the search can't solve is marked unsolvable, not left stalled
+        unsolvable = hard.copy()
+        unsolvable[0,1] = 2
+        engine = VectorizedSudoku()
+        engine.load_grids( [ unsolvable, hard ] )
+        engine.propagate()
+        assert( list( engine.stalled() ) == [0, 1] )
+        engine.solve()
+        assert( list( engine.contradiction ) == [ True, False ] )
+        assert( list( engine.stalled() ) == [] )
+
+        # Without search a puzzle the rules can't finish stays stalled
+        engine.load_grids( [ hard ] )
+        engine.solve( search=False )
+        assert( list( engine.stalled() ) == [0] )
+
+    def test_rectangular_subgrids(self):
+        engine = VectorizedSudoku( 6, subgrid_shape=(2,3) )
+        engine.load_grids( np.zeros( (2,6,6) ) )
+        grids = engine.solve()
+
+        for grid in grids:
+            puzzle = Sudoku( 6, subgrid_shape=(2,3) )
+            puzzle.load_grid( grid )
+            assert( puzzle.is_solved() and puzzle.is_valid() )
+
+class PuzzleReaderTest(unittest.TestCase):
+    def write_file(self, text):
+        f = tempfile.NamedTemporaryFile( "w", suffix=".txt", delete=False )
+        f.write(text)
+        f.close()
+        self.addCleanup( os.remove, f.name )
+        return f.name
+
+    def test_read_lines(self):
+        easy = "058004000901000800300100000080907003000400706430010000062800030000003572040520008"
+        f_name = self.write_file( "# comment\n" + easy + "\n\n" + easy.replace("0", ".") + ",solution\n" + "1..4" + "...." * 3 + " 4.5\n" )
+        reader = PuzzleReader( f_name )
+
+        assert( not reader.is_record_format() )
+        grids = list( reader )
+        assert( len(grids) == 3 )
+
+        book = np.array( pd.read_csv( os.path.join( os.path.dirname(__file__), "Book1.csv" ), header=None, index_col=None ) )
+        assert( np.all( grids[0] == book ) )
+        assert( np.all( grids[1] == book ) )
+        assert( grids[2].shape == (4,4) )
+        assert( grids[2][0,0] == 1 and grids[2][0,3] == 4 and grids[2][1,0] == 0 )
+
+        f_name = self.write_file( "1234567\n" )
+        self.assertRaises( ValueError, list, PuzzleReader( f_name ) )
+
+        # Extra fields are ignored however many there are, and a header line is skipped
+        solution = "1" * 81
+        f_name = self.write_file( "quizzes,solutions\n" + easy + "," + solution + ",3.2\n" + easy + "," + solution + ",1.5\n" )
+        reader = PuzzleReader( f_name )
+        assert( not reader.is_record_format() )
+        grids = list( reader )
+        assert( len(grids) == 2 )
+        assert( np.all( grids[1] == book ) )
+
+        f_name = self.write_file( "puzzle,solution,rating\n" + easy + "," + solution + ",3.2\n" )
+        assert( not PuzzleReader( f_name ).is_record_format() )
+        assert( len( list( PuzzleReader( f_name ) ) ) == 1 )
+
+    def test_read_records(self):
+        folder = os.path.dirname(__file__)
+        with open( os.path.join( folder, "Book1.csv" ), encoding="utf-8-sig" ) as f:
+            grid = f.read().strip()
+        with open( os.path.join( folder, "Book2.csv" ), encoding="utf-8-sig" ) as f:
+            relations = f.read().strip()
+        blobs = "A:3:+,A,B:12:*,B\nC:7:+,D:3:-,D,E:2:/\nC,F:6:*,F,E\nG:1:-,G,H:7:+,H"
+
+        f_name = self.write_file( grid + "\n\n# Kropki\nrelations\n" + relations + "\n\nblobs\n" + blobs + "\n" )
+        reader = PuzzleReader( f_name )
+        assert( reader.is_record_format() )
+        records = reader.read_records()
+
+        record = next( records )
+        assert( record["dimension"] == 9 )
+        assert( np.all( record["grid"] == Sudoku(9).read_grid_from_csv( os.path.join( folder, "Book1.csv" ) ) ) )
+
+        record = next( records )
+        assert( record["dimension"] == 6 )
+        assert( record["relations"].shape == (11,6) )
+        assert( record["relations"][0,5] == "" )
+        puzzle = Kropki(6)
+        puzzle.load_relations( record["relations"] )
+        puzzle.solve()
+        assert( puzzle.is_solved() )
+
+        record = next( records )
+        assert( record["dimension"] == 4 )
+        assert( record["blobs"][1,3] == "E:2:/" )
+
+        results = list( BatchSolver( "Kropki", workers=1 ).solve_file( self.write_file( "relations\n" + relations + "\n" ) ) )
+        assert( len(results) == 1 and results[0]["solved"] )
+
+class PuzzleArchiveTest(unittest.TestCase):
+    def temp_name(self):
+        f = tempfile.NamedTemporaryFile( suffix=".bin", delete=False )
+        f.close()
+        self.addCleanup( os.remove, f.name )
+        return f.name
+
+    def test_round_trip(self):
+        folder = os.path.dirname(__file__)
+        grid = Sudoku(9).read_grid_from_csv( os.path.join( folder, "Book1.csv" ) )
+
+        # Part way through a solve, so the candidates differ from what load_grid alone leaves
+        puzzles = []
+        for i in range(3):
+            puzzle = Sudoku(9)
+            puzzle.load_grid( grid )
+            if i > 0:
+                puzzle.apply_strategy( puzzle.N_of_N_counts, puzzle.groups["row"][i] )
+            puzzles.append( puzzle )
+
+        f_name = self.temp_name()
+        assert( PuzzleArchive.write( f_name, puzzles ) == 3 )
+        archive = PuzzleArchive( f_name )
+        assert( len(archive) == 3 and archive.puzzle_type == "Sudoku" and archive.subgrid_shape == (3,3) )
+        assert( os.path.getsize( f_name ) == PuzzleArchive.HEADER_SIZE + 3 * archive.record_dtype.itemsize )
+
+        for i in [ 2, 0, 1 ]:
+            assert( np.all( archive[i]["grid"] == puzzles[i].grid ) )
+            loaded = archive.load_puzzle( i )
+            assert( np.all( loaded.grid == puzzles[i].grid ) )
+            assert( np.all( loaded.possible == puzzles[i].possible ) )
+
+        # Relations
+        relations = Kropki(6).read_relations_from_csv( os.path.join( folder, "Book2.csv" ) )
+        puzzle = Kropki(6)
+        puzzle.load_relations( relations )
+        PuzzleArchive.write( f_name, [ puzzle ] )
+        archive = PuzzleArchive( f_name )
+        assert( archive.fields == [ "grid", "possible", "relations" ] )
+        spec = archive.get_spec(0)
+        assert( np.all( spec["relations"][:len(relations), :relations.shape[1]] == np.char.strip( relations.astype(str) ) ) )
+        loaded = archive.load_puzzle(0)
+        assert( isinstance( loaded, Kropki ) and len( loaded.relations ) == len( puzzle.relations ) )
+        loaded.solve()
+        assert( loaded.is_solved() and loaded.is_valid() )
+
+        # Futoshiki also takes "V" for "v"
+        solution = np.array( [ [1,2,3,4], [3,4,1,2], [4,3,2,1], [2,1,4,3] ] )
+        relations = np.repeat( "", 7*4 ).reshape( (7,4) ).astype(object)
+        for i in range(3):
+            relations[0,i] = ">" if solution[0,i] > solution[0,i+1] else "<"
+            relations[2*i+1,0] = "V" if solution[i,0] > solution[i+1,0] else "^"
+        puzzle = Futoshiki(4)
+        puzzle.load_relations( relations )
+        PuzzleArchive.write( f_name, [ puzzle ] )
+        archive = PuzzleArchive( f_name )
+        assert( np.all( archive.get_spec(0)["relations"][ relations == "V" ] == "v" ) )
+        loaded = archive.load_puzzle(0)
+        loaded.solve( search=True )
+        assert( loaded.is_solved() and loaded.is_valid() )
+        assert( np.all( loaded.grid[0] == solution[0] ) )
+
+        # Cages, the operations come back as the same functions
+        blobs = np.array( [ row.split(",") for row in "A:3:+,A,B:12:*,B\nC:7:+,D:3:-,D,E:2:/\nC,F:6:*,F,E\nG:1:-,G,H:7:+,H".split("\n") ] ).astype(object)
+        puzzle = KenKen(4)
+        puzzle.parse_blobs( blobs )
+        puzzle.load_blobs()
+        PuzzleArchive.write( f_name, [ puzzle ] )
+        loaded = PuzzleArchive( f_name ).load_puzzle(0)
+        assert( [ blob["coords"] for blob in loaded.blobs.values() ] == [ blob["coords"] for blob in puzzle.blobs.values() ] )
+        assert( [ blob["properties"]["total"] for blob in loaded.blobs.values() ] == [ blob["properties"]["total"] for blob in puzzle.blobs.values() ] )
+        assert( [ blob["properties"]["operation"].__name__ for blob in loaded.blobs.values() ] == [ blob["properties"]["operation"].__name__ for blob in puzzle.blobs.values() ] )
+        loaded.solve( search=True )
+        assert( loaded.is_solved() and loaded.is_valid() )
+
+        # One puzzle reused for every record loads each of them as a new one would
+        cage = [ (2,1), (3,1), (3,2) ]
+        first = np.array( [ [ "X:6" if (x,y) in cage else "{}{}".format(x,y) for x in range(6) ] for y in range(6) ] ).astype(object)
+        second = np.array( [ [ "{}{}".format(x,y) for x in range(6) ] for y in range(6) ] ).astype(object)
+        grid = np.zeros( (6,6) ).astype(int)
+        grid[1,2] = 1
+
+        puzzles = []
+        for blobs, givens in [ ( first, np.zeros( (6,6) ).astype(int) ), ( second, grid ) ]:
+            puzzle = KillerSudoku(6, subgrid_shape=(2,3))
+            puzzle.load_grid( givens )
+            puzzle.parse_blobs( blobs )
+            puzzle.load_blobs()
+            puzzles.append( puzzle )
+        PuzzleArchive.write( f_name, puzzles )
+        archive = PuzzleArchive( f_name )
+
+        reused = archive.load_puzzle(0)
+        assert( len( reused.groups["arithmetic"] ) == 34 )
+        archive.load_puzzle( 1, reused )
+        fresh = archive.load_puzzle(1)
+        assert( reused.has_possibility( (3,2), 1 ) )
+        assert( np.all( reused.possible == fresh.possible ) )
+        assert( np.all( reused.possible == puzzles[1].possible ) )
+
+        # An empty archive is still an archive
+        assert( PuzzleArchive.write( f_name, [] ) == 0 )
+        archive = PuzzleArchive( f_name )
+        assert( len(archive) == 0 and list(archive) == [] )
+
+        # Every record of an archive is the same type and size
+        self.assertRaises( ValueError, PuzzleArchive.write, f_name, [ Sudoku(9), Sudoku(4, subgrid_shape=(2,2)) ] )
+        with open( f_name, "wb" ) as f:
+            f.write( b"not an archive" )
+        self.assertRaises( ValueError, PuzzleArchive, f_name )
+
+# Raises on grids starting with 8 and kills its worker on grids starting with 9
+class FailingSudoku(Sudoku):
+    def load_grid(self, grid):
+        if grid[0,0] == 8:
+            raise RuntimeError( "bad puzzle" )
+        if grid[0,0] == 9:
+            os._exit(1)
+        super().load_grid( grid )
+
+class BatchSolverTest(unittest.TestCase):
+    def test_solve(self):
+        grid = HARD_GRID.copy()
+        empty = np.zeros( (9,9) ).astype(int)
+        puzzles = [ grid, empty, np.zeros( (9,8) ), grid, empty ]
+
+        results = list( BatchSolver( "Sudoku", workers=2, chunk_size=2 ).solve( puzzles ) )
+
+        assert( [ result["index"] for result in results ] == [0,1,2,3,4] )
+        assert( [ result["solved"] for result in results ] == [ True, True, False, True, True ] )
+        assert( results[2]["error"] is not None )
+        assert( results[0]["error"] is None )
+        assert( np.all( results[0]["grid"] == results[3]["grid"] ) )
+        assert( np.all( results[0]["grid"][ grid > 0 ] == grid[ grid > 0 ] ) )
+
+    def test_solve_relations(self):
+        relations = Kropki(6).read_relations_from_csv( os.path.join( os.path.dirname(__file__), "Book2.csv" ) )
+        puzzles = [ { "dimension" : 6, "relations" : relations } for i in range(3) ]
+
+        for result in BatchSolver( "Kropki", workers=1, search=False ).solve( puzzles ):
+            assert( result["solved"] )
+
+    def test_count_solutions(self):
+        grid = HARD_GRID.copy()
+        empty = np.zeros( (9,9) ).astype(int)
+
+        results = list( BatchSolver( "Sudoku", workers=1, count_limit=2 ).solve( [ grid, empty ] ) )
+        assert( [ result["solutions"] for result in results ] == [ 1, 2 ] )
+        assert( all( result["solved"] for result in results ) )
+
+        results = list( BatchSolver( "Sudoku", workers=1 ).solve( [ grid ] ) )
+        assert( results[0]["solutions"] is None )
+
+    def get_book(self):
+        return Sudoku(9).read_grid_from_csv( os.path.join( os.path.dirname(__file__), "Book1.csv" ) )
+
+    # The failing puzzles only exist in this process, so the workers have to be forked from it
+    def add_failing_type(self):
+        if multiprocessing.get_start_method() != "fork":
+            self.skipTest( "workers aren't forked" )
+        PUZZLE_TYPES["Failing"] = FailingSudoku
+        self.addCleanup( PUZZLE_TYPES.pop, "Failing" )
+
+    def test_worker_error(self):
+        self.add_failing_type()
+        bad = self.get_book()
+        bad[0,0] = 8
+        puzzles = [ self.get_book(), bad, self.get_book(), self.get_book() ]
+
+        results = list( BatchSolver( "Failing", workers=2, chunk_size=1 ).solve( puzzles ) )
+        assert( [ result["index"] for result in results ] == [0,1,2,3] )
+        assert( results[1]["error"] == "RuntimeError: bad puzzle" )
+        assert( [ result["solved"] for result in results ] == [ True, False, True, True ] )
+
+    def test_dead_worker(self):
+        self.add_failing_type()
+        dead = self.get_book()
+        dead[0,0] = 9
+        puzzles = [ self.get_book() for i in range(12) ]
+        puzzles[3] = dead
+
+        # The chunks in flight with the dead worker are lost, the ones after it go to a new pool
+        results = list( BatchSolver( "Failing", workers=2, chunk_size=1 ).solve( puzzles ) )
+        assert( [ result["index"] for result in results ] == list( range(12) ) )
+        assert( results[3]["error"].startswith( "BrokenProcessPool" ) )
+        assert( all( result["solved"] for result in results[-3:] ) )
+
+    def test_malformed_line(self):
+        easy = "058004000901000800300100000080907003000400706430010000062800030000003572040520008"
+        f = tempfile.NamedTemporaryFile( "w", suffix=".txt", delete=False )
+        f.write( "\n".join( [ easy, easy, easy[:80], easy, easy ] ) + "\n" )
+        f.close()
+        self.addCleanup( os.remove, f.name )
+
+        results = list( BatchSolver( "Sudoku", workers=1 ).solve_file( f.name ) )
+        assert( len(results) == 5 )
+        assert( results[2]["error"] == "ValueError: Line 3: 80 cells is not a square grid" )
+        assert( [ result["solved"] for result in results ] == [ True, True, False, True, True ] )
+        self.assertRaises( ValueError, list, PuzzleReader( f.name ) )
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file